@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.checks import Error, register
+from django.urls import get_resolver
+
+from .eager import invalid_lookup_paths, invalid_prefetch_paths, invalid_select_paths, queryset_paths, serializer_plan
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+@register("api")
+def check_eager_loading(app_configs, **kwargs):
+    """
+    Au démarrage (check / runserver / migrate) : calcule le plan de chargement de chaque
+    viewset DefaultsMixin et vérifie les select_related / prefetch_related écrits à la main
+    ainsi que les search_fields.
+    Un chemin invalide ne doit pas attendre la première requête pour lever FieldError.
+    """
+    if not getattr(settings, "ROOT_URLCONF", None):
+        return []
+    get_resolver().url_patterns  # importe toutes les vues routées
+
+    from .views import DefaultsMixin
+
+    errors = []
+    for view in _subclasses(DefaultsMixin):
+        queryset = getattr(view, "queryset", None)
+        serializer_class = getattr(view, "serializer_class", None)
+        if queryset is None:
+            continue
+        label = f"{view.__module__}.{view.__qualname__}"
+        model = queryset.model
+        select, prefetch = queryset_paths(queryset)
+        for path in invalid_select_paths(model, select):
+            errors.append(Error(
+                f"select_related('{path}') invalide sur {model.__name__}.",
+                hint="Chaque maillon doit être une ForeignKey / OneToOne.",
+                obj=label,
+                id="api.E001",
+            ))
+        for path in invalid_prefetch_paths(model, prefetch):
+            errors.append(Error(
+                f"prefetch_related('{path}') invalide sur {model.__name__}.",
+                obj=label,
+                id="api.E002",
+            ))
+        for path in invalid_lookup_paths(model, getattr(view, "search_fields", ())):
+            errors.append(Error(
+                f"search_fields '{path}' invalide sur {model.__name__}.",
+                obj=label,
+                id="api.E004",
+            ))
+        if serializer_class is None:
+            continue
+        try:
+            serializer_plan(serializer_class)
+        except Exception as exc:  # noqa: BLE001 - remonté tel quel dans le rapport de check
+            errors.append(Error(
+                f"Plan de chargement impossible pour {serializer_class.__name__}: {exc}",
+                obj=label,
+                id="api.E003",
+            ))
+    return errors
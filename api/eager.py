@@ -0,0 +1,243 @@
+"""
+Plan de chargement (select_related / prefetch_related) déduit de la forme du serializer.
+
+Chaque champ rendu est traduit en chemins ORM :
+  - PrimaryKeyRelatedField          -> rien (la valeur vient de la colonne <fk>_id)
+  - autre RelatedField (slug, str)  -> select_related (FK/O2O) ou prefetch_related
+  - ManyRelatedField / many=True    -> prefetch_related
+  - serializer imbriqué             -> select/prefetch + plan du serializer enfant, préfixé
+  - source pointée ("patient.mpi")  -> un maillon par relation traversée
+Le plan est indexé par le premier maillon de la source : seules les entrées des champs
+effectivement demandés (?fields= / ?exclude= / ?expand=) sont appliquées.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+LOOKUP_SEP = "__"
+
+
+def _relation(model, name):
+    """
+    (champ ORM, modèle cible) pour l'attribut `name` de `model` (FK/O2O/M2M ou accessor
+    inverse, ex: "lines", "encounter_set"), ou (None, None) si ce n'est pas une relation.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = next((r for r in model._meta.related_objects if r.get_accessor_name() == name), None)
+    if field is None or not field.is_relation:
+        return None, None
+    return field, field.related_model
+
+
+def _is_single(field):
+    return bool(field.many_to_one or field.one_to_one)
+
+
+class EagerPlan:
+    """Chemins select_related / prefetch_related, indexés par premier maillon de source."""
+
+    def __init__(self):
+        self.entries = {}  # source -> (set(select), set(prefetch))
+
+    def add(self, source, select=(), prefetch=()):
+        sel, pre = self.entries.setdefault(source, (set(), set()))
+        sel.update(select)
+        pre.update(prefetch)
+
+    def paths(self, sources=None):
+        select, prefetch = set(), set()
+        for source, (sel, pre) in self.entries.items():
+            if sources is None or source in sources:
+                select |= sel
+                prefetch |= pre
+        return sorted(select), sorted(prefetch)
+
+    def apply(self, queryset, sources=None):
+        select, prefetch = self.paths(sources)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+def _nested_paths(serializer, prefix, via_prefetch):
+    """Chemins du serializer enfant, préfixés ; sous un prefetch tout devient prefetch."""
+    plan = serializer_plan(type(serializer))
+    select, prefetch = plan.paths()
+    select = [f"{prefix}{LOOKUP_SEP}{p}" for p in select]
+    prefetch = [f"{prefix}{LOOKUP_SEP}{p}" for p in prefetch]
+    if via_prefetch:
+        return [], select + prefetch
+    return select, prefetch
+
+
+def _walk_source(model, attrs):
+    """
+    Chemin ORM le long d'une source pointée : ("encounter", "patient", "mpi") ->
+    (select=["encounter__patient"], prefetch=[]). S'arrête au premier attribut non relationnel.
+    `single` est faux dès qu'un maillon est multivalué (reverse FK, M2M).
+    """
+    hops, single = [], True
+    for attr in attrs:
+        field, target = _relation(model, attr)
+        if field is None:
+            break
+        hops.append(attr)
+        single = single and _is_single(field)
+        model = target
+    return hops, single
+
+
+def _field_paths(model, field):
+    """(select, prefetch) nécessaires pour rendre `field` sans requête supplémentaire."""
+    if field.source == "*" or isinstance(field, serializers.SerializerMethodField):
+        return [], []
+    attrs = field.source_attrs
+
+    if isinstance(field, serializers.ListSerializer):
+        hops, _ = _walk_source(model, attrs)
+        if not hops:
+            return [], []
+        path = LOOKUP_SEP.join(hops)
+        child = field.child
+        if isinstance(child, serializers.ModelSerializer):
+            sel, pre = _nested_paths(child, path, via_prefetch=True)
+            return sel, [path, *pre]
+        return [], [path]
+
+    if isinstance(field, serializers.ModelSerializer):
+        hops, single = _walk_source(model, attrs)
+        if not hops:
+            return [], []
+        path = LOOKUP_SEP.join(hops)
+        sel, pre = _nested_paths(field, path, via_prefetch=not single)
+        return ([path, *sel], pre) if single else (sel, [path, *pre])
+
+    if isinstance(field, serializers.ManyRelatedField):
+        hops, _ = _walk_source(model, attrs)
+        return ([], [LOOKUP_SEP.join(hops)]) if hops else ([], [])
+
+    hops, single = _walk_source(model, attrs)
+    pk_only = isinstance(field, serializers.PrimaryKeyRelatedField) and len(hops) == len(attrs) and single
+    if pk_only:
+        hops = hops[:-1]  # <fk>_id suffit pour le dernier maillon
+    if not hops:
+        return [], []
+    path = LOOKUP_SEP.join(hops)
+    return ([path], []) if single else ([], [path])
+
+
+@lru_cache(maxsize=None)
+def serializer_plan(serializer_class):
+    """Plan de chargement de `serializer_class` (champs déclarés + Meta.expandable_fields)."""
+    plan = EagerPlan()
+    meta = getattr(serializer_class, "Meta", None)
+    model = getattr(meta, "model", None)
+    if model is None:
+        return plan
+
+    # Sans requête : champs par défaut (non expansés)
+    fields = dict(serializer_class().fields)
+    for name, (nested_class, kwargs) in getattr(meta, "expandable_fields", {}).items():
+        nested = nested_class(**kwargs)
+        nested.bind(name, serializer_class())
+        fields[name] = nested
+
+    for field in fields.values():
+        if field.write_only:
+            continue
+        select, prefetch = _field_paths(model, field)
+        plan.add(field.source.split(".")[0], select, prefetch)
+    return plan
+
+
+# --------- Validation des chemins (system check) ---------
+def invalid_select_paths(model, paths):
+    """Chemins select_related invalides : chaque maillon doit être une FK/O2O."""
+    errors = []
+    for path in paths:
+        current = model
+        for attr in path.split(LOOKUP_SEP):
+            field, target = _relation(current, attr)
+            if field is None or not _is_single(field):
+                errors.append(path)
+                break
+            current = target
+    return errors
+
+
+def invalid_prefetch_paths(model, paths):
+    """Chemins prefetch_related invalides : chaque maillon doit être une relation (directe ou inverse)."""
+    errors = []
+    for lookup in paths:
+        path = getattr(lookup, "prefetch_through", lookup)
+        current = model
+        for attr in path.split(LOOKUP_SEP):
+            field, target = _relation(current, attr)
+            if field is None:
+                errors.append(path)
+                break
+            current = target
+    return errors
+
+
+def invalid_lookup_paths(model, paths):
+    """Chemins de recherche (search_fields) invalides : relations puis un champ non relationnel."""
+    errors = []
+    for raw in paths:
+        path = raw.lstrip("^=@$")
+        *hops, last = path.split(LOOKUP_SEP)
+        current = model
+        for attr in hops:
+            field, current = _relation(current, attr)
+            if field is None:
+                break
+        else:
+            try:
+                if not current._meta.get_field(last).is_relation:  # icontains sur une FK -> FieldError
+                    continue
+            except FieldDoesNotExist:
+                pass
+        errors.append(raw)
+    return errors
+
+
+def _select_paths(tree, prefix=""):
+    """{'encounter': {'facility': {}}, 'payer': {}} -> ['encounter__facility', 'payer']"""
+    paths = []
+    for name, sub in tree.items():
+        path = f"{prefix}{name}"
+        paths.extend(_select_paths(sub, f"{path}{LOOKUP_SEP}") if sub else [path])
+    return paths
+
+
+def queryset_paths(queryset):
+    """(select_related, prefetch_related) déclarés à la main sur un queryset."""
+    select = queryset.query.select_related
+    select = _select_paths(select) if isinstance(select, dict) else []
+    return select, list(queryset._prefetch_related_lookups)
+
+
+def prune_related(queryset, sources):
+    """
+    Retire les select_related / prefetch_related dont le premier maillon n'est pas rendu
+    par le serializer (?fields= / ?exclude= / ?expand= non demandé) : pas de JOIN ni de
+    requête de prefetch pour des données qui ne partent pas dans la réponse.
+    """
+    select, prefetch = queryset_paths(queryset)
+    if isinstance(queryset.query.select_related, dict):
+        keep = [p for p in select if p.split(LOOKUP_SEP)[0] in sources]
+        queryset = queryset.select_related(None)
+        if keep:
+            queryset = queryset.select_related(*keep)
+
+    if prefetch:
+        keep = [lk for lk in prefetch if getattr(lk, "prefetch_to", lk).split(LOOKUP_SEP)[0] in sources]
+        queryset = queryset.prefetch_related(None)
+        if keep:
+            queryset = queryset.prefetch_related(*keep)
+    return queryset
@@ -1,4 +1,7 @@
 import django_filters as df
+from rest_framework.filters import SearchFilter
+
+from hospital.search import search_patients
 from hospital.models import Encounter, Appointment, Observation, Invoice, VisitType
 
 
@@ -42,4 +45,16 @@ class InvoiceFilter(df.FilterSet):
     encounter = df.UUIDFilter(field_name="encounter__id")
     class Meta:
         model = Invoice
-        fields = ["status", "encounter"]
\ No newline at end of file
+        fields = ["status", "encounter"]
+
+class PatientTrigramSearchFilter(SearchFilter):
+    """
+    ?search= sur les patients : moteur trigramme (hospital.search) au lieu des
+    UPPER(col) LIKE '%x%' de SearchFilter, qui parcourent toute la table.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, "").strip()
+        if not term:
+            return queryset
+        return search_patients(queryset.order_by(), term)
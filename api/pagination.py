@@ -0,0 +1,166 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, PageNumberPagination
+from rest_framework.response import Response
+
+from core.pagination import EstimatedCountPaginator
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    return value
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    Pagination par numéro de page dont le total vient du planificateur au-delà de
+    COUNT_ESTIMATE_THRESHOLD (COUNT(*) exact en dessous).
+    La réponse indique si le total est exact : "count_is_estimate".
+    """
+    django_paginator_class = EstimatedCountPaginator
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.page.paginator.count,
+            "count_is_estimate": self.page.paginator.count_is_estimate,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count_is_estimate"] = {"type": "boolean", "example": False}
+        return schema
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pagination par clé (keyset / "seek") sur un tuple de colonnes.
+    - Le curseur encode les valeurs de TOUTES les colonnes de `ordering` de la dernière
+      ligne servie ; la page suivante est un `WHERE (col1, col2, ...) < (v1, v2, ...)`
+      (déplié en Q), jamais un OFFSET ni un COUNT(*) : la page 5000 coûte la page 1.
+    - `ordering` doit se terminer par une colonne unique (id) pour un départage stable.
+    - Les NULL suivent l'ordre natif Postgres (DESC -> NULLS FIRST, ASC -> NULLS LAST),
+      ce qui correspond au parcours d'un index btree dans un sens ou dans l'autre.
+    - L'ordre est fixe (celui de la pagination) : ?ordering= est ignoré ici.
+    - Les filtres (DjangoFilterBackend, SearchFilter) s'appliquent avant, inchangés.
+    """
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    # --- construction du prédicat "strictement après" ---
+    def _columns(self, queryset, reverse):
+        cols = []
+        for item in self.ordering:
+            name = item.lstrip("-")
+            desc = item.startswith("-") != reverse
+            cols.append((queryset.model._meta.get_field(name), desc))
+        return cols
+
+    @staticmethod
+    def _equal(field, value):
+        return Q(**{f"{field.name}__isnull": True}) if value is None else Q(**{field.name: value})
+
+    @staticmethod
+    def _after(field, value, desc):
+        if desc:  # NULLS FIRST
+            if value is None:
+                return Q(**{f"{field.name}__isnull": False})
+            return Q(**{f"{field.name}__lt": value})
+        # ASC, NULLS LAST
+        if value is None:
+            return Q(pk__in=[])
+        q = Q(**{f"{field.name}__gt": value})
+        return q | Q(**{f"{field.name}__isnull": True}) if field.null else q
+
+    def _seek(self, cols, position):
+        predicate = Q(pk__in=[])
+        prefix = Q()
+        for (field, desc), value in zip(cols, position):
+            predicate |= prefix & self._after(field, value, desc)
+            prefix &= self._equal(field, value)
+
+        # Borne redondante sur la 1re colonne : devient une condition d'index (range scan)
+        field, desc = cols[0]
+        lead = position[0]
+        if lead is not None and (desc or not field.null):
+            predicate &= Q(**{f"{field.name}__{'lte' if desc else 'gte'}": lead})
+        return predicate
+
+    # --- API DRF ---
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        cols = self._columns(queryset, reverse)
+        queryset = queryset.order_by(*[f"-{f.name}" if desc else f.name for f, desc in cols])
+        if self.cursor:
+            try:
+                position = json.loads(self.cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(position, list) or len(position) != len(cols):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._seek(cols, position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = self.cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def _position(self, instance):
+        values = []
+        for item in self.ordering:
+            field = instance._meta.get_field(item.lstrip("-"))
+            values.append(_jsonable(getattr(instance, field.attname)))
+        return json.dumps(values)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+
+# Index composites existants ; le tenant_key est fixé par la policy RLS (égalité),
+# le parcours se fait donc sur la 2e colonne de l'index.
+class EncounterKeysetPagination(KeysetPagination):
+    ordering = ("-start_at", "-id")  # index (tenant_key, start_at)
+
+
+class ObservationKeysetPagination(KeysetPagination):
+    ordering = ("-observed_at", "-id")  # index (tenant_key, observed_at, loinc_code)
+
+
+class InvoiceKeysetPagination(KeysetPagination):
+    ordering = ("-issued_at", "-id")  # index (tenant_key, issued_at, status)
@@ -1,12 +1,70 @@
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
 from hospital.models import (
     UserProfile, Pole, Region, District, Commune, Facility, Department,
     Practitioner, Bed, Patient, PatientResidence, Kinship, Encounter,
     BedOccupancy, Procedure, DiagnosticReport, Observation, Payer,
-    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC, VisitType
+    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC, VisitType,
+    DuplicateCandidate, PractitionerSchedule, PractitionerAbsence
 )
 
 # --------- Mixins ---------
+def _csv_param(request, name):
+    raw = request.query_params.get(name, "") if request is not None else ""
+    return {x.strip() for x in raw.split(",") if x.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Champs à la demande, pilotés par la query string (serializer racine uniquement) :
+      ?fields=id,mpi        -> seulement ces champs
+      ?exclude=cmu,cni      -> tous sauf ceux-là
+      ?expand=residences    -> ajoute les relations imbriquées déclarées dans
+                               Meta.expandable_fields = {"nom": (SerializerClass, {kwargs})}
+    Les relations imbriquées ne sont plus sérialisées (ni chargées) par défaut.
+    """
+
+    def _is_root(self):
+        parent = self.parent
+        if parent is None:
+            return True
+        return isinstance(parent, serializers.ListSerializer) and parent.parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        request = self.context.get("request")
+        if not self._is_root() or request is None:
+            return fields
+
+        only, exclude = _csv_param(request, "fields"), _csv_param(request, "exclude")
+        expand = _csv_param(request, "expand") | (only & expandable.keys())
+        for name in expand & expandable.keys():
+            serializer_class, kwargs = expandable[name]
+            fields[name] = serializer_class(**kwargs)
+        if only:
+            fields = {k: v for k, v in fields.items() if k in only}
+        for name in exclude:
+            fields.pop(name, None)
+        return fields
+
+    @classmethod
+    def requested_sources(cls, request):
+        """
+        Premiers maillons des `source` des champs réellement rendus pour cette requête
+        (ex: {"id", "patient", "visit_type", ...}) : sert à élaguer select/prefetch_related.
+        """
+        serializer = cls(context={"request": request})
+        return {f.source.split(".")[0] for f in serializer.fields.values() if f.source != "*"}
+
+
+class DynamicModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+
 class TenantAwareMixin:
     """
     Vérifie la cohérence des FKs pointant vers un facility du même tenant (si applicable).
@@ -27,86 +85,122 @@ class TenantAwareMixin:
         # tenant_key du payload (si présent) — normalement non éditable
         tenant_key = attrs.get("tenant_key") or getattr(self.instance, "tenant_key", None)
 
-        if facility and tenant_key and tenant_key != facility.root().code:
+        if facility and tenant_key and tenant_key != facility.root_code:
             raise serializers.ValidationError("tenant_key inconsistent with facility root code.")
 
         return super().validate(attrs)
 
 
 # --------- Basic / Reference Serializers ---------
-class PoleSerializer(serializers.ModelSerializer):
+class PoleSerializer(DynamicModelSerializer):
     class Meta:
         model = Pole
         fields = "__all__"
 
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(DynamicModelSerializer):
     class Meta:
         model = Region
         fields = "__all__"
 
-class DistrictSerializer(serializers.ModelSerializer):
+class DistrictSerializer(DynamicModelSerializer):
     class Meta:
         model = District
         fields = "__all__"
 
-class CommuneSerializer(serializers.ModelSerializer):
+class CommuneSerializer(DynamicModelSerializer):
     class Meta:
         model = Commune
         fields = "__all__"
 
-class FacilitySerializer(serializers.ModelSerializer):
+class FacilitySerializer(DynamicModelSerializer):
     class Meta:
         model = Facility
         fields = "__all__"
 
-class DepartmentSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class DepartmentSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Department
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class PractitionerSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class PractitionerSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Practitioner
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class BedSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class BedSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Bed
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class PayerSerializer(serializers.ModelSerializer):
+class PayerSerializer(DynamicModelSerializer):
     class Meta:
         model = Payer
         fields = "__all__"
 
 # --------- Patient Domain ---------
-class PatientResidenceSerializer(serializers.ModelSerializer):
+class PatientResidenceSerializer(DynamicModelSerializer):
     class Meta:
         model = PatientResidence
         fields = "__all__"
 
-class PatientSerializer(serializers.ModelSerializer):
-    residences = PatientResidenceSerializer(many=True, read_only=True)
-
+class PatientSerializer(DynamicModelSerializer):
     class Meta:
         model = Patient
         fields = "__all__"
+        expandable_fields = {"residences": (PatientResidenceSerializer, {"many": True, "read_only": True})}
+
+class PatientSearchQuerySerializer(serializers.Serializer):
+    """Paramètres de /patients/search/."""
+    q = serializers.CharField(min_length=2, max_length=120, trim_whitespace=True)
+    birth_year = serializers.IntegerField(required=False, min_value=1900, max_value=2100)
+    sex = serializers.ChoiceField(choices=["M", "F", "O"], required=False)
+    commune = serializers.UUIDField(required=False)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=100)
+
+class RelativesQuerySerializer(serializers.Serializer):
+    """Paramètres de /patients/{id}/relatives/."""
+    depth = serializers.IntegerField(required=False, default=2, min_value=1, max_value=6)
+    relations = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_relations(self, value):
+        relations = [r.strip().upper() for r in value.split(",") if r.strip()]
+        unknown = set(relations) - set(Kinship.Relation.values)
+        if unknown:
+            raise serializers.ValidationError(f"Relations inconnues : {', '.join(sorted(unknown))}")
+        return relations
+
+class ResidenceAsOfItemSerializer(serializers.Serializer):
+    patient = serializers.UUIDField()
+    date = serializers.DateField()
+
+class ResidenceAsOfQuerySerializer(serializers.Serializer):
+    """Corps de POST /patient-residences/resolve/ : couples (patient, date)."""
+    items = ResidenceAsOfItemSerializer(many=True, allow_empty=False, max_length=10000)
+
+class PatientSearchSerializer(PatientSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+class DuplicateCandidateSerializer(DynamicModelSerializer):
+    class Meta:
+        model = DuplicateCandidate
+        fields = "__all__"
+        read_only_fields = ("patient_a", "patient_b", "score", "components")
 
-class KinshipSerializer(serializers.ModelSerializer):
+class KinshipSerializer(DynamicModelSerializer):
     class Meta:
         model = Kinship
         fields = "__all__"
 
 # --------- Clinical ---------
-class VisitTypeSerializer(serializers.ModelSerializer):
+class VisitTypeSerializer(DynamicModelSerializer):
     class Meta:
         model = VisitType
         fields = "__all__"
 
-class EncounterSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class EncounterSerializer(DynamicModelSerializer, TenantAwareMixin):
     visit_type_code = serializers.SlugRelatedField(
         source="visit_type",
         slug_field="code",
@@ -120,80 +214,200 @@ class EncounterSerializer(serializers.ModelSerializer, TenantAwareMixin):
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class BedOccupancySerializer(serializers.ModelSerializer, TenantAwareMixin):
+class BedCensusQuerySerializer(serializers.Serializer):
+    """Paramètres de /beds/census/."""
+    facility = serializers.UUIDField()
+
+class BedAllocateSerializer(serializers.Serializer):
+    """Corps de POST /beds/allocate/."""
+    department = serializers.UUIDField()
+    patient = serializers.UUIDField()
+    sex = serializers.ChoiceField(choices=["M", "F"], required=False, allow_null=True)
+    isolation = serializers.BooleanField(required=False, default=False)
+    hold_minutes = serializers.IntegerField(required=False, default=30, min_value=1, max_value=24 * 60)
+
+class ADTMoveSerializer(serializers.Serializer):
+    """Corps de POST /encounters/{id}/admit/ et /transfer/."""
+    department = serializers.UUIDField()
+    bed = serializers.UUIDField(required=False, allow_null=True)
+    at = serializers.DateTimeField(required=False, allow_null=True)
+    note = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+class ADTDischargeSerializer(serializers.Serializer):
+    """Corps de POST /encounters/{id}/discharge/."""
+    at = serializers.DateTimeField(required=False, allow_null=True)
+    end_at = serializers.DateTimeField(required=False, allow_null=True)  # ancien nom de `at`
+    outcome = serializers.CharField(required=False, default="DISCHARGED", max_length=64)
+    note = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+class BedOccupancySerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = BedOccupancy
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class ProcedureSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class ProcedureSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Procedure
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class DiagnosticReportSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class DiagnosticReportSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = DiagnosticReport
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class ObservationSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class ObservationSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Observation
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
 # --------- Billing ---------
-class InvoiceLineSerializer(serializers.ModelSerializer):
-    amount = serializers.SerializerMethodField()
-
+class InvoiceLineSerializer(DynamicModelSerializer):
     class Meta:
         model = InvoiceLine
         fields = ("id", "invoice", "act_code", "label", "qty", "unit_price", "amount")
+        read_only_fields = ("amount",)
 
-    def get_amount(self, obj):
-        return obj.qty * obj.unit_price
-
-class InvoiceSerializer(serializers.ModelSerializer, TenantAwareMixin):
-    lines = InvoiceLineSerializer(many=True, read_only=True)
-
+class InvoiceSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Invoice
         fields = "__all__"
-        read_only_fields = ("tenant_key",)
+        read_only_fields = ("tenant_key", "total")
+        expandable_fields = {"lines": (InvoiceLineSerializer, {"many": True, "read_only": True})}
 
 # --------- Appointments / Referrals ---------
-class AppointmentSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class AppointmentSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Appointment
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
-class ReferralSerializer(serializers.ModelSerializer, TenantAwareMixin):
+class PractitionerScheduleSerializer(DynamicModelSerializer, TenantAwareMixin):
+    class Meta:
+        model = PractitionerSchedule
+        fields = "__all__"
+        read_only_fields = ("tenant_key",)
+
+class PractitionerAbsenceSerializer(DynamicModelSerializer, TenantAwareMixin):
+    class Meta:
+        model = PractitionerAbsence
+        fields = "__all__"
+        read_only_fields = ("tenant_key",)
+
+class FreeSlotQuerySerializer(serializers.Serializer):
+    """Paramètres de /appointments/free-slots/ (défaut : 7 jours à partir de maintenant)."""
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    duration = serializers.IntegerField(required=False, min_value=5, max_value=480)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=500)
+    practitioner = serializers.CharField(required=False, help_text="ids séparés par des virgules")
+    specialty = serializers.CharField(required=False, max_length=120)
+    facility = serializers.UUIDField(required=False)
+    department = serializers.UUIDField(required=False)
+
+    def validate_practitioner(self, value):
+        field = serializers.UUIDField()
+        return [field.to_internal_value(v.strip()) for v in value.split(",") if v.strip()]
+
+    def validate(self, attrs):
+        start = attrs.setdefault("start", timezone.now())
+        end = attrs.setdefault("end", start + timedelta(days=7))
+        if end <= start:
+            raise serializers.ValidationError({"end": "Doit être postérieur à start."})
+        if end - start > timedelta(days=31):
+            raise serializers.ValidationError({"end": "Fenêtre de recherche limitée à 31 jours."})
+        return attrs
+
+class RevenueReportQuerySerializer(serializers.Serializer):
+    """Paramètres de /reports/revenue/ : une année, ou un mois de cette année."""
+    GROUPS = ("tenant", "payer", "act_code", "status", "month", "day")
+
+    year = serializers.IntegerField(min_value=2000, max_value=2100)
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    group_by = serializers.CharField(required=False, default="payer,act_code",
+                                     help_text=f"parmi {', '.join(GROUPS)}, séparés par des virgules")
+    status = serializers.CharField(required=False, help_text="statuts de facture séparés par des virgules")
+    tenant = serializers.CharField(required=False, max_length=64)
+    payer = serializers.UUIDField(required=False)
+    act_code = serializers.CharField(required=False, max_length=32)
+
+    def validate_group_by(self, value):
+        groups = [g.strip() for g in value.split(",") if g.strip()]
+        unknown = set(groups) - set(self.GROUPS)
+        if unknown:
+            raise serializers.ValidationError(f"Regroupement inconnu : {', '.join(sorted(unknown))}.")
+        return list(dict.fromkeys(groups))
+
+    def validate_status(self, value):
+        return [v.strip().upper() for v in value.split(",") if v.strip()]
+
+
+class StockAsOfQuerySerializer(serializers.Serializer):
+    """Paramètres de /stock/as-of/ : un instant, et des articles ou un établissement."""
+    at = serializers.DateTimeField(required=False, help_text="défaut : maintenant")
+    item = serializers.CharField(required=False, help_text="ids d'articles séparés par des virgules")
+    facility = serializers.UUIDField(required=False)
+    by_lot = serializers.BooleanField(required=False, default=True)
+
+    def validate_item(self, value):
+        try:
+            return [uuid.UUID(v.strip()) for v in value.split(",") if v.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Identifiant d'article invalide.")
+
+    def validate(self, attrs):
+        if not attrs.get("item") and not attrs.get("facility"):
+            raise serializers.ValidationError("Préciser item ou facility.")
+        return attrs
+
+
+class StockMapQuerySerializer(serializers.Serializer):
+    """Paramètres de /stock-map/ : un médicament (id ou code ATC), un niveau géographique."""
+    LEVELS = ("region", "district", "facility")
+
+    drug = serializers.UUIDField(required=False)
+    atc = serializers.CharField(required=False, max_length=32)
+    level = serializers.ChoiceField(choices=LEVELS, required=False, default="district")
+    region = serializers.IntegerField(required=False)
+    district = serializers.IntegerField(required=False)
+    stockout = serializers.BooleanField(required=False, default=False,
+                                        help_text="seulement les zones sans établissement en stock")
+    limit = serializers.IntegerField(required=False, default=1000, min_value=1, max_value=10000)
+
+    def validate(self, attrs):
+        if not attrs.get("drug") and not attrs.get("atc") and not attrs["stockout"]:
+            raise serializers.ValidationError("Préciser drug ou atc (ou stockout=true).")
+        if attrs["level"] == "facility" and not (attrs.get("district") or attrs.get("region")):
+            raise serializers.ValidationError("Le niveau facility se limite à un district ou une région.")
+        return attrs
+
+class ReferralSerializer(DynamicModelSerializer, TenantAwareMixin):
     class Meta:
         model = Referral
         fields = "__all__"
         read_only_fields = ("tenant_key",)
 
 # --------- Code Systems (read-only) ---------
-class CodeActSerializer(serializers.ModelSerializer):
+class CodeActSerializer(DynamicModelSerializer):
     class Meta:
         model = CodeAct
         fields = "__all__"
 
-class CodeICD10Serializer(serializers.ModelSerializer):
+class CodeICD10Serializer(DynamicModelSerializer):
     class Meta:
         model = CodeDiagICD10
         fields = "__all__"
 
-class CodeLOINCSerializer(serializers.ModelSerializer):
+class CodeLOINCSerializer(DynamicModelSerializer):
     class Meta:
         model = CodeLabLOINC
         fields = "__all__"
 
 # --------- Users ---------
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(DynamicModelSerializer):
     class Meta:
         model = UserProfile
         fields = "__all__"
\ No newline at end of file
@@ -1,4 +1,6 @@
-from rest_framework import viewsets, mixins, status
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework import viewsets, mixins, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
@@ -6,15 +8,22 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.views import APIView
 
 from core.authz import HasKCRealmRole
+from core.db_scope import PostgresScopeMixin
+from hospital import kinship, slots
+from hospital.residence import communes_as_of
+from hospital.matching import check_patient
+from hospital.search import search_patients
 from hospital.models import (
     UserProfile, Pole, Region, District, Commune, Facility, Department,
     Practitioner, Bed, Patient, PatientResidence, Kinship, Encounter,
     BedOccupancy, Procedure, DiagnosticReport, Observation, Payer,
-    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC
+    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC, DuplicateCandidate
 )
 from .serializers import *
 from .permissions import IsStaff, IsPatient, ReadOnly, StaffOrReadOnly, IsSelfPatient
-from .filters import EncounterFilter, AppointmentFilter, ObservationFilter, InvoiceFilter
+from .filters import EncounterFilter, AppointmentFilter, ObservationFilter, InvoiceFilter, PatientTrigramSearchFilter
+from .eager import prune_related, serializer_plan
+from .pagination import EncounterKeysetPagination, ObservationKeysetPagination, InvoiceKeysetPagination
 
 
 class AdminOnlyView(APIView):
@@ -26,12 +35,27 @@ class AdminOnlyView(APIView):
 
 
 # ------------- Base Mixins -------------
-class DefaultsMixin:
+class DefaultsMixin(PostgresScopeMixin):
     filter_backends = (DjangoFilterBackend, SearchFilter, OrderingFilter)
     ordering_fields = "__all__"
     search_fields = ()
     http_method_names = ["get", "post", "put", "patch", "delete", "head", "options"]
 
+    def get_queryset(self):
+        """
+        Chargement déduit du serializer (api.eager) : select_related / prefetch_related des
+        seuls champs rendus pour cette requête. Les chemins écrits à la main sur `queryset`
+        restent appliqués (et élagués de la même façon) ; ils sont validés au démarrage
+        par le system check api.checks.
+        """
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        sources = None
+        if getattr(self, "request", None) is not None and hasattr(serializer_class, "requested_sources"):
+            sources = serializer_class.requested_sources(self.request)
+            queryset = prune_related(queryset, sources)
+        return serializer_plan(serializer_class).apply(queryset, sources)
+
 
 # ------------- Reference data -------------
 class PoleViewSet(DefaultsMixin, viewsets.ModelViewSet):
@@ -39,27 +63,31 @@ class PoleViewSet(DefaultsMixin, viewsets.ModelViewSet):
     serializer_class = PoleSerializer
     permission_classes = [StaffOrReadOnly]
     search_fields = ("name",)
+    rls_scoped = False
 
 
 class RegionViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Region.objects.select_related("pole").all().order_by("name")
+    queryset = Region.objects.all().order_by("name")
     serializer_class = RegionSerializer
     permission_classes = [StaffOrReadOnly]
-    search_fields = ("name", "pole__name")
+    search_fields = ("name", "poles__name")
+    rls_scoped = False
 
 
 class DistrictViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = District.objects.select_related("region").all().order_by("name")
+    queryset = District.objects.all().order_by("name")
     serializer_class = DistrictSerializer
     permission_classes = [StaffOrReadOnly]
     search_fields = ("name", "region__name")
+    rls_scoped = False
 
 
 class CommuneViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Commune.objects.select_related("district").all().order_by("name")
+    queryset = Commune.objects.all().order_by("name")
     serializer_class = CommuneSerializer
     permission_classes = [StaffOrReadOnly]
     search_fields = ("name", "district__name")
+    rls_scoped = False
 
 
 # ------------- Patient -------------
@@ -67,25 +95,99 @@ class PatientViewSet(DefaultsMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all().order_by("-created_at")
     serializer_class = PatientSerializer
     permission_classes = [IsStaff]
-    search_fields = ("mpi", "family_name", "given_name")
+    filter_backends = (DjangoFilterBackend, PatientTrigramSearchFilter, OrderingFilter)
+
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        Recherche par nom/prénoms (trigrammes, sans accents) ou MPI exact, classée par similarité.
+        ?q=kouame yao&birth_year=1984&sex=M&commune=<uuid>&limit=20
+        """
+        params = PatientSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        p = params.validated_data
+        qs = search_patients(
+            self.get_queryset().order_by(),
+            p["q"],
+            birth_year=p.get("birth_year"),
+            sex=p.get("sex"),
+            commune=p.get("commune"),
+        )[: p["limit"]]
+        return Response(PatientSearchSerializer(qs, many=True, context=self.get_serializer_context()).data)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        check_patient(serializer.instance.pk)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        check_patient(serializer.instance.pk)
+
+    @action(detail=True, methods=["get"], url_path="duplicates")
+    def duplicates(self, request, pk=None):
+        """Doublons potentiels du patient (détectés par hospital.matching), score décroissant."""
+        patient = self.get_object()
+        qs = DuplicateCandidate.objects.filter(
+            Q(patient_a=patient) | Q(patient_b=patient)
+        ).order_by("-score")
+        return Response(DuplicateCandidateSerializer(qs, many=True).data)
+
+    @action(detail=True, methods=["get"], url_path="relatives")
+    def relatives(self, request, pk=None):
+        """
+        Parents jusqu'à N degrés (Kinship + filiation father/mother), distance minimale et chemin.
+        ?depth=3&relations=PARENT_OF,CHILD_OF
+        """
+        patient = self.get_object()
+        params = RelativesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        found = kinship.relatives(patient.pk, params.validated_data["depth"], params.validated_data.get("relations"))
+        patients = self.get_queryset().in_bulk([r["patient_id"] for r in found])
+        data = []
+        for r in found:
+            obj = patients.get(r["patient_id"])
+            if obj is None:  # hors du périmètre visible (RLS)
+                continue
+            data.append({
+                "degree": r["degree"],
+                "relations": r["relations"],
+                "path": r["path"],
+                "patient": self.get_serializer(obj).data,
+            })
+        return Response(data)
 
     @action(detail=True, methods=["get"], url_path="siblings")
     def siblings(self, request, pk=None):
         patient = self.get_object()
         qs = patient.siblings_via_parents
-        data = PatientSerializer(qs, many=True).data
+        data = self.get_serializer(qs, many=True).data
         return Response(data)
 
 
 class PatientResidenceViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = PatientResidence.objects.select_related("patient", "commune").all().order_by("-from_date")
+    queryset = PatientResidence.objects.all().order_by("-from_date")
     serializer_class = PatientResidenceSerializer
     permission_classes = [IsStaff]
     search_fields = ("patient__mpi", "commune__name")
 
+    @action(detail=False, methods=["post"], url_path="resolve")
+    def resolve(self, request):
+        """
+        Commune de résidence principale de N patients, chacun à sa date, en une requête.
+        {"items": [{"patient": "<uuid>", "date": "2024-03-01"}, ...]} -> même ordre, commune nulle si inconnue.
+        """
+        params = ResidenceAsOfQuerySerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        items = params.validated_data["items"]
+        resolved = communes_as_of([(i["patient"], i["date"]) for i in items])
+        return Response([
+            {"patient": i["patient"], "date": i["date"], "commune": commune_id, "commune_name": name}
+            for i, (commune_id, name) in zip(items, resolved)
+        ])
+
 
 class KinshipViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Kinship.objects.select_related("src", "dst").all()
+    queryset = Kinship.objects.all()
     serializer_class = KinshipSerializer
     permission_classes = [IsStaff]
     search_fields = ("src__mpi", "dst__mpi", "relation")
@@ -93,13 +195,44 @@ class KinshipViewSet(DefaultsMixin, viewsets.ModelViewSet):
 
 # ------------- Appointments / Referrals -------------
 class AppointmentViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Appointment.objects.select_related("patient", "practitioner", "facility", "department").all()
+    queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [IsStaff]
     filterset_class = AppointmentFilter
     search_fields = ("status", "patient__mpi", "practitioner__matricule")
     ordering = ("-start_at",)
 
+    def _save_slot(self, save):
+        # excl_practitioner_overlap : chevauchement refusé par la base, rendu en 400 sur start_at
+        try:
+            with transaction.atomic():
+                save()
+        except IntegrityError as exc:
+            if "excl_practitioner_overlap" not in str(exc):
+                raise
+            raise serializers.ValidationError({"start_at": "Créneau déjà pris pour ce praticien."})
+
+    def perform_create(self, serializer):
+        self._save_slot(lambda: super(AppointmentViewSet, self).perform_create(serializer))
+
+    def perform_update(self, serializer):
+        self._save_slot(lambda: super(AppointmentViewSet, self).perform_update(serializer))
+
+    @action(detail=False, methods=["get"], url_path="free-slots")
+    def free_slots(self, request):
+        """
+        Premiers créneaux libres, tous praticiens confondus (hospital.slots, une requête SQL).
+        ?specialty=cardiologie&start=...&end=...&duration=15&limit=20&practitioner=<id>,<id>&facility=&department=
+        """
+        params = FreeSlotQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        return Response(slots.free_slots(
+            data["start"], data["end"], limit=data["limit"], duration=data.get("duration"),
+            practitioners=data.get("practitioner"), specialty=data.get("specialty"),
+            facility=data.get("facility"), department=data.get("department"),
+        ))
+
     @action(detail=True, methods=["post"], url_path="cancel")
     def cancel(self, request, pk=None):
         obj = self.get_object()
@@ -141,39 +274,36 @@ class CodeLOINCViewSet(ReadOnlyModelViewSet):
 
 # ------------- User Profiles -------------
 class UserProfileViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = UserProfile.objects.select_related("facility").all()
+    queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [IsStaff]
     search_fields = ("username", "idp_sub", "tenant_key")
 
 
 # ------------- /me/* endpoints (patient portail) -------------
-class MyEncountersViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+# RLS limite déjà sur patient_mpi
+class MyEncountersViewSet(DefaultsMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    queryset = Encounter.objects.all().order_by("-start_at")
     serializer_class = EncounterSerializer
     permission_classes = [IsSelfPatient]
     filter_backends = (DjangoFilterBackend, OrderingFilter)
+    pagination_class = EncounterKeysetPagination
     ordering = ("-start_at",)
 
-    def get_queryset(self):
-        # RLS limite déjà sur patient_mpi
-        return Encounter.objects.select_related("facility", "department", "patient").order_by("-start_at")
-
 
-class MyObservationsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class MyObservationsViewSet(DefaultsMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    queryset = Observation.objects.all().order_by("-observed_at")
     serializer_class = ObservationSerializer
     permission_classes = [IsSelfPatient]
     filter_backends = (DjangoFilterBackend, OrderingFilter)
+    pagination_class = ObservationKeysetPagination
     ordering = ("-observed_at",)
 
-    def get_queryset(self):
-        return Observation.objects.select_related("encounter", "report").order_by("-observed_at")
-
 
-class MyInvoicesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class MyInvoicesViewSet(DefaultsMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    queryset = Invoice.objects.all().order_by("-issued_at", "-created_at")
     serializer_class = InvoiceSerializer
     permission_classes = [IsSelfPatient]
     filter_backends = (DjangoFilterBackend, OrderingFilter)
+    pagination_class = InvoiceKeysetPagination
     ordering = ("-issued_at", "-created_at")
-
-    def get_queryset(self):
-        return Invoice.objects.select_related("encounter", "payer").order_by("-issued_at", "-created_at")
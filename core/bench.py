@@ -0,0 +1,65 @@
+# core/bench.py
+"""Outillage commun des commandes de banc de charge (bench_*)."""
+import queue
+import statistics
+import threading
+import time
+
+from django.db import connection
+
+
+def run_concurrently(fn, items, concurrency, exhausted=()):
+    """
+    Exécute fn(item) sur `concurrency` threads (une connexion chacun), départ simultané.
+    fn retourne un nombre de collisions subies ; les exceptions `exhausted` (plus de lit,
+    plus de stock...) sont comptées à part des erreurs.
+    """
+    jobs = queue.Queue()
+    for item in items:
+        jobs.put(item)
+    lock = threading.Lock()
+    latencies, totals = [], {"ok": 0, "exhausted": 0, "conflicts": 0, "errors": 0}
+    start = threading.Barrier(concurrency + 1)
+
+    def worker():
+        connection.ensure_connection()
+        start.wait()
+        try:
+            while True:
+                try:
+                    item = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                t0 = time.perf_counter()
+                outcome, conflicts = "ok", 0
+                try:
+                    conflicts = fn(item)
+                except exhausted:
+                    outcome = "exhausted"
+                except Exception:  # noqa: BLE001 - compté, le banc continue
+                    outcome = "errors"
+                elapsed = (time.perf_counter() - t0) * 1000
+                with lock:
+                    totals[outcome] += 1
+                    totals["conflicts"] += conflicts
+                    latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        **totals,
+        "rate": len(latencies) / wall if wall else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        "max": latencies[-1] if latencies else 0.0,
+    }
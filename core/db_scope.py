@@ -0,0 +1,77 @@
+# core/db_scope.py
+from django.db import connection, transaction
+
+# Une seule instruction : les deux variables sont positionnées (ou remises à vide) ensemble.
+# is_local=true => valeurs limitées à la transaction courante (compatible PgBouncer en mode transaction).
+BIND_SCOPE_SQL = (
+    "SELECT set_config('app.tenant_key', %s, true), "
+    "set_config('app.patient_mpi', %s, true)"
+)
+
+
+def _roles(token) -> set:
+    roles = set()
+    if not token:
+        return roles
+    roles |= set(token.get("realm_access", {}).get("roles", []))
+    for v in token.get("resource_access", {}).values():
+        roles |= set(v.get("roles", []))
+    return roles
+
+
+def scope_for(token):
+    """
+    Déduit (tenant_key, patient_mpi) du JWT déjà décodé.
+    Convention de claims JWT attendues :
+      - "tenant_key"   (ex: "CHU-COCODY")
+      - "patient_mpi"  (ex: "mpi_xxx")
+      - rôles : "ROLE_PATIENT", "ROLE_MEDECIN", "ROLE_ADMIN_CHU", etc.
+    Un patient n'est jamais scopé par tenant (accès restreint à son propre dossier).
+    """
+    token = token or {}
+    patient_mpi = token.get("patient_mpi")
+    if "ROLE_PATIENT" in _roles(token) and patient_mpi:
+        return "", patient_mpi
+    return token.get("tenant_key") or "", ""
+
+
+def bind_scope(tenant_key="", patient_mpi="", using=None):
+    """Positionne app.tenant_key / app.patient_mpi en un aller-retour, dans la transaction courante."""
+    conn = connection if using is None else transaction.get_connection(using)
+    with conn.cursor() as cur:
+        cur.execute(BIND_SCOPE_SQL, [tenant_key or "", patient_mpi or ""])
+
+
+class PostgresScopeMixin:
+    """
+    Positionne les variables de session Postgres utilisées par les policies RLS,
+    APRÈS l'authentification DRF (request.auth est alors renseigné) :
+      - app.tenant_key  : pour le personnel (scopé facility/CHU)
+      - app.patient_mpi : pour les patients (accès à leur propre dossier)
+
+    - La requête est exécutée dans une transaction (set_config(..., true) n'a de sens
+      qu'à l'intérieur d'une transaction ; hors transaction la valeur est perdue
+      dès l'instruction suivante, a fortiori derrière PgBouncer).
+    - Les vues qui ne lisent aucune table soumise à la RLS déclarent rls_scoped = False :
+      ni transaction ni aller-retour base pour elles.
+    """
+    rls_scoped = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.rls_scoped:
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # authentification + permissions + throttling d'abord : un 401/403 ne touche pas la base
+        super().initial(request, *args, **kwargs)
+        if self.rls_scoped:
+            bind_scope(*scope_for(request.auth))
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        # DRF ne marque la transaction en rollback que sous ATOMIC_REQUESTS
+        if self.rls_scoped and transaction.get_connection().in_atomic_block:
+            transaction.set_rollback(True)
+        return response
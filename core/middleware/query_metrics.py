@@ -0,0 +1,141 @@
+# core/middleware/query_metrics.py
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from prometheus_client import Counter as PromCounter, Histogram
+
+from core.db_scope import scope_for
+
+LABELS = ("view", "method", "tenant")
+
+DB_QUERIES = Histogram(
+    "sigh_db_queries_per_request",
+    "Nombre d'instructions SQL par requête HTTP",
+    LABELS,
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, float("inf")),
+)
+DB_TIME = Histogram(
+    "sigh_db_time_seconds_per_request",
+    "Temps passé en base (somme des instructions) par requête HTTP",
+    LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf")),
+)
+DB_REPEATED = PromCounter(
+    "sigh_db_repeated_queries",
+    "Instructions SQL de même forme répétées dans une requête HTTP (signature N+1)",
+    LABELS,
+)
+DB_BUDGET_EXCEEDED = PromCounter(
+    "sigh_db_query_budget_exceeded",
+    "Requêtes HTTP ayant dépassé le budget d'instructions SQL de leur vue",
+    LABELS,
+)
+
+# Les listes IN (%s, %s, ...) de longueur variable ont la même forme
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_SAVEPOINT = re.compile(r"^(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT) ")
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Levée (dev/test, QUERY_BUDGET_RAISE) quand une vue dépasse le budget de requêtes SQL
+    qu'elle déclare (query_budget). Ses écritures sont déjà validées à ce moment-là.
+    """
+
+
+class QueryRecorder:
+    """execute_wrapper : compte les instructions, leur durée et leur forme (SQL paramétré)."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - t0
+            self.count += 1
+            if not _SAVEPOINT.match(sql):
+                self.shapes[_IN_LIST.sub("IN (...)", sql)] += 1
+
+    @property
+    def repeated(self):
+        """Instructions au-delà de la première de chaque forme."""
+        return sum(n - 1 for n in self.shapes.values() if n > 1)
+
+    def worst(self, limit=3):
+        return [(n, sql) for sql, n in self.shapes.most_common(limit) if n > 1]
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None, None
+    view = getattr(match.func, "cls", None) or getattr(match.func, "view_class", None)
+    if view is not None:
+        return f"{view.__module__}.{view.__name__}", view
+    return match.view_name or match._func_path, None
+
+
+def _tenant_label(request):
+    # request.auth (claims JWT) est recopié sur la HttpRequest par DRF après authentification
+    token = getattr(request, "auth", None)
+    if not hasattr(token, "get"):
+        return "-"
+    tenant_key, patient_mpi = scope_for(token)
+    if tenant_key:
+        return tenant_key
+    return "patient" if patient_mpi else "-"
+
+
+class QueryMetricsMiddleware:
+    """
+    Par vue résolue, méthode HTTP et tenant :
+      - sigh_db_queries_per_request (histogramme) : nombre d'instructions SQL
+      - sigh_db_time_seconds_per_request (histogramme) : temps cumulé en base
+      - sigh_db_repeated_queries (compteur) : instructions de forme déjà vue (N+1)
+      - sigh_db_query_budget_exceeded (compteur)
+    Budget : attribut `query_budget` de la vue (DRF), sinon QUERY_BUDGET_DEFAULT (None = aucun).
+    Avec QUERY_BUDGET_RAISE (dev/test), le dépassement d'un budget déclaré par la vue lève
+    QueryBudgetExceeded ; celui du budget par défaut est seulement compté.
+    L'exception est levée après la vue : ses écritures sont déjà validées (transaction de
+    PostgresScopeMixin terminée), elle signale la régression sans rien annuler.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        label, view = _view_label(request)
+        if label is None:
+            return response
+        labels = (label, request.method, _tenant_label(request))
+        DB_QUERIES.labels(*labels).observe(recorder.count)
+        DB_TIME.labels(*labels).observe(recorder.duration)
+        if recorder.repeated:
+            DB_REPEATED.labels(*labels).inc(recorder.repeated)
+
+        declared = getattr(view, "query_budget", None)
+        budget = declared if declared is not None else getattr(settings, "QUERY_BUDGET_DEFAULT", None)
+        if budget is not None and recorder.count > budget:
+            DB_BUDGET_EXCEEDED.labels(*labels).inc()
+            if declared is not None and getattr(settings, "QUERY_BUDGET_RAISE", False):
+                detail = "\n".join(f"  x{n}: {sql[:200]}" for n, sql in recorder.worst())
+                raise QueryBudgetExceeded(
+                    f"{request.method} {request.path} ({label}) : {recorder.count} requêtes SQL "
+                    f"pour un budget de {budget}.\n{detail}"
+                )
+        return response
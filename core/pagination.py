@@ -0,0 +1,49 @@
+# core/pagination.py
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+
+def planner_estimate(queryset):
+    """
+    Nombre de lignes estimé par le planificateur Postgres (EXPLAIN, sans exécuter la requête).
+    L'estimation tient compte des filtres ET des policies RLS (appliquées au plan),
+    à partir des statistiques pg_class.reltuples / pg_statistic.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cur:
+        cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate_count(queryset, threshold=None):
+    """
+    Retourne (count, is_estimate) :
+      - estimation du planificateur si elle dépasse `threshold`
+      - COUNT(*) exact sinon (petits ensembles : le COUNT est bon marché et l'estimation peu fiable)
+    """
+    if threshold is None:
+        threshold = settings.COUNT_ESTIMATE_THRESHOLD
+    if not isinstance(queryset, QuerySet) or connections[queryset.db].vendor != "postgresql":
+        return (queryset.count() if isinstance(queryset, QuerySet) else len(queryset)), False
+    estimate = planner_estimate(queryset)
+    if estimate < threshold:
+        return queryset.count(), False
+    return estimate, True
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator Django dont le total est estimé au-delà du seuil (DRF et changelists admin)."""
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        count, self.count_is_estimate = estimate_count(self.object_list)
+        return count
@@ -1,3 +1,23 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import RevenueDaily, RollupWatermark
+
+
+@admin.register(RevenueDaily)
+class RevenueDailyAdmin(admin.ModelAdmin):
+    list_display = ("tenant_key", "day", "payer", "act_code", "status", "lines", "qty", "amount")
+    list_filter = ("status",)
+    search_fields = ("tenant_key", "act_code")
+    date_hierarchy = "day"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("name", "value", "refreshed_at", "last_invoices", "last_partitions")
+    readonly_fields = ("name", "value", "refreshed_at", "last_invoices", "last_partitions")
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import AppointmentViewSet
-from finances.views import InvoiceViewSet, InvoiceLineViewSet, PayerViewSet
+from finances.views import InvoiceViewSet, InvoiceLineViewSet, PayerViewSet, RevenueReportViewSet
 from hospital.api.views import ReferralViewSet
 
 router = DefaultRouter()
@@ -14,6 +14,9 @@ router.register(r"appointments", AppointmentViewSet, basename="appointment")
 router.register(r"referrals", ReferralViewSet, basename="referral")
 router.register(r"payers", PayerViewSet, basename="payer")
 
+# Reporting (agrégats finances.rollups)
+router.register(r"reports/revenue", RevenueReportViewSet, basename="revenue-report")
+
 
 urlpatterns = [
     path("", include(router.urls)),  # <= expose bien des patterns
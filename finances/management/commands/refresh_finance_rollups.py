@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from finances.rollups import refresh_revenue
+
+
+class Command(BaseCommand):
+    help = (
+        "Rafraîchit les agrégats de chiffre d'affaires (RevenueDaily) depuis les factures "
+        "modifiées après le filigrane ; --full recalcule tout (factures supprimées, reprise)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="vider et recalculer tous les agrégats")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        r = refresh_revenue(full=opts["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['invoices']} facture(s), {r['partitions']} partition(s) (CHU, jour) réécrite(s) "
+            f"en {time.perf_counter() - t0:.2f}s ; filigrane : {r['watermark']:%Y-%m-%d %H:%M:%S%z}."
+        ))
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('hospital', '0014_invoice_revenue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollupState',
+            fields=[
+                ('invoice_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'verbose_name': "État d'agrégation d'une facture",
+                'verbose_name_plural': "États d'agrégation des factures",
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_invoices', models.PositiveIntegerField(default=0)),
+                ('last_partitions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': "Filigrane d'agrégat",
+                'verbose_name_plural': "Filigranes d'agrégats",
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('month', models.DateField()),
+                ('act_code', models.CharField(max_length=32)),
+                ('status', models.CharField(max_length=16)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('qty', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('payer', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.payer')),
+            ],
+            options={
+                'verbose_name': "Chiffre d'affaires mensuel",
+                'verbose_name_plural': "Chiffre d'affaires mensuel",
+                'indexes': [models.Index(fields=['tenant_key', 'month'], name='finances_re_tenant__fa7bce_idx'), models.Index(fields=['month'], name='finances_re_month_539690_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('day', models.DateField()),
+                ('act_code', models.CharField(max_length=32)),
+                ('status', models.CharField(max_length=16)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('qty', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('payer', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.payer')),
+            ],
+            options={
+                'verbose_name': "Chiffre d'affaires journalier",
+                'verbose_name_plural': "Chiffre d'affaires journalier",
+                'indexes': [models.Index(fields=['tenant_key', 'day'], name='finances_re_tenant__36639e_idx'), models.Index(fields=['day'], name='finances_re_day_09c899_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,82 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+from hospital.models import Payer
+
+
+# ------------- Agrégats de facturation (finances.rollups) -------------
+class RevenueDaily(models.Model):
+    """
+    Chiffre d'affaires par (tenant_key, jour, payeur, acte, statut de facture).
+    Table dérivée de Invoice / InvoiceLine, réécrite par partition (tenant_key, jour) :
+    ne jamais la modifier à la main (commande refresh_finance_rollups).
+    Jour = date locale (TIME_ZONE) d'émission, à défaut de création de la facture.
+    """
+    tenant_key = models.CharField(max_length=64)
+    day = models.DateField()
+    # Pas de contrainte de clé étrangère : table dérivée, recalculée depuis les factures.
+    payer = models.ForeignKey(Payer, null=True, blank=True, on_delete=models.DO_NOTHING,
+                              db_constraint=False, related_name="+")
+    act_code = models.CharField(max_length=32)
+    status = models.CharField(max_length=16)
+    lines = models.PositiveIntegerField(default=0)
+    qty = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Chiffre d'affaires journalier")
+        verbose_name_plural = _("Chiffre d'affaires journalier")
+        indexes = [
+            # Réécriture d'une partition et requêtes d'un CHU sur une période
+            models.Index(fields=["tenant_key", "day"]),
+            # Requêtes nationales (tous CHU) sur une période
+            models.Index(fields=["day"]),
+        ]
+
+
+class RevenueMonthly(models.Model):
+    """
+    Même agrégat au mois (month = 1er du mois), recalculé depuis RevenueDaily pour les mois
+    des partitions réécrites : les requêtes annuelles lisent au plus 12 lignes par combinaison.
+    """
+    tenant_key = models.CharField(max_length=64)
+    month = models.DateField()
+    payer = models.ForeignKey(Payer, null=True, blank=True, on_delete=models.DO_NOTHING,
+                              db_constraint=False, related_name="+")
+    act_code = models.CharField(max_length=32)
+    status = models.CharField(max_length=16)
+    lines = models.PositiveIntegerField(default=0)
+    qty = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Chiffre d'affaires mensuel")
+        verbose_name_plural = _("Chiffre d'affaires mensuel")
+        indexes = [
+            models.Index(fields=["tenant_key", "month"]),
+            models.Index(fields=["month"]),
+        ]
+
+
+class RevenueRollupState(models.Model):
+    """Dernière partition (tenant_key, jour) dans laquelle chaque facture a été comptée."""
+    invoice_id = models.UUIDField(primary_key=True)
+    tenant_key = models.CharField(max_length=64)
+    day = models.DateField()
+
+    class Meta:
+        verbose_name = _("État d'agrégation d'une facture")
+        verbose_name_plural = _("États d'agrégation des factures")
+
+
+class RollupWatermark(models.Model):
+    """Filigrane d'un agrégat : factures modifiées (updated_at) après `value` restant à intégrer."""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    last_invoices = models.PositiveIntegerField(default=0)
+    last_partitions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Filigrane d'agrégat")
+        verbose_name_plural = _("Filigranes d'agrégats")
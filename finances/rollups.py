@@ -0,0 +1,138 @@
+# finances/rollups.py
+"""
+Agrégats de chiffre d'affaires (RevenueDaily), rafraîchis par filigrane.
+
+Une facture modifiée (updated_at, avancé aussi par les triggers des lignes : migration
+hospital 0014) après le filigrane est réintégrée : on réécrit entièrement les partitions
+(tenant_key, jour) qu'elle touche, sa partition actuelle et celle où elle était comptée
+jusque-là (RevenueRollupState : changement de date d'émission). Une partition = un jour
+d'un CHU : quelques centaines de factures, relues par l'index invoice_tenant_revenue_ts.
+
+Filigrane : updated_at vaut l'heure de début de la transaction qui écrit ; une transaction
+plus ancienne que le rafraîchissement peut valider après lui. On relit donc une marge
+(FINANCE_ROLLUP_LAG_SECONDS) à chaque passage : réintégrer une facture est idempotent.
+Les mois de ces partitions sont ensuite recalculés depuis les jours (RevenueMonthly).
+Les factures supprimées ne sont retirées que par un recalcul complet (full=True).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from hospital.models import Invoice, InvoiceLine
+
+from .models import RevenueDaily, RevenueMonthly, RevenueRollupState, RollupWatermark
+
+WATERMARK = "revenue_daily"
+
+# Jour local de rattachement d'une facture (même expression que l'index invoice_tenant_revenue_ts)
+DAY_SQL = "(coalesce(i.issued_at, i.created_at) AT TIME ZONE %(tz)s)::date"
+
+CHANGED_SQL = f"""
+CREATE TEMP TABLE _revenue_changed ON COMMIT DROP AS
+SELECT i.id, i.tenant_key, {DAY_SQL} AS day
+FROM {{invoice}} i
+WHERE i.updated_at > %(since)s
+"""
+
+PARTITIONS_SQL = """
+CREATE TEMP TABLE _revenue_partitions ON COMMIT DROP AS
+SELECT tenant_key, day FROM _revenue_changed
+UNION
+SELECT s.tenant_key, s.day FROM {state} s JOIN _revenue_changed c ON c.id = s.invoice_id
+"""
+
+DELETE_SQL = """
+DELETE FROM {rollup} r
+USING _revenue_partitions p
+WHERE r.tenant_key = p.tenant_key AND r.day = p.day
+"""
+
+INSERT_SQL = """
+INSERT INTO {rollup} (tenant_key, day, payer_id, act_code, status, lines, qty, amount)
+SELECT i.tenant_key, p.day, i.payer_id, l.act_code, i.status, count(*), sum(l.qty), sum(l.amount)
+FROM _revenue_partitions p
+JOIN {invoice} i
+  ON i.tenant_key = p.tenant_key
+ AND coalesce(i.issued_at, i.created_at) >= p.day::timestamp AT TIME ZONE %(tz)s
+ AND coalesce(i.issued_at, i.created_at) < (p.day + 1)::timestamp AT TIME ZONE %(tz)s
+JOIN {line} l ON l.invoice_id = i.id
+GROUP BY i.tenant_key, p.day, i.payer_id, l.act_code, i.status
+"""
+
+# Mois des partitions réécrites : recalculés depuis les jours (au plus 31 jours par CHU)
+MONTHS_SQL = """
+CREATE TEMP TABLE _revenue_months ON COMMIT DROP AS
+SELECT DISTINCT tenant_key, date_trunc('month', day)::date AS month FROM _revenue_partitions
+"""
+
+DELETE_MONTHS_SQL = """
+DELETE FROM {monthly} r
+USING _revenue_months m
+WHERE r.tenant_key = m.tenant_key AND r.month = m.month
+"""
+
+INSERT_MONTHS_SQL = """
+INSERT INTO {monthly} (tenant_key, month, payer_id, act_code, status, lines, qty, amount)
+SELECT d.tenant_key, m.month, d.payer_id, d.act_code, d.status, sum(d.lines), sum(d.qty), sum(d.amount)
+FROM _revenue_months m
+JOIN {rollup} d
+  ON d.tenant_key = m.tenant_key AND d.day >= m.month AND d.day < (m.month + interval '1 month')::date
+GROUP BY d.tenant_key, m.month, d.payer_id, d.act_code, d.status
+"""
+
+STATE_SQL = """
+INSERT INTO {state} (invoice_id, tenant_key, day)
+SELECT id, tenant_key, day FROM _revenue_changed
+ON CONFLICT (invoice_id) DO UPDATE SET tenant_key = EXCLUDED.tenant_key, day = EXCLUDED.day
+"""
+
+
+def refresh_revenue(full=False):
+    """
+    Intègre les factures modifiées depuis le filigrane (full=True : tout recalculer).
+    Une transaction ; deux rafraîchissements simultanés se sérialisent sur la ligne du filigrane.
+    Retourne {"invoices", "partitions", "watermark"}.
+    """
+    tables = {
+        "invoice": Invoice._meta.db_table,
+        "line": InvoiceLine._meta.db_table,
+        "rollup": RevenueDaily._meta.db_table,
+        "monthly": RevenueMonthly._meta.db_table,
+        "state": RevenueRollupState._meta.db_table,
+    }
+    with transaction.atomic():
+        mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        with connection.cursor() as cur:
+            cur.execute("SELECT transaction_timestamp()")
+            started = cur.fetchone()[0]
+            lag = datetime.timedelta(seconds=settings.FINANCE_ROLLUP_LAG_SECONDS)
+            since = None if full or mark.value is None else mark.value - lag
+            params = {"tz": settings.TIME_ZONE, "since": since or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)}
+            if since is None:
+                cur.execute(f"TRUNCATE {tables['rollup']}, {tables['monthly']}, {tables['state']}")
+            cur.execute(CHANGED_SQL.format(**tables), params)
+            invoices = cur.rowcount
+            cur.execute(PARTITIONS_SQL.format(**tables))
+            partitions = cur.rowcount
+            if partitions:
+                cur.execute("ANALYZE _revenue_partitions")
+                if since is not None:
+                    cur.execute(DELETE_SQL.format(**tables))
+                cur.execute(INSERT_SQL.format(**tables), params)
+                cur.execute(MONTHS_SQL)
+                if since is not None:
+                    cur.execute(DELETE_MONTHS_SQL.format(**tables))
+                cur.execute(INSERT_MONTHS_SQL.format(**tables))
+                cur.execute(STATE_SQL.format(**tables))
+        mark.value = started
+        mark.refreshed_at = timezone.now()
+        mark.last_invoices, mark.last_partitions = invoices, partitions
+        mark.save()
+    return {"invoices": invoices, "partitions": partitions, "watermark": started}
+
+
+def watermark():
+    """Fraîcheur de l'agrégat : factures modifiées jusqu'à cette date intégrées (None : jamais calculé)."""
+    return RollupWatermark.objects.filter(name=WATERMARK).values_list("value", flat=True).first()
@@ -0,0 +1,11 @@
+# finances/tasks.py
+"""Tâches Celery de l'app finances (planification : CELERY_BEAT_SCHEDULE)."""
+from celery import shared_task
+
+from . import rollups
+
+
+@shared_task(ignore_result=True)
+def refresh_revenue_rollups(full=False):
+    """Intègre les factures modifiées depuis le filigrane dans RevenueDaily."""
+    return rollups.refresh_revenue(full=full)
@@ -1,3 +1,6 @@
+import datetime
+
+from django.db.models import Sum
 from django.shortcuts import render
 from django.utils import timezone
 from rest_framework import viewsets
@@ -5,19 +8,25 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from api.filters import InvoiceFilter
+from api.pagination import InvoiceKeysetPagination
 from api.permissions import IsStaff
-from api.serializers import InvoiceSerializer, InvoiceLineSerializer, PayerSerializer
+from api.serializers import InvoiceSerializer, InvoiceLineSerializer, PayerSerializer, RevenueReportQuerySerializer
 from api.views import DefaultsMixin
+from core.db_scope import PostgresScopeMixin, scope_for
 from hospital.models import Invoice, InvoiceLine, Payer
 
+from . import rollups
+from .models import RevenueDaily, RevenueMonthly
+
 
 # Create your views here.
 # ------------- Billing -------------
 class InvoiceViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Invoice.objects.select_related("encounter", "payer").all()
+    queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [IsStaff]
     filterset_class = InvoiceFilter
+    pagination_class = InvoiceKeysetPagination
     search_fields = ("status", "encounter__patient__mpi")
     ordering = ("-issued_at", "-created_at")
 
@@ -42,7 +51,7 @@ class InvoiceViewSet(DefaultsMixin, viewsets.ModelViewSet):
 
 
 class InvoiceLineViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = InvoiceLine.objects.select_related("invoice").all()
+    queryset = InvoiceLine.objects.all()
     serializer_class = InvoiceLineSerializer
     permission_classes = [IsStaff]
     search_fields = ("act_code", "label")
@@ -53,3 +62,61 @@ class PayerViewSet(DefaultsMixin, viewsets.ModelViewSet):
     serializer_class = PayerSerializer
     permission_classes = [IsStaff]
     search_fields = ("code", "label")
+    rls_scoped = False
+
+
+# ------------- Reporting -------------
+class RevenueReportViewSet(PostgresScopeMixin, viewsets.ViewSet):
+    """
+    Chiffre d'affaires lu dans les agrégats (finances.rollups), jamais dans les factures :
+    RevenueMonthly, ou RevenueDaily si l'on regroupe par jour. Une année ou un mois de tous
+    les CHU se lit en quelques millisecondes.
+    "watermark" indique jusqu'où les modifications de factures sont intégrées.
+    """
+    permission_classes = [IsStaff]
+    # regroupement demandé -> colonnes de l'agrégat
+    GROUPS = {
+        "tenant": ("tenant_key",),
+        "payer": ("payer_id", "payer__code"),
+        "act_code": ("act_code",),
+        "status": ("status",),
+        "month": ("month",),
+        "day": ("day",),
+    }
+
+    def list(self, request):
+        params = RevenueReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        p = params.validated_data
+
+        start = datetime.date(p["year"], p.get("month") or 1, 1)
+        end = (datetime.date(p["year"] + 1, 1, 1) if not p.get("month") or p["month"] == 12
+               else datetime.date(p["year"], p["month"] + 1, 1))
+        daily = "day" in p["group_by"]
+        groups = [g for g in p["group_by"] if not (daily and g == "month")]  # le jour fixe le mois
+        model, period = (RevenueDaily, "day") if daily else (RevenueMonthly, "month")
+        rows = model.objects.filter(**{f"{period}__gte": start, f"{period}__lt": end})
+        tenant_key, _ = scope_for(request.auth)
+        if tenant_key:
+            rows = rows.filter(tenant_key=tenant_key)
+        if p.get("tenant"):
+            rows = rows.filter(tenant_key=p["tenant"])
+        if p.get("status"):
+            rows = rows.filter(status__in=p["status"])
+        if p.get("payer"):
+            rows = rows.filter(payer_id=p["payer"])
+        if p.get("act_code"):
+            rows = rows.filter(act_code=p["act_code"])
+
+        sums = {"lines": Sum("lines"), "qty": Sum("qty"), "amount": Sum("amount")}
+        columns = [c for name in groups for c in self.GROUPS[name]]
+        data = list(rows.values(*columns).annotate(**sums).order_by("-amount")) if columns else []
+        total = rows.aggregate(**sums)
+        return Response({
+            "start": start,
+            "end": end,
+            "group_by": groups,
+            "watermark": rollups.watermark(),
+            "rows": data,
+            "total": {k: v or 0 for k, v in total.items()},
+        })
@@ -6,11 +6,14 @@ from django.utils.translation import gettext_lazy as _
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources, fields
 from import_export.widgets import ForeignKeyWidget
+
+from core.pagination import EstimatedCountPaginator
 from .models import (
     UserProfile, Pole, Region, District, Commune, Facility, Department,
     Practitioner, Bed, Patient, PatientResidence, Kinship, Encounter,
     BedOccupancy, Procedure, DiagnosticReport, Observation, Payer,
-    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC, VisitType, ScopeLevel
+    Invoice, InvoiceLine, Appointment, Referral, CodeAct, CodeDiagICD10, CodeLabLOINC, VisitType, ScopeLevel,
+    DuplicateCandidate, PractitionerSchedule, PractitionerAbsence, NotificationOutbox
 )
 
 admin.site.site_header = 'BACK-END SIGH'
@@ -20,6 +23,16 @@ admin.site.index_title = 'MSHPCMU '
 admin.empty_value_display = '**Empty**'
 
 
+# -------- Mixins --------
+class EstimatedCountAdminMixin:
+    """
+    Changelists des grosses tables : total estimé par le planificateur au-delà du seuil
+    (affiché "≈ N") et pas de second COUNT(*) sur la table entière.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 # -------- Inlines --------
 
 
@@ -242,8 +255,8 @@ class PatientResidenceInline(admin.TabularInline):
 class InvoiceLineInline(admin.TabularInline):
     model = InvoiceLine
     extra = 0
-    fields = ("act_code", "label", "qty", "unit_price")
-    readonly_fields = ()
+    fields = ("act_code", "label", "qty", "unit_price", "amount")
+    readonly_fields = ("amount",)
     show_change_link = False
 
 
@@ -270,7 +283,7 @@ class CommuneAdmin(OSMGeoAdmin):
 
 @admin.register(Facility)
 class FacilityAdmin(OSMGeoAdmin):
-    list_display = ("name", "code", "type", "is_chu", "active", "parent")
+    list_display = ("name", "code", "type", "is_chu", "active", "parent", "root_code")
     list_filter = ("type", "is_chu", "active", "commune")
     search_fields = ("name", "code")
     raw_id_fields = ("parent", "commune")
@@ -340,7 +353,7 @@ class BedAdmin(admin.ModelAdmin):
 
 # -------- Patient & famille --------
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ("mpi", "family_name", "given_name", "birth_date", "is_deceased", "death_date", "residence_commune")
     list_filter = ("is_deceased", "residence_commune")
     search_fields = ("mpi", "family_name", "given_name")
@@ -355,6 +368,16 @@ class KinshipAdmin(admin.ModelAdmin):
     search_fields = ("src__mpi", "dst__mpi")
 
 
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ("patient_a", "patient_b", "score", "status", "reviewed_at")
+    list_filter = ("status",)
+    search_fields = ("patient_a__mpi", "patient_b__mpi")
+    raw_id_fields = ("patient_a", "patient_b")
+    readonly_fields = ("score", "components")
+    ordering = ("-score",)
+
+
 @admin.register(PatientResidence)
 class PatientResidenceAdmin(admin.ModelAdmin):
     list_display = ("patient", "commune", "from_date", "to_date", "is_primary")
@@ -373,7 +396,7 @@ class VisitTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Encounter)
-class EncounterAdmin(admin.ModelAdmin):
+class EncounterAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ("id", "patient", "facility", "department", "visit_type", "start_at", "end_at", "tenant_key")
     list_filter = ("visit_type", "facility", "department")
     search_fields = ("patient__mpi", "facility__code")
@@ -410,7 +433,7 @@ class DiagnosticReportAdmin(admin.ModelAdmin):
 
 
 @admin.register(Observation)
-class ObservationAdmin(admin.ModelAdmin):
+class ObservationAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ("loinc_code", "encounter", "observed_at", "result_flag", "tenant_key")
     list_filter = ("result_flag",)
     search_fields = ("loinc_code", "encounter__patient__mpi")
@@ -426,18 +449,18 @@ class PayerAdmin(admin.ModelAdmin):
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ("id", "encounter", "payer", "status", "total", "issued_at", "tenant_key")
     list_filter = ("status", "issued_at")
     search_fields = ("encounter__patient__mpi", "payer__code")
     inlines = [InvoiceLineInline]
     raw_id_fields = ("encounter", "payer")
-    readonly_fields = ("tenant_key",)
+    readonly_fields = ("tenant_key", "total")
 
 
 @admin.register(InvoiceLine)
 class InvoiceLineAdmin(admin.ModelAdmin):
-    list_display = ("invoice", "act_code", "label", "qty", "unit_price")
+    list_display = ("invoice", "act_code", "label", "qty", "unit_price", "amount")
     search_fields = ("invoice__id", "act_code", "label")
     raw_id_fields = ("invoice",)
 
@@ -452,6 +475,36 @@ class AppointmentAdmin(admin.ModelAdmin):
     readonly_fields = ("tenant_key",)
 
 
+@admin.register(PractitionerSchedule)
+class PractitionerScheduleAdmin(admin.ModelAdmin):
+    list_display = ("practitioner", "weekday", "start_time", "end_time", "slot_minutes", "facility",
+                    "valid_from", "valid_to", "active", "tenant_key")
+    list_filter = ("weekday", "active", "facility")
+    search_fields = ("practitioner__matricule", "practitioner__specialty")
+    raw_id_fields = ("practitioner", "facility", "department")
+    readonly_fields = ("tenant_key",)
+
+
+@admin.register(PractitionerAbsence)
+class PractitionerAbsenceAdmin(admin.ModelAdmin):
+    list_display = ("practitioner", "start_at", "end_at", "reason", "tenant_key")
+    search_fields = ("practitioner__matricule", "reason")
+    raw_id_fields = ("practitioner",)
+    readonly_fields = ("tenant_key",)
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ("kind", "recipient", "provider", "status", "attempts", "next_attempt_at", "sent_at", "tenant_key")
+    list_filter = ("status", "kind", "provider")
+    search_fields = ("recipient", "dedupe_key", "provider_message_id")
+    raw_id_fields = ("facility", "appointment")
+    readonly_fields = ("tenant_key", "dedupe_key", "attempts", "locked_at", "sent_at", "provider_message_id",
+                       "last_error")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 @admin.register(Referral)
 class ReferralAdmin(admin.ModelAdmin):
     list_display = ("from_facility", "to_facility", "patient", "status", "tenant_key", "created_at")
@@ -0,0 +1,276 @@
+# hospital/adt.py
+"""
+ADT (Admission / Transfert / Sortie) : une opération = une transaction.
+
+Chaque mouvement écrit l'EncounterEvent, ferme / ouvre la BedOccupancy et met à jour
+l'Encounter ensemble. Verrous :
+  - la ligne Encounter (FOR UPDATE) sérialise les mouvements d'un même séjour ;
+  - le lit est choisi par SELECT ... FOR UPDATE SKIP LOCKED LIMIT 1 : des admissions
+    simultanées dans le même service prennent des lits différents au lieu de se
+    disputer le premier libre (et de finir en IntegrityError sur uniq_open_bed_occupancy).
+reserve() pose une réservation (occupation RESERVED à durée limitée) sur le meilleur lit
+libre selon les contraintes (salle du sexe du patient, isolement) ; admit() la convertit.
+Les réservations échues sont clôturées par les mouvements du service et par le balayage
+périodique expire_reservations() (hospital.tasks).
+Les tenant_key sont recopiés des lignes parentes verrouillées (séjour, lit) :
+pas de remontée vers Facility à chaque insertion.
+"""
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import census
+from .models import Bed, BedOccupancy, Department, Encounter, EncounterEvent, Patient
+
+Kind = EncounterEvent.Kind
+DEFAULT_HOLD = datetime.timedelta(minutes=30)
+
+
+class ADTError(Exception):
+    """Mouvement refusé (état du séjour, service, lit)."""
+
+
+class InvalidTransition(ADTError):
+    pass
+
+
+class NoBedAvailable(ADTError):
+    pass
+
+
+def _lock_encounter(encounter_id):
+    encounter = Encounter.objects.select_for_update().get(pk=encounter_id)
+    last = (
+        EncounterEvent.objects.filter(encounter_id=encounter_id)
+        .order_by("-effective_at", "-created_at")
+        .values_list("kind", "effective_at")
+        .first()
+    )
+    return encounter, last
+
+
+def _check_time(encounter, last, at):
+    floor = last[1] if last else encounter.start_at
+    if at < floor:
+        raise InvalidTransition(f"Date de mouvement {at:%Y-%m-%d %H:%M} antérieure au dernier mouvement du séjour.")
+
+
+def _check_department(encounter, department_id):
+    if not Department.objects.filter(pk=department_id, facility_id=encounter.facility_id).exists():
+        raise ADTError("Service inconnu dans l'établissement du séjour.")
+
+
+BED_FIELDS = ("pk", "tenant_key", "facility_id", "department_id")
+
+
+def _open_occupancy():
+    return BedOccupancy.objects.filter(bed_id=OuterRef("pk"), to_ts__isnull=True)
+
+
+def _candidates(department_id, sex=None, isolation=None):
+    """
+    Lits actifs du service compatibles, dans l'ordre de préférence :
+      - sex : salles de ce sexe puis mixtes (les salles de l'autre sexe sont exclues) ;
+      - isolation=True : chambres d'isolement uniquement ; False : elles passent en dernier.
+    """
+    beds = Bed.objects.filter(department_id=department_id, active=True)
+    order = []
+    if sex is not None:
+        # Salle mixte : ward_sex vide (NULL, ou "" saisi par l'API / l'admin)
+        beds = beds.filter(Q(ward_sex=sex) | Q(ward_sex__isnull=True) | Q(ward_sex=""))
+        order.append(Case(When(ward_sex=sex, then=Value(0)), default=Value(1), output_field=IntegerField()))
+    if isolation:
+        beds = beds.filter(isolation=True)
+    elif isolation is not None:
+        order.append("isolation")
+    return beds, order + ["code"]
+
+
+def _lock_bed(department_id, bed_id=None, exclude=(), sex=None, isolation=None):
+    """
+    Verrouille un lit libre du service et le retourne (id, tenant_key, facility_id, department_id).
+    Lit imposé : FOR UPDATE (attente courte derrière un autre mouvement sur ce lit).
+    Sinon : meilleur candidat non verrouillé, FOR UPDATE SKIP LOCKED LIMIT 1 ; le NOT EXISTS
+    s'appuie sur l'index partiel des occupations ouvertes (uniq_open_bed_occupancy).
+    Le lit verrouillé est revérifié par une nouvelle instruction : le NOT EXISTS du SELECT
+    a pu être évalué avant le COMMIT de la transaction qui tenait le verrou.
+    """
+    beds, order = _candidates(department_id, sex, isolation)
+    beds = beds.exclude(pk__in=exclude)
+    tried = []
+    while True:
+        if bed_id:
+            bed = beds.filter(pk=bed_id).select_for_update().values_list(*BED_FIELDS).first()
+        else:
+            bed = (
+                beds.exclude(pk__in=tried)
+                .filter(~Exists(_open_occupancy()))
+                .select_for_update(skip_locked=True)
+                .order_by(*order)
+                .values_list(*BED_FIELDS)
+                .first()
+            )
+        if bed is None:
+            raise NoBedAvailable("Aucun lit libre dans ce service." if not bed_id else "Lit inconnu ou inactif dans ce service.")
+        if not BedOccupancy.objects.filter(bed_id=bed[0], to_ts__isnull=True).exists():
+            return bed
+        if bed_id:
+            raise NoBedAvailable("Lit déjà occupé.")
+        tried.append(bed[0])
+
+
+def _occupy(encounter, bed, at):
+    bed_pk, tenant_key, facility_id, department_id = bed
+    BedOccupancy.objects.bulk_create([
+        BedOccupancy(bed_id=bed_pk, patient_id=encounter.patient_id, from_ts=at, tenant_key=tenant_key)
+    ])
+    census.bump(tenant_key, facility_id, department_id, "OCCUPIED", +1)
+
+
+def _current_bed(encounter):
+    """Occupation ouverte du patient : (bed_id, tenant_key, facility_id, department_id, status) ou None."""
+    return (
+        BedOccupancy.objects.filter(patient_id=encounter.patient_id, to_ts__isnull=True)
+        .values_list("bed_id", "bed__tenant_key", "bed__facility_id", "bed__department_id", "status")
+        .first()
+    )
+
+
+def _expire_reservations(now, **filters):
+    """
+    Clôt les réservations échues (filtres : service, patient ; aucun : tous les services),
+    sans attendre celles qu'une autre transaction verrouille. Retourne le nombre clôturé.
+    """
+    expired = list(
+        BedOccupancy.objects.filter(to_ts__isnull=True, status="RESERVED", expires_at__lt=now, **filters)
+        .select_for_update(skip_locked=True, of=("self",))
+        .values_list("pk", "bed__tenant_key", "bed__facility_id", "bed__department_id")
+    )
+    if not expired:
+        return 0
+    BedOccupancy.objects.filter(pk__in=[e[0] for e in expired]).update(
+        to_ts=Greatest(F("expires_at"), F("from_ts")), status="EXPIRED")
+    for department, n in Counter(e[1:] for e in expired).items():
+        census.bump(*department, "RESERVED", -n)
+    return len(expired)
+
+
+@transaction.atomic
+def expire_reservations(now=None):
+    """Balayage périodique (hospital.tasks) : réservations échues de tous les services."""
+    return _expire_reservations(now or timezone.now())
+
+
+def _release(encounter, current, at):
+    BedOccupancy.objects.filter(patient_id=encounter.patient_id, to_ts__isnull=True).update(
+        to_ts=at, status="RELEASED"
+    )
+    _, tenant_key, facility_id, department_id, status = current
+    census.bump(tenant_key, facility_id, department_id, status, -1)
+
+
+def _event(encounter, kind, at, **fields):
+    event = EncounterEvent(encounter_id=encounter.pk, kind=kind, effective_at=at,
+                           tenant_key=encounter.tenant_key, **fields)
+    EncounterEvent.objects.bulk_create([event])
+    return event
+
+
+@transaction.atomic
+def admit(encounter_id, department_id, bed_id=None, at=None, note=None):
+    """Admission dans un service, sur un lit libre (ou le lit demandé)."""
+    at = at or timezone.now()
+    encounter, last = _lock_encounter(encounter_id)
+    if encounter.end_at or last is not None:
+        raise InvalidTransition("Séjour déjà admis ou clôturé.")
+    _check_time(encounter, last, at)
+    _check_department(encounter, department_id)
+    # réservations échues du service : elles ne bloquent plus ses lits
+    _expire_reservations(at, bed__department_id=department_id)
+    current = _current_bed(encounter)
+    if (current is not None and current[4] == "RESERVED" and str(current[3]) == str(department_id)
+            and (bed_id is None or str(bed_id) == str(current[0]))):
+        # lit réservé pour ce patient dans ce service : la réservation devient l'occupation
+        BedOccupancy.objects.filter(bed_id=current[0], to_ts__isnull=True).update(
+            status="OCCUPIED", from_ts=at, expires_at=None)
+        census.bump(*current[1:4], "RESERVED", -1)
+        census.bump(*current[1:4], "OCCUPIED", +1)
+        bed = current[:4]
+    else:
+        if current is not None:  # réservation ailleurs (ou occupation orpheline) : libérée
+            _release(encounter, current, at)
+        bed = _lock_bed(department_id, bed_id)
+        _occupy(encounter, bed, at)
+    event = _event(encounter, Kind.ADMIT, at, to_department_id=department_id, bed_id=bed[0], note=note)
+    Encounter.objects.filter(pk=encounter.pk).update(department_id=department_id, updated_at=timezone.now())
+    return event
+
+
+@transaction.atomic
+def transfer(encounter_id, department_id, bed_id=None, at=None, note=None):
+    """Transfert vers un service (éventuellement le même, autre lit) : libère l'ancien lit."""
+    at = at or timezone.now()
+    encounter, last = _lock_encounter(encounter_id)
+    if encounter.end_at or last is None or last[0] == Kind.DISCHARGE:
+        raise InvalidTransition("Transfert impossible : le séjour n'est pas en cours d'hospitalisation.")
+    _check_time(encounter, last, at)
+    _check_department(encounter, department_id)
+    _expire_reservations(at, bed__department_id=department_id)
+    current = _current_bed(encounter)
+    # le nouveau lit est verrouillé avant de libérer l'ancien (qui ne doit pas être repris)
+    bed = _lock_bed(department_id, bed_id, exclude=[current[0]] if current else ())
+    if current is not None:
+        _release(encounter, current, at)
+    _occupy(encounter, bed, at)
+    event = _event(encounter, Kind.TRANSFER, at, from_department_id=encounter.department_id,
+                   to_department_id=department_id, bed_id=bed[0], note=note)
+    Encounter.objects.filter(pk=encounter.pk).update(department_id=department_id, updated_at=timezone.now())
+    return event
+
+
+@transaction.atomic
+def discharge(encounter_id, at=None, outcome="DISCHARGED", note=None):
+    """Sortie : libère le lit éventuel et clôture le séjour (aussi pour un séjour ambulatoire)."""
+    at = at or timezone.now()
+    encounter, last = _lock_encounter(encounter_id)
+    if encounter.end_at:
+        raise InvalidTransition("Séjour déjà clôturé.")
+    _check_time(encounter, last, at)
+    current = _current_bed(encounter)
+    if current is not None:
+        _release(encounter, current, at)
+    event = _event(encounter, Kind.DISCHARGE, at, from_department_id=encounter.department_id,
+                   bed_id=current[0] if current else None, note=note)
+    Encounter.objects.filter(pk=encounter.pk).update(end_at=at, outcome=outcome, updated_at=timezone.now())
+    return event
+
+
+@transaction.atomic
+def reserve(department_id, patient_id, sex=None, isolation=None, hold=DEFAULT_HOLD):
+    """
+    Réserve le meilleur lit libre du service pour le patient (urgences, admission à venir) :
+    occupation RESERVED jusqu'à maintenant + hold, convertie par admit().
+    sex : contrainte de salle (défaut : sexe du patient) ; isolation : voir _candidates().
+    """
+    now = timezone.now()
+    # verrou patient : deux réservations simultanées pour le même patient se sérialisent
+    patient = Patient.objects.select_for_update().filter(pk=patient_id).values_list("sex").first()
+    if patient is None:
+        raise ADTError("Patient inconnu.")
+    # réservation échue du patient (tout service) : clôturée, elle n'empêche pas d'en poser une
+    _expire_reservations(now, patient_id=patient_id)
+    if (BedOccupancy.objects.filter(patient_id=patient_id, to_ts__isnull=True)
+            .exclude(status="RESERVED", expires_at__lt=now).exists()):
+        raise InvalidTransition("Le patient occupe ou a déjà réservé un lit.")
+    _expire_reservations(now, bed__department_id=department_id)
+    bed = _lock_bed(department_id, sex=sex or patient[0], isolation=isolation)
+    bed_pk, tenant_key, facility_id, _ = bed
+    occupancy = BedOccupancy(bed_id=bed_pk, patient_id=patient_id, from_ts=now, status="RESERVED",
+                             expires_at=now + hold, tenant_key=tenant_key)
+    BedOccupancy.objects.bulk_create([occupancy])
+    census.bump(tenant_key, facility_id, department_id, "RESERVED", +1)
+    return occupancy
@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from hospital.api.views import EncounterViewSet, BedOccupancyViewSet, ProcedureViewSet, DiagnosticReportViewSet, \
-    ObservationViewSet, FacilityViewSet, DepartmentViewSet, PractitionerViewSet, BedViewSet, VisitTypeViewSet
+    ObservationViewSet, FacilityViewSet, DepartmentViewSet, PractitionerViewSet, BedViewSet, VisitTypeViewSet, \
+    PractitionerScheduleViewSet, PractitionerAbsenceViewSet
 
 router = DefaultRouter()
 
@@ -15,6 +16,8 @@ router.register(r"observations", ObservationViewSet, basename="observation")
 router.register(r"facilities", FacilityViewSet, basename="facility")
 router.register(r"departments", DepartmentViewSet, basename="department")
 router.register(r"practitioners", PractitionerViewSet, basename="practitioner")
+router.register(r"practitioner-schedules", PractitionerScheduleViewSet, basename="practitioner-schedule")
+router.register(r"practitioner-absences", PractitionerAbsenceViewSet, basename="practitioner-absence")
 router.register(r"beds", BedViewSet, basename="bed")
 router.register(r"visit-types", VisitTypeViewSet, basename="visit-type")
 
@@ -1,43 +1,128 @@
-from rest_framework import viewsets
+import datetime
+
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from api.filters import EncounterFilter, ObservationFilter
+from api.pagination import EncounterKeysetPagination, ObservationKeysetPagination
 from api.permissions import IsStaff, StaffOrReadOnly
 from api.serializers import EncounterSerializer, BedOccupancySerializer, ProcedureSerializer, ReferralSerializer, \
     ObservationSerializer, DiagnosticReportSerializer, VisitTypeSerializer, PractitionerSerializer, BedSerializer, \
-    FacilitySerializer, DepartmentSerializer
+    FacilitySerializer, DepartmentSerializer, ADTMoveSerializer, ADTDischargeSerializer, BedCensusQuerySerializer, \
+    BedAllocateSerializer, PractitionerScheduleSerializer, PractitionerAbsenceSerializer
 from api.views import DefaultsMixin
+from hospital import adt, census
 from hospital.models import Encounter, BedOccupancy, Procedure, Referral, Observation, DiagnosticReport, VisitType, \
-    Practitioner, Bed, Facility, Department
+    Practitioner, Bed, Facility, Department, PractitionerSchedule, PractitionerAbsence
 
 
 class FacilityViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Facility.objects.select_related("parent", "region", "district", "commune").all().order_by("name")
+    queryset = Facility.objects.all().order_by("name")
     serializer_class = FacilitySerializer
     permission_classes = [StaffOrReadOnly]
-    search_fields = ("name", "code", "type")
+    search_fields = ("name", "code", "type__name")
+    rls_scoped = False
 
 
 class DepartmentViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Department.objects.select_related("facility").all().order_by("name")
+    queryset = Department.objects.all().order_by("name")
     serializer_class = DepartmentSerializer
     permission_classes = [IsStaff]
     search_fields = ("name", "code", "facility__code")
 
 class PractitionerViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Practitioner.objects.select_related("facility", "department").all().order_by("matricule")
+    queryset = Practitioner.objects.all().order_by("matricule")
     serializer_class = PractitionerSerializer
     permission_classes = [IsStaff]
     search_fields = ("matricule", "specialty", "facility__code")
 
 
+class PractitionerScheduleViewSet(DefaultsMixin, viewsets.ModelViewSet):
+    queryset = PractitionerSchedule.objects.all().order_by("practitioner", "weekday", "start_time")
+    serializer_class = PractitionerScheduleSerializer
+    permission_classes = [IsStaff]
+    filterset_fields = ("practitioner", "facility", "department", "weekday", "active")
+    search_fields = ("practitioner__matricule", "practitioner__specialty")
+
+
+class PractitionerAbsenceViewSet(DefaultsMixin, viewsets.ModelViewSet):
+    queryset = PractitionerAbsence.objects.all()
+    serializer_class = PractitionerAbsenceSerializer
+    permission_classes = [IsStaff]
+    filterset_fields = ("practitioner",)
+    search_fields = ("practitioner__matricule", "reason")
+    ordering = ("-start_at",)
+
+
 class BedViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Bed.objects.select_related("facility", "department").all().order_by("code")
+    queryset = Bed.objects.all().order_by("code")
     serializer_class = BedSerializer
     permission_classes = [IsStaff]
     search_fields = ("code", "department__name", "facility__code")
 
+    # Lits créés / déplacés / (dés)activés : recensement de l'établissement recalculé au COMMIT
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        census.reconcile_on_commit(serializer.instance.facility_id)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.facility_id
+        super().perform_update(serializer)
+        for facility_id in {previous, serializer.instance.facility_id}:
+            census.reconcile_on_commit(facility_id)
+
+    def perform_destroy(self, instance):
+        facility_id = instance.facility_id
+        super().perform_destroy(instance)
+        census.reconcile_on_commit(facility_id)
+
+    @action(detail=False, methods=["post"], url_path="allocate")
+    def allocate(self, request):
+        """
+        Réserve le meilleur lit libre d'un service pour un patient (hospital.adt.reserve) :
+        {"department": id, "patient": id, "sex": "M|F"?, "isolation": bool?, "hold_minutes": 30?}
+        -> lit + réservation ; aucun lit compatible -> 409.
+        """
+        params = BedAllocateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        try:
+            occupancy = adt.reserve(data["department"], data["patient"], sex=data.get("sex"),
+                                    isolation=data["isolation"],
+                                    hold=datetime.timedelta(minutes=data["hold_minutes"]))
+        except adt.ADTError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        bed = self.get_queryset().get(pk=occupancy.bed_id)
+        return Response({
+            "bed": self.get_serializer(bed).data,
+            "occupancy": occupancy.pk,
+            "expires_at": occupancy.expires_at,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"], url_path="census")
+    def facility_census(self, request):
+        """
+        Recensement d'un établissement : ?facility=<id>
+        Par service : total, occupied, reserved, blocked, free (compteurs Redis, O(services)).
+        """
+        params = BedCensusQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        facility_id = params.validated_data["facility"]
+        departments = list(
+            Department.objects.filter(facility_id=facility_id).order_by("name")
+            .values_list("pk", "name", "tenant_key")
+        )
+        if not departments:
+            return Response({"detail": "Établissement inconnu ou sans service."}, status=status.HTTP_404_NOT_FOUND)
+        counts, source = census.facility_census(departments[0][2], facility_id)
+        data = []
+        for pk, name, _ in departments:
+            c = counts.get(str(pk), dict.fromkeys(census.COUNTERS, 0))
+            free = max(c["total"] - c["occupied"] - c["reserved"] - c["blocked"], 0)
+            data.append({"department": pk, "name": name, **c, "free": free})
+        return Response({"facility": facility_id, "source": source, "departments": data})
+
 
 # ------------- Clinical -------------
 class VisitTypeViewSet(DefaultsMixin, viewsets.ModelViewSet):
@@ -45,37 +130,78 @@ class VisitTypeViewSet(DefaultsMixin, viewsets.ModelViewSet):
     serializer_class = VisitTypeSerializer
     permission_classes = [StaffOrReadOnly]
     search_fields = ("code", "label", "category")
+    rls_scoped = False
     ordering = ("sort_order", "code")
 
 
 class EncounterViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Encounter.objects.select_related("patient", "facility", "department").all()
+    queryset = Encounter.objects.all()
     serializer_class = EncounterSerializer
     permission_classes = [IsStaff]
     filterset_class = EncounterFilter
-    search_fields = ("patient__mpi", "facility__code", "visit_type")
+    pagination_class = EncounterKeysetPagination
+    search_fields = ("patient__mpi", "facility__code", "visit_type__code")
+    query_budget = 12  # auth + scope + page (+ validation des FK en écriture) ; au-delà : N+1
     ordering = ("-start_at",)
 
+    def _adt(self, request, move, params_class, to_kwargs):
+        """Mouvement ADT atomique (hospital.adt) puis séjour à jour ; refus métier -> 409."""
+        obj = self.get_object()
+        params = params_class(data=request.data)
+        params.is_valid(raise_exception=True)
+        try:
+            move(obj.pk, **to_kwargs(params.validated_data))
+        except adt.ADTError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=["post"], url_path="admit")
+    def admit(self, request, pk=None):
+        """{"department": id, "bed": id?, "at": iso?, "note": ...} ; sans lit : premier lit libre."""
+        return self._adt(request, adt.admit, ADTMoveSerializer, _move_kwargs)
+
+    @action(detail=True, methods=["post"], url_path="transfer")
+    def transfer(self, request, pk=None):
+        return self._adt(request, adt.transfer, ADTMoveSerializer, _move_kwargs)
+
     @action(detail=True, methods=["post"], url_path="discharge")
     def discharge(self, request, pk=None):
-        obj = self.get_object()
-        if obj.end_at:
-            return Response({"detail": "Already closed."}, status=400)
-        obj.end_at = request.data.get("end_at") or obj.end_at or obj.start_at
-        obj.outcome = request.data.get("outcome", "DISCHARGED")
-        obj.save()
-        return Response(self.get_serializer(obj).data)
+        return self._adt(request, adt.discharge, ADTDischargeSerializer, _discharge_kwargs)
+
+
+def _move_kwargs(data):
+    return {"department_id": data["department"], "bed_id": data.get("bed"),
+            "at": data.get("at"), "note": data.get("note")}
+
+
+def _discharge_kwargs(data):
+    return {"at": data.get("at") or data.get("end_at"), "outcome": data["outcome"], "note": data.get("note")}
 
 
 class BedOccupancyViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = BedOccupancy.objects.select_related("bed", "patient").all()
+    queryset = BedOccupancy.objects.all()
     serializer_class = BedOccupancySerializer
     permission_classes = [IsStaff]
     ordering = ("-from_ts",)
 
+    # Saisies directes (hors hospital.adt) : répercutées sur le recensement des lits
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        census.occupancy_changed(None, serializer.instance)
+
+    def perform_update(self, serializer):
+        before = BedOccupancy(bed_id=serializer.instance.bed_id, to_ts=serializer.instance.to_ts,
+                              status=serializer.instance.status)
+        super().perform_update(serializer)
+        census.occupancy_changed(before, serializer.instance)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        census.occupancy_changed(instance, None)
+
 
 class ProcedureViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Procedure.objects.select_related("encounter", "performer").all()
+    queryset = Procedure.objects.all()
     serializer_class = ProcedureSerializer
     permission_classes = [IsStaff]
     search_fields = ("code", "name", "encounter__patient__mpi")
@@ -83,7 +209,7 @@ class ProcedureViewSet(DefaultsMixin, viewsets.ModelViewSet):
 
 
 class DiagnosticReportViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = DiagnosticReport.objects.select_related("encounter").all()
+    queryset = DiagnosticReport.objects.all()
     serializer_class = DiagnosticReportSerializer
     permission_classes = [IsStaff]
     search_fields = ("modality", "status", "encounter__patient__mpi")
@@ -91,16 +217,17 @@ class DiagnosticReportViewSet(DefaultsMixin, viewsets.ModelViewSet):
 
 
 class ObservationViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Observation.objects.select_related("encounter", "report").all()
+    queryset = Observation.objects.all()
     serializer_class = ObservationSerializer
     permission_classes = [IsStaff]
     filterset_class = ObservationFilter
+    pagination_class = ObservationKeysetPagination
     search_fields = ("loinc_code", "encounter__patient__mpi")
     ordering = ("-observed_at",)
 
 
 class ReferralViewSet(DefaultsMixin, viewsets.ModelViewSet):
-    queryset = Referral.objects.select_related("from_facility", "to_facility", "patient").all()
+    queryset = Referral.objects.all()
     serializer_class = ReferralSerializer
     permission_classes = [IsStaff]
     search_fields = ("status", "patient__mpi", "from_facility__code", "to_facility__code")
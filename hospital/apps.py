@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HospitalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hospital'
+
+    def ready(self):
+        # Enregistre le system check du plan de chargement des viewsets (api.checks)
+        from api import checks  # noqa: F401
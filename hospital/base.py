@@ -22,29 +22,114 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+def _chunks(iterable, size):
+    buf = []
+    for obj in iterable:
+        buf.append(obj)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+class TenantScopedQuerySet(models.QuerySet):
+    """
+    QuerySet des modèles scopés : ajoute un chemin d'ingestion en masse qui dérive
+    tenant_key pour des milliers de lignes sans passer par save() ligne à ligne.
+    """
+
+    def _fill_tenant_keys(self, objs, cache):
+        """
+        Résout tenant_key pour un lot d'objets :
+          - regroupe les parents distincts (1er maillon de TENANT_KEY_SOURCE)
+          - une seule requête values_list(<pk parent>, <reste du chemin>) pour ceux non encore en cache
+        Ex: Observation -> "encounter__facility__root_code" => Encounter(id, facility__root_code).
+        """
+        fk_name, _, rest = self.model.tenant_key_source().partition("__")
+        field = self.model._meta.get_field(fk_name)
+        target = field.target_field
+
+        missing = {getattr(o, field.attname) for o in objs} - cache.keys() - {None}
+        if missing:
+            cache.update(
+                field.related_model._base_manager
+                .filter(**{f"{target.name}__in": missing})
+                .values_list(target.name, rest)
+            )
+
+        unresolved = []
+        for obj in objs:
+            key = cache.get(getattr(obj, field.attname))
+            if not key:
+                unresolved.append(obj)
+                continue
+            obj.tenant_key = key
+        if unresolved:
+            raise ValidationError(
+                f"tenant_key n'a pas pu être dérivé pour {len(unresolved)} ligne(s) "
+                f"{self.model.__name__} (chemin '{self.model.tenant_key_source()}')."
+            )
+
+    def bulk_ingest(self, objs, batch_size=5000, **kwargs):
+        """
+        Insertion en masse tenant-aware (les objets peuvent venir d'un générateur) :
+          - dérive tenant_key par lot (1 requête par lot pour les parents non vus)
+          - insère via bulk_create ; kwargs transmis tels quels, donc
+            ignore_conflicts=True        -> INSERT ... ON CONFLICT DO NOTHING
+            update_conflicts=True, unique_fields=[...], update_fields=[...]
+                                         -> INSERT ... ON CONFLICT DO UPDATE (upsert)
+        Retourne le nombre de lignes envoyées.
+        """
+        cache = {}
+        sent = 0
+        for chunk in _chunks(objs, batch_size):
+            self._fill_tenant_keys(chunk, cache)
+            self.bulk_create(chunk, batch_size=batch_size, **kwargs)
+            sent += len(chunk)
+        return sent
+
+
 class TenantScopedModel(models.Model):
     """
     Mixin pour 'scoper' un enregistrement par établissement (facility).
-    - Remplit automatiquement tenant_key à partir de <TENANT_FK_FIELD>.code (par défaut 'facility')
+    - Remplit automatiquement tenant_key en suivant TENANT_KEY_SOURCE
+      (par défaut '<TENANT_FK_FIELD>__root_code', soit le code de l'établissement racine)
     - Empêche l'édition manuelle de tenant_key
     - Valide la cohérence à l'enregistrement
+    - objects.bulk_ingest(...) pour les chargements en masse
     """
     tenant_key = models.CharField(max_length=64, db_index=True, editable=False)
 
     # Si un modèle utilise un autre nom de FK (ex: 'hospital'), override cette constante:
     # TENANT_FK_FIELD = "hospital"
     TENANT_FK_FIELD = "facility"
+    # Chemin (syntaxe ORM) vers la valeur du tenant_key, si elle ne vient pas directement
+    # de TENANT_FK_FIELD. Ex: TENANT_KEY_SOURCE = "encounter__facility__root_code"
+    TENANT_KEY_SOURCE = None
+
+    objects = TenantScopedQuerySet.as_manager()
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def tenant_key_source(cls):
+        return cls.TENANT_KEY_SOURCE or f"{cls.TENANT_FK_FIELD}__root_code"
+
     def _derive_tenant_key(self):
-        fk_name = getattr(self, "TENANT_FK_FIELD", "facility")
-        fac = getattr(self, fk_name, None)
-        if fac is not None:
-            root = fac.root() if hasattr(fac, "root") else fac
-            if getattr(root, "code", None):
-                self.tenant_key = root.code
+        *hops, attr = self.tenant_key_source().split("__")
+        node = self
+        for hop in hops:
+            if getattr(node, f"{hop}_id", None) is None:
+                return
+            node = getattr(node, hop)
+        value = getattr(node, attr, None)
+        if not value and hasattr(node, "root"):
+            # Facility pas encore matérialisée : remontée classique
+            value = node.root().code
+        if value:
+            self.tenant_key = value
 
     def clean(self):
         # Assure le remplissage avant validation et lève une erreur si impossible
@@ -52,7 +137,7 @@ class TenantScopedModel(models.Model):
         if not self.tenant_key:
             raise ValidationError(
                 "tenant_key n'a pas pu être dérivé : vérifie que la FK 'facility' "
-                "(ou TENANT_FK_FIELD) est renseignée et que Facility.code est défini."
+                "(ou TENANT_KEY_SOURCE) est renseignée et que Facility.code est défini."
             )
 
     def save(self, *args, **kwargs):
@@ -0,0 +1,66 @@
+# hospital/billing.py
+"""
+Agrégats de facturation tenus par la base (migration 0013) :
+
+  InvoiceLine.amount  = qty * unit_price         trigger BEFORE INSERT / UPDATE (par ligne)
+  Invoice.total       = Σ InvoiceLine.amount     triggers AFTER INSERT / UPDATE / DELETE par
+                                                 instruction : un UPDATE par facture touchée,
+                                                 par delta (tables de transition), même pour
+                                                 un bulk_create de milliers de lignes.
+
+Les deltas s'appliquent sous le verrou de ligne de la facture : deux transactions qui
+ajoutent des lignes à la même facture se sérialisent sans perdre de mise à jour.
+recompute_totals() sert au rattrapage (triggers désactivés, restauration partielle, import brut).
+"""
+from django.db import connection, transaction
+
+from .models import Invoice, InvoiceLine
+
+BATCH_SQL = """
+SELECT id FROM {invoice}
+WHERE id > %s
+ORDER BY id
+LIMIT %s
+FOR UPDATE
+"""
+
+FIX_AMOUNTS_SQL = """
+UPDATE {line} SET amount = qty * unit_price
+WHERE invoice_id = ANY(%s::uuid[]) AND amount IS DISTINCT FROM qty * unit_price
+"""
+
+FIX_TOTALS_SQL = """
+UPDATE {invoice} i
+SET total = s.total
+FROM (
+    SELECT b.id, coalesce(sum(l.amount), 0) AS total
+    FROM unnest(%s::uuid[]) AS b(id)
+    LEFT JOIN {line} l ON l.invoice_id = b.id
+    GROUP BY b.id
+) s
+WHERE i.id = s.id AND i.total IS DISTINCT FROM s.total
+"""
+
+
+def recompute_totals(batch_size=1000, after=None):
+    """
+    Recalcule InvoiceLine.amount puis Invoice.total, par lots de factures (ordre des ids,
+    une transaction par lot). Les factures du lot sont verrouillées avant le calcul : une
+    ligne ajoutée en parallèle est soit vue par la somme, soit appliquée par son trigger
+    après nous — jamais perdue.
+    Générateur : (dernier id traité, lignes corrigées, factures corrigées) par lot.
+    """
+    invoice, line = Invoice._meta.db_table, InvoiceLine._meta.db_table
+    last = after or "00000000-0000-0000-0000-000000000000"
+    while True:
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(BATCH_SQL.format(invoice=invoice), [last, batch_size])
+            ids = [str(row[0]) for row in cur.fetchall()]
+            if not ids:
+                return
+            cur.execute(FIX_AMOUNTS_SQL.format(line=line), [ids])
+            lines_fixed = cur.rowcount
+            cur.execute(FIX_TOTALS_SQL.format(invoice=invoice, line=line), [ids])
+            totals_fixed = cur.rowcount
+        last = ids[-1]
+        yield last, lines_fixed, totals_fixed
@@ -0,0 +1,181 @@
+# hospital/census.py
+"""
+Recensement des lits par service, tenu à jour dans Redis.
+
+Un hash par établissement : sigh:census:<tenant_key>:<facility_id>
+  champs "<department_id>:total|occupied|reserved|blocked" (+ "_ok" posé par la réconciliation).
+Les mouvements ADT ajustent les compteurs par HINCRBY, après COMMIT seulement
+(transaction.on_commit) : un rollback ne laisse pas de compteur faux.
+La réconciliation (commande reconcile_bed_census, périodique) recalcule depuis Postgres
+et réécrit les hashes ; c'est aussi le chemin de repli quand Redis est vide ou indisponible.
+Les modifications de lits (création, activation, changement de service) et les écritures
+directes d'occupations déclenchent une réconciliation de l'établissement concerné.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q
+from django_redis import get_redis_connection
+from prometheus_client import Counter as PromCounter
+from redis.exceptions import RedisError
+
+from .models import Bed
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "sigh:census"
+READY = "_ok"
+COUNTERS = ("total", "occupied", "reserved", "blocked")
+# statut d'une occupation ouverte -> compteur
+STATUS_COUNTER = {"OCCUPIED": "occupied", "RESERVED": "reserved", "BLOCKED": "blocked"}
+
+CENSUS_CORRECTIONS = PromCounter(
+    "sigh_bed_census_corrections",
+    "Compteurs du recensement des lits corrigés par la réconciliation (dérive Redis / Postgres)",
+)
+
+
+def _key(tenant_key, facility_id):
+    return f"{KEY_PREFIX}:{tenant_key}:{facility_id}"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def bump(tenant_key, facility_id, department_id, status, delta):
+    """+1 / -1 sur le compteur du statut, appliqué au COMMIT de la transaction courante."""
+    counter = STATUS_COUNTER.get(status)
+    if counter is None:
+        return
+    key, field = _key(tenant_key, facility_id), f"{department_id}:{counter}"
+
+    def apply():
+        try:
+            _redis().hincrby(key, field, delta)
+        except RedisError:
+            logger.warning("Recensement des lits : Redis indisponible, %s %s non appliqué", key, field)
+
+    transaction.on_commit(apply)
+
+
+def reconcile_on_commit(facility_id):
+    """Réconciliation d'un établissement après COMMIT (changements rares : lits, saisies manuelles)."""
+    def apply():
+        try:
+            reconcile(facility_id)
+        except RedisError:
+            logger.warning("Recensement des lits : Redis indisponible, réconciliation de %s reportée", facility_id)
+
+    transaction.on_commit(apply)
+
+
+def compute(facility_id=None):
+    """
+    Recensement depuis Postgres : {(tenant_key, facility_id): {department_id: {compteur: n}}}.
+    Une requête : lits LEFT JOIN occupations ouvertes (au plus une par lit, jointure
+    restreinte à to_ts IS NULL : l'historique n'est pas parcouru), groupés par service.
+    """
+    beds = Bed.objects.annotate(
+        open_occupancy=FilteredRelation("bedoccupancy", condition=Q(bedoccupancy__to_ts__isnull=True)),
+    )
+    if facility_id is not None:
+        beds = beds.filter(facility_id=facility_id)
+    rows = beds.values("tenant_key", "facility_id", "department_id").annotate(
+        total=Count("pk", filter=Q(active=True)),
+        **{
+            counter: Count("open_occupancy", filter=Q(open_occupancy__status=status))
+            for status, counter in STATUS_COUNTER.items()
+        },
+    ).order_by()
+    census = {}
+    for row in rows:
+        facility = census.setdefault((row["tenant_key"], row["facility_id"]), {})
+        facility[row["department_id"]] = {c: row[c] for c in COUNTERS}
+    return census
+
+
+def _flatten(departments):
+    fields = {f"{dept}:{counter}": n for dept, counts in departments.items() for counter, n in counts.items()}
+    fields[READY] = 1
+    return fields
+
+
+def reconcile(facility_id=None):
+    """
+    Réécrit les hashes Redis depuis Postgres ; retourne le nombre de compteurs corrigés.
+    Un mouvement validé entre le calcul et l'écriture peut être perdu : la dérive est bornée
+    à une période de réconciliation.
+    """
+    census = compute(facility_id)
+    r = _redis()
+    corrected = 0
+    for (tenant_key, facility), departments in census.items():
+        key = _key(tenant_key, facility)
+        fields = _flatten(departments)
+        current = {k.decode(): int(v) for k, v in r.hgetall(key).items()}
+        if current.get(READY):
+            corrected += sum(1 for k, v in fields.items() if current.get(k, 0) != v)
+            corrected += sum(1 for k, v in current.items() if k not in fields and v)
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=fields)
+        pipe.execute()
+    if corrected:
+        CENSUS_CORRECTIONS.inc(corrected)
+    return corrected
+
+
+def _unflatten(fields):
+    departments = {}
+    for field, value in fields.items():
+        if field == READY:
+            continue
+        dept, _, counter = field.rpartition(":")
+        departments.setdefault(dept, dict.fromkeys(COUNTERS, 0))[counter] = int(value)
+    return departments
+
+
+def facility_census(tenant_key, facility_id):
+    """
+    Compteurs par service d'un établissement : {department_id (str): {compteur: n}}, source.
+    Un HGETALL ; si le hash n'a jamais été réconcilié (ou Redis est indisponible) : Postgres.
+    """
+    try:
+        r = _redis()
+        fields = {k.decode(): v for k, v in r.hgetall(_key(tenant_key, facility_id)).items()}
+        if READY not in fields:
+            reconcile(facility_id)
+            fields = {k.decode(): v for k, v in r.hgetall(_key(tenant_key, facility_id)).items()}
+        return _unflatten(fields), "redis"
+    except RedisError:
+        logger.warning("Recensement des lits : Redis indisponible, calcul depuis Postgres")
+    departments = next(iter(compute(facility_id).values()), {})
+    return {str(d): counts for d, counts in departments.items()}, "postgres"
+
+
+def occupancy_changed(before, after):
+    """
+    Écriture directe d'une BedOccupancy (API) : ajuste les compteurs si seul l'état ouvert /
+    fermé ou le statut change sur le même lit, sinon réconcilie l'établissement.
+    before / after : BedOccupancy (ou None pour une création / suppression).
+    """
+    def state(occ):
+        if occ is None or occ.to_ts is not None:
+            return None
+        return occ.bed_id, occ.status
+
+    old, new = state(before), state(after)
+    if old == new:
+        return
+    occ = after or before
+    bed = Bed.objects.filter(pk=occ.bed_id).values_list("tenant_key", "facility_id", "department_id").first()
+    if bed is None:
+        return
+    if old is not None and new is not None and old[0] != new[0]:
+        reconcile_on_commit(bed[1])
+        return
+    if old is not None:
+        bump(*bed, old[1], -1)
+    if new is not None:
+        bump(*bed, new[1], +1)
@@ -0,0 +1,213 @@
+# hospital/kinship.py
+"""
+Graphe familial : chargement en masse des liens Kinship et parcours.
+
+Parcours du graphe familial (vue hospital_patient_edge : Kinship + father/mother).
+
+Une seule CTE récursive, en largeur depuis le patient. Protection contre les cycles :
+UNION (et non UNION ALL) sur (patient, profondeur, prédécesseur, relation) et profondeur
+bornée — le nombre de lignes reste ≤ profondeur x arêtes, là où l'énumération des chemins
+exploserait sur une fratrie nombreuse (liens SIBLING_OF symétriques). Chaque parent est
+rendu à sa distance minimale avec un plus court chemin reconstruit depuis les prédécesseurs.
+"""
+import csv
+import datetime
+import json
+import uuid
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Kinship, Patient
+
+MAX_DEPTH = 6
+
+RELATIVES_SQL = """
+WITH RECURSIVE walk (patient_id, depth, via, relation) AS (
+    SELECT %(root)s::uuid, 0, NULL::uuid, NULL::varchar
+  UNION
+    SELECT e.dst_id, w.depth + 1, w.patient_id, e.relation::varchar
+    FROM walk w
+    JOIN hospital_patient_edge e ON e.src_id = w.patient_id
+    WHERE w.depth < %(depth)s
+      AND e.dst_id <> %(root)s::uuid
+      AND (e.valid_to IS NULL OR e.valid_to >= CURRENT_DATE)
+      AND (%(relations)s::varchar[] IS NULL OR e.relation = ANY (%(relations)s::varchar[]))
+)
+SELECT patient_id, depth, via, relation
+FROM walk
+WHERE depth > 0
+ORDER BY depth
+"""
+
+
+def relatives(patient_id, depth=2, relations=None):
+    """
+    [{"patient_id", "degree", "path", "relations"}, ...] des parents jusqu'à `depth` degrés,
+    triés par degré. `path` : patients traversés (le parent inclus), `relations` : arêtes suivies.
+    `relations` restreint les arêtes parcourues (ex: ["PARENT_OF", "CHILD_OF"]).
+    """
+    depth = max(1, min(int(depth), MAX_DEPTH))
+    with connection.cursor() as cur:
+        cur.execute(RELATIVES_SQL, {"root": str(patient_id), "depth": depth, "relations": relations or None})
+        rows = cur.fetchall()
+
+    # Premier passage à chaque patient (lignes triées par profondeur) = distance minimale ;
+    # son prédécesseur, vu à la profondeur précédente, donne un plus court chemin.
+    best = {}
+    for pid, degree, via, relation in rows:
+        if pid in best:
+            continue
+        if degree == 1 or best.get(via, (None,))[0] == degree - 1:
+            best[pid] = (degree, via, relation)
+
+    result = []
+    for pid, (degree, via, relation) in best.items():
+        path, rels = [pid], [relation]
+        while via in best:
+            path.append(via)
+            _, via, rel = best[via]
+            rels.append(rel)
+        result.append({
+            "patient_id": pid,
+            "degree": degree,
+            "path": path[::-1],
+            "relations": rels[::-1],
+        })
+    result.sort(key=lambda r: (r["degree"], str(r["patient_id"])))
+    return result
+
+
+# --------- Chargement en masse ---------
+INSERT_EDGES_SQL = (
+    f"INSERT INTO {Kinship._meta.db_table} "
+    "(id, created_at, updated_at, src_id, dst_id, relation, valid_from, valid_to) VALUES {values} "
+    "ON CONFLICT (src_id, dst_id, relation) DO NOTHING RETURNING 1"
+)
+
+
+def _with_inverses(edges):
+    """
+    Arêtes canoniques + réciproques (Kinship.inverse_of), dédoublonnées sur
+    (src, dst, relation) — la contrainte unique_together — et sans boucle src == dst.
+    """
+    out = {}
+    for src, dst, relation, valid_from, valid_to in edges:
+        if src == dst:
+            continue
+        out.setdefault((src, dst, relation), (valid_from, valid_to))
+        inverse = Kinship.inverse_of(relation)
+        if inverse:
+            out.setdefault((dst, src, inverse), (valid_from, valid_to))
+    return [(src, dst, rel, vf, vt) for (src, dst, rel), (vf, vt) in out.items()]
+
+
+def link_edges(edges):
+    """
+    Écrit des liens (src_id, dst_id, relation, valid_from, valid_to) et leurs réciproques
+    en UN INSERT ... ON CONFLICT DO NOTHING. Les liens existants sont ignorés.
+    Renvoie (arêtes soumises, arêtes réellement insérées).
+    """
+    rows = _with_inverses(edges)
+    if not rows:
+        return 0, 0
+    now = timezone.now()
+    params = []
+    for src, dst, relation, valid_from, valid_to in rows:
+        params += [uuid.uuid4(), now, now, src, dst, relation, valid_from, valid_to]
+    sql = INSERT_EDGES_SQL.format(values=", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows)))
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        inserted = len(cur.fetchall())
+    return len(rows), inserted
+
+
+def read_links(stream, fmt):
+    """
+    Lecture en flux d'un fichier de liens familiaux (état civil), un dict par lien :
+    src_mpi, dst_mpi, relation, [valid_from], [valid_to] (dates ISO).
+      - fmt="csv"    : en-tête avec ces colonnes
+      - fmt="ndjson" : un objet JSON par ligne
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Format inconnu : {fmt}")
+
+
+class LinkImportStats:
+    def __init__(self):
+        self.read = self.submitted = self.inserted = self.rejected = 0
+
+    @property
+    def existing(self):
+        return self.submitted - self.inserted
+
+
+def _iso_date(value):
+    """'' / None -> None ; date ISO -> date ; sinon ValueError."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Date invalide : {value!r}")
+    return datetime.date.fromisoformat(value.strip()) if value.strip() else None
+
+
+def _resolve_chunk(records, stats):
+    """
+    MPI -> id (une requête par lot) ; lignes invalides (relation, dates mal formées ou
+    valid_from > valid_to) ou MPI inconnus comptés en rejet, sans interrompre le lot.
+    """
+    mpis = {r.get("src_mpi") for r in records} | {r.get("dst_mpi") for r in records}
+    ids = dict(Patient.objects.filter(mpi__in=[m for m in mpis if m]).values_list("mpi", "id"))
+    relations = set(Kinship.Relation.values)
+    edges = []
+    for r in records:
+        src, dst = ids.get(r.get("src_mpi")), ids.get(r.get("dst_mpi"))
+        relation = (r.get("relation") or "").strip().upper()
+        try:
+            valid_from, valid_to = _iso_date(r.get("valid_from")), _iso_date(r.get("valid_to"))
+            dates_ok = not (valid_from and valid_to and valid_from > valid_to)
+        except ValueError:
+            valid_from = valid_to = None
+            dates_ok = False
+        if src is None or dst is None or relation not in relations or not dates_ok:
+            stats.rejected += 1
+            continue
+        edges.append((src, dst, relation, valid_from, valid_to))
+    return edges
+
+
+def import_links(records, chunk_size=5000, progress=None):
+    """
+    Importe un flux de liens (cf. read_links) par lots de `chunk_size` lignes :
+    une requête de résolution des MPI + un INSERT ... ON CONFLICT DO NOTHING par lot,
+    chaque lot dans sa propre transaction. `progress(stats)` est appelé après chaque lot.
+    """
+    stats = LinkImportStats()
+    chunk = []
+
+    def flush():
+        with transaction.atomic():
+            submitted, inserted = link_edges(_resolve_chunk(chunk, stats))
+        stats.submitted += submitted
+        stats.inserted += inserted
+        chunk.clear()
+        if progress:
+            progress(stats)
+
+    for record in records:
+        stats.read += 1
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return stats
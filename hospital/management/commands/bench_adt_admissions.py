@@ -0,0 +1,122 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.bench import run_concurrently
+from hospital import adt, census
+from hospital.models import Bed, BedOccupancy, Department, Encounter, EncounterEvent, Facility, Patient, VisitType
+
+
+def _naive_admit(encounter, department_id):
+    """
+    Avant : premier lit libre sans verrou, puis INSERT ; la contrainte uniq_open_bed_occupancy
+    tranche les collisions (IntegrityError) et le client réessaie.
+    Retourne le nombre de collisions subies.
+    """
+    conflicts = 0
+    while True:
+        try:
+            with transaction.atomic():
+                bed = (
+                    Bed.objects.filter(department_id=department_id, active=True)
+                    .filter(~Exists(BedOccupancy.objects.filter(bed_id=OuterRef("pk"), to_ts__isnull=True)))
+                    .order_by("code")
+                    .values_list("pk", "tenant_key")
+                    .first()
+                )
+                if bed is None:
+                    raise adt.NoBedAvailable()
+                now = timezone.now()
+                BedOccupancy.objects.bulk_create([BedOccupancy(
+                    bed_id=bed[0], patient_id=encounter.patient_id, from_ts=now, tenant_key=bed[1])])
+                EncounterEvent.objects.bulk_create([EncounterEvent(
+                    encounter_id=encounter.pk, kind=EncounterEvent.Kind.ADMIT, effective_at=now,
+                    to_department_id=department_id, bed_id=bed[0], tenant_key=encounter.tenant_key)])
+                Encounter.objects.filter(pk=encounter.pk).update(department_id=department_id)
+            return conflicts
+        except IntegrityError:
+            conflicts += 1
+
+
+def _service_admit(encounter, department_id):
+    adt.admit(encounter.pk, department_id)
+    return 0
+
+
+def bench_department(facility_id, run_id):
+    """Service temporaire dédié au banc : les lits réels de l'établissement ne sont pas touchés."""
+    try:
+        facility_id = uuid.UUID(str(facility_id))
+    except ValueError:
+        raise CommandError("Identifiant d'établissement invalide.")
+    if not Facility.objects.filter(pk=facility_id).exists():
+        raise CommandError("Établissement introuvable.")
+    department = Department(facility_id=facility_id, name=f"BENCH-{run_id}", code=f"BENCH-{run_id}")
+    Department.objects.bulk_ingest([department])
+    return department
+
+
+class Command(BaseCommand):
+    help = (
+        "Admissions simultanées dans un même service : premier lit libre + réessai sur "
+        "IntegrityError (avant) contre hospital.adt.admit (SKIP LOCKED). "
+        "Crée un service temporaire avec ses lits / patients / séjours dans l'établissement donné, "
+        "puis les supprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("facility", help="id de l'établissement hôte du banc")
+        parser.add_argument("--admissions", type=int, default=300)
+        parser.add_argument("--beds", type=int, default=None, help="défaut : autant que d'admissions")
+        parser.add_argument("--concurrency", type=int, default=64, help="connexions simultanées")
+
+    def handle(self, *args, **opts):
+        n = opts["admissions"]
+        beds = opts["beds"] or n
+        run_id = uuid.uuid4().hex[:8]
+        department = bench_department(opts["facility"], run_id)
+        visit_type, _ = VisitType.objects.get_or_create(code="BENCH", defaults={"label": "Banc ADT", "active": False})
+
+        Bed.objects.bulk_ingest(
+            Bed(facility_id=department.facility_id, department=department, code=f"B{run_id}-{i:05d}")
+            for i in range(beds)
+        )
+        bed_ids = list(Bed.objects.filter(code__startswith=f"B{run_id}-").values_list("pk", flat=True))
+        try:
+            self.stdout.write(f"{n} admissions, {beds} lits, {opts['concurrency']} connexions")
+            for label, fn in (("avant : 1er lit libre + réessai", _naive_admit),
+                              ("après : adt.admit, SKIP LOCKED", _service_admit)):
+                encounters = self._encounters(department, visit_type, run_id, n)
+                r = run_concurrently(lambda e: fn(e, department.pk), encounters, opts["concurrency"],
+                                     exhausted=(adt.NoBedAvailable,))
+                self.stdout.write(
+                    f"  {label:<34} {r['ok']:>5} admis  {r['exhausted']:>4} sans lit  "
+                    f"{r['conflicts']:>6} collisions  {r['errors']:>3} erreurs  "
+                    f"{r['rate']:8.1f}/s  p50={r['p50']:7.1f}ms  p95={r['p95']:7.1f}ms  max={r['max']:7.1f}ms"
+                )
+                self._cleanup(encounters, bed_ids)
+        finally:
+            Bed.objects.filter(pk__in=bed_ids).delete()
+            department.delete()
+            # compteurs Redis de l'établissement incrémentés par adt : recalculés sans le service du bench
+            census.reconcile(department.facility_id)
+
+    def _encounters(self, department, visit_type, run_id, n):
+        patients = [Patient(mpi=f"ADT-BENCH-{run_id}-{uuid.uuid4().hex[:12]}") for _ in range(n)]
+        Patient.objects.bulk_create(patients)
+        encounters = [
+            Encounter(patient=p, facility_id=department.facility_id, visit_type=visit_type, start_at=timezone.now())
+            for p in patients
+        ]
+        Encounter.objects.bulk_ingest(encounters)
+        return encounters
+
+    def _cleanup(self, encounters, bed_ids):
+        patient_ids = [e.patient_id for e in encounters]
+        BedOccupancy.objects.filter(bed_id__in=bed_ids).delete()
+        EncounterEvent.objects.filter(encounter__in=encounters).delete()
+        Encounter.objects.filter(pk__in=[e.pk for e in encounters]).delete()
+        Patient.objects.filter(pk__in=patient_ids).delete()
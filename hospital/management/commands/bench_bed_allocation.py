@@ -0,0 +1,97 @@
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core.bench import run_concurrently
+from hospital import adt, census
+from hospital.models import Bed, BedOccupancy, Patient
+
+from .bench_adt_admissions import bench_department
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress test de POST /beds/allocate/ (hospital.adt.reserve) : N réservations simultanées "
+        "dans un même service (salles H / F / mixtes, chambres d'isolement). Échoue s'il y a "
+        "une double attribution ou une contrainte de salle violée ; affiche le débit. "
+        "Crée un service temporaire avec ses lits / patients dans l'établissement donné, "
+        "puis les supprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("facility", help="id de l'établissement hôte du banc")
+        parser.add_argument("--requests", type=int, default=50, help="réservations par vague")
+        parser.add_argument("--beds", type=int, default=40, help="moins de lits que de demandes : saturation")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **opts):
+        run_id = uuid.uuid4().hex[:8]
+        department = bench_department(opts["facility"], run_id)
+        n = opts["requests"]
+
+        # 1/3 salles F, 1/3 salles H, le reste mixte ; un lit sur 8 en isolement
+        sexes = ("F", "M", None)
+        Bed.objects.bulk_ingest(
+            Bed(facility_id=department.facility_id, department=department, code=f"A{run_id}-{i:05d}",
+                ward_sex=sexes[i % 3], isolation=(i % 8 == 0))
+            for i in range(opts["beds"])
+        )
+        beds = {b["pk"]: b for b in Bed.objects.filter(code__startswith=f"A{run_id}-").values("pk", "ward_sex", "isolation")}
+        patient_ids = []
+        try:
+            self.stdout.write(f"{n} réservations x {opts['rounds']} vagues, {len(beds)} lits, "
+                              f"{opts['concurrency']} connexions")
+            for round_no in range(opts["rounds"]):
+                patients = [
+                    Patient(mpi=f"ALLOC-BENCH-{run_id}-{uuid.uuid4().hex[:12]}", sex="MF"[i % 2])
+                    for i in range(n)
+                ]
+                Patient.objects.bulk_create(patients)
+                patient_ids += [p.pk for p in patients]
+                requests = [(p, i % 10 == 0) for i, p in enumerate(patients)]  # 1 sur 10 : isolement
+
+                allocated, lock = [], threading.Lock()
+
+                def reserve(request):
+                    patient, isolation = request
+                    occupancy = adt.reserve(department.pk, patient.pk, isolation=isolation)
+                    with lock:
+                        allocated.append((occupancy.bed_id, patient.sex, isolation))
+                    return 0
+
+                r = run_concurrently(reserve, requests, opts["concurrency"], exhausted=(adt.NoBedAvailable,))
+                self._assert_consistent(allocated, beds)
+                self.stdout.write(
+                    f"  vague {round_no + 1}: {r['ok']:>4} réservés  {r['exhausted']:>4} sans lit  "
+                    f"{r['errors']:>3} erreurs  {r['rate']:8.1f}/s  p50={r['p50']:6.1f}ms  "
+                    f"p95={r['p95']:6.1f}ms  max={r['max']:6.1f}ms"
+                )
+                if r["errors"]:
+                    raise CommandError(f"{r['errors']} réservation(s) en erreur (adt.reserve) sous concurrence.")
+                BedOccupancy.objects.filter(bed_id__in=beds).delete()
+            self.stdout.write(self.style.SUCCESS("Aucune double attribution, contraintes de salle respectées."))
+        finally:
+            BedOccupancy.objects.filter(bed_id__in=beds).delete()
+            Patient.objects.filter(pk__in=patient_ids).delete()
+            Bed.objects.filter(pk__in=beds).delete()
+            department.delete()
+            # compteurs Redis de l'établissement incrémentés par adt : recalculés sans le service du bench
+            census.reconcile(department.facility_id)
+
+    def _assert_consistent(self, allocated, beds):
+        bed_ids = [bed_id for bed_id, _, _ in allocated]
+        if len(bed_ids) != len(set(bed_ids)):
+            raise CommandError("Double attribution : un même lit réservé pour plusieurs patients.")
+        doubles = (
+            BedOccupancy.objects.filter(bed_id__in=beds, to_ts__isnull=True)
+            .values("bed_id").annotate(n=Count("pk")).filter(n__gt=1)
+        )
+        if doubles.exists():
+            raise CommandError("Double attribution en base : plusieurs occupations ouvertes sur un lit.")
+        for bed_id, sex, isolation in allocated:
+            bed = beds[bed_id]
+            if bed["ward_sex"] not in (None, "", sex) or (isolation and not bed["isolation"]):
+                raise CommandError(f"Contrainte violée : lit {bed_id} ({bed}) pour sexe={sex}, isolement={isolation}.")
@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.db_scope import bind_scope, scope_for
+
+TOKEN = {"tenant_key": "CHU-BENCH", "realm_access": {"roles": ["ROLE_MEDECIN"]}}
+
+
+def _view_query():
+    # Représente le travail de la vue (une requête)
+    with connection.cursor() as cur:
+        cur.execute("SELECT 1")
+
+
+def _legacy(token):
+    # Ancien PostgresScopeMiddleware : jusqu'à 3 set_config en autocommit, sur chaque requête
+    # (et, hors transaction, les valeurs sont déjà perdues quand la vue s'exécute)
+    with connection.cursor() as cur:
+        cur.execute("SELECT set_config('app.tenant_key', '', true);")
+        cur.execute("SELECT set_config('app.patient_mpi', '', true);")
+        cur.execute("SELECT set_config('app.tenant_key', %s, true);", [token["tenant_key"]])
+    _view_query()
+
+
+def _bound(token):
+    # PostgresScopeMixin : une instruction dans la transaction de la requête
+    with transaction.atomic():
+        bind_scope(*scope_for(token))
+        _view_query()
+
+
+def _skipped(token):
+    # Vue rls_scoped = False : aucune liaison, seulement le travail de la vue
+    _view_query()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le coût par requête de la liaison de scope RLS (avant / après), "
+        "travail de la vue (1 requête) inclus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+
+    def _run(self, fn, iterations):
+        samples = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            fn(TOKEN)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        samples.sort()
+        return {
+            "mean": statistics.fmean(samples),
+            "p50": samples[len(samples) // 2],
+            "p95": samples[int(len(samples) * 0.95) - 1],
+        }
+
+    def handle(self, *args, **opts):
+        n = opts["iterations"]
+        connection.ensure_connection()
+        # échauffement (connexion, cache de plans)
+        self._run(_legacy, 50)
+        self._run(_bound, 50)
+
+        rows = [
+            ("avant : middleware, 3 x set_config", _legacy),
+            ("après : 1 set_config dans la transaction", _bound),
+            ("après : vue non scopée (rls_scoped=False)", _skipped),
+        ]
+        self.stdout.write(f"{n} itérations, coût par requête (µs)")
+        for label, fn in rows:
+            r = self._run(fn, n)
+            self.stdout.write(f"  {label:<44} mean={r['mean']:8.1f}  p50={r['p50']:8.1f}  p95={r['p95']:8.1f}")
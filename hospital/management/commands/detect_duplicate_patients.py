@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from hospital import matching
+from hospital.models import PatientBlockingKey
+
+
+def _rebuild(partition, partitions):
+    try:
+        return matching.rebuild_keys_partition(partition, partitions)
+    finally:
+        connections.close_all()
+
+
+def _match(partition, partitions, min_score):
+    try:
+        return matching.run_partition(partition, partitions, min_score)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Détection des doublons MPI sur toute la population : (re)construit les clés de blocage "
+        "puis compare les paires candidates, en parallèle par partition de clés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--partitions", type=int, default=None,
+                            help="Nombre de partitions (défaut : 4 x workers)")
+        parser.add_argument("--threshold", type=float, default=None,
+                            help="Score minimal enregistré (défaut : MPI_DUPLICATE_THRESHOLD)")
+        parser.add_argument("--skip-keys", action="store_true",
+                            help="Réutilise les clés de blocage existantes")
+
+    def _parallel(self, pool, fn, partitions, *args):
+        futures = [pool.submit(fn, p, partitions, *args) for p in range(partitions)]
+        return [f.result() for f in futures]
+
+    def handle(self, *args, **opts):
+        workers = max(1, opts["workers"])
+        partitions = opts["partitions"] or workers * 4
+        min_score = matching.threshold() if opts["threshold"] is None else opts["threshold"]
+
+        # Les processus fils ouvrent leurs propres connexions
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("fork")) as pool:
+            if not opts["skip_keys"]:
+                t0 = time.perf_counter()
+                with connection.cursor() as cur:
+                    cur.execute(f"TRUNCATE {PatientBlockingKey._meta.db_table}")
+                connections.close_all()
+                patients = sum(self._parallel(pool, _rebuild, partitions))
+                self.stdout.write(f"Clés de blocage : {patients} patients en {time.perf_counter() - t0:.1f}s")
+
+            t0 = time.perf_counter()
+            results = self._parallel(pool, _match, partitions, min_score)
+        compared = sum(c for c, _ in results)
+        written = sum(w for _, w in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{compared} paires comparées, {written} doublons potentiels (score >= {min_score}) "
+            f"en {time.perf_counter() - t0:.1f}s"
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.kinship import import_links, read_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un fichier de liens familiaux (CSV ou NDJSON : src_mpi, dst_mpi, relation, "
+        "valid_from, valid_to). Liens réciproques calculés en mémoire, un INSERT ... "
+        "ON CONFLICT DO NOTHING par lot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default=None,
+                            help="Par défaut : déduit de l'extension")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, path, **opts):
+        fmt = opts["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        t0 = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - t0
+            self.stdout.write(
+                f"{stats.read} lignes ({stats.read / elapsed:,.0f}/s) : {stats.inserted} liens insérés, "
+                f"{stats.existing} déjà présents, {stats.rejected} rejetés"
+            )
+
+        try:
+            with open(path, newline="", encoding="utf-8") as stream:
+                stats = import_links(read_links(stream, fmt), opts["chunk_size"], progress)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé en {time.perf_counter() - t0:.1f}s : {stats.read} lignes, {stats.inserted} liens insérés, "
+            f"{stats.existing} déjà présents, {stats.rejected} rejetés"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from hospital.billing import recompute_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule InvoiceLine.amount et Invoice.total depuis les lignes, par lots de factures "
+        "(rattrapage : import brut, triggers désactivés, restauration). Reprise possible avec --after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="factures par transaction")
+        parser.add_argument("--after", help="reprendre après cet id de facture")
+
+    def handle(self, *args, **opts):
+        batches = lines = totals = 0
+        for last, lines_fixed, totals_fixed in recompute_totals(opts["batch_size"], opts["after"]):
+            batches += 1
+            lines += lines_fixed
+            totals += totals_fixed
+            if opts["verbosity"] > 1:
+                self.stdout.write(f"  lot {batches} -> {last} : {lines_fixed} lignes, {totals_fixed} factures corrigées")
+        self.stdout.write(self.style.SUCCESS(
+            f"{batches} lot(s) : {lines} montant(s) de ligne et {totals} total(aux) de facture corrigé(s)."
+        ))
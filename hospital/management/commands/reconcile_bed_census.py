@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from hospital import census
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule depuis Postgres le recensement des lits (total / occupés / réservés / bloqués "
+        "par service) et réécrit les compteurs Redis. À lancer périodiquement (cron, toutes les 5 min)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facility", default=None, help="un seul établissement (id)")
+
+    def handle(self, *args, **opts):
+        corrected = census.reconcile(opts["facility"])
+        self.stdout.write(f"Recensement des lits réconcilié : {corrected} compteur(s) corrigé(s).")
@@ -0,0 +1,36 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital import notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Met en file les rappels SMS des RDV d'un jour (défaut : demain) et, avec --dispatch, "
+        "les envoie immédiatement par fournisseur (sans worker Celery)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="jour des RDV (AAAA-MM-JJ)")
+        parser.add_argument("--dispatch", action="store_true", help="envoyer aussitôt les messages dus")
+        parser.add_argument("--max-seconds", type=float, default=None, help="durée max. d'envoi par fournisseur")
+
+    def handle(self, *args, **opts):
+        try:
+            day = datetime.date.fromisoformat(opts["date"]) if opts["date"] else None
+        except ValueError:
+            raise CommandError("Date invalide (attendu : AAAA-MM-JJ).")
+        queued = notifications.enqueue_appointment_reminders(day)
+        self.stdout.write(f"{queued} rappel(s) mis en file.")
+        if not opts["dispatch"]:
+            return
+        reclaimed = notifications.reclaim_stale()
+        if reclaimed:
+            self.stdout.write(f"{reclaimed} envoi(s) interrompu(s) remis en file.")
+        for provider in notifications.due_providers():
+            r = notifications.dispatch(provider, max_seconds=opts["max_seconds"])
+            self.stdout.write(
+                f"  {provider:<16} {r['sent']:>6} envoyés  {r['retry']:>4} à réessayer  "
+                f"{r['dead']:>4} abandonnés  ({r['batches']} lots)"
+            )
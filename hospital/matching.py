@@ -0,0 +1,355 @@
+# hospital/matching.py
+"""
+Rapprochement probabiliste d'identités patient (détection de doublons MPI).
+
+1. Blocage : chaque patient reçoit quelques clés (nom phonétique + année de naissance,
+   nom + prénom phonétiques, identifiants hachés) dans PatientBlockingKey. Seules les
+   paires partageant une clé sont comparées ; les blocs de plus de MAX_BLOCK_SIZE patients
+   (noms très fréquents sans autre discriminant) sont ignorés.
+2. Comparaison vectorisée (NumPy) des paires candidates : similarité de Dice sur des
+   signatures de bigrammes (128 bits) pour les noms, écarts de dates, égalité d'identifiants ;
+   poids log2 à la Fellegi-Sunter, sommés en un score.
+3. Les paires au-dessus du seuil (MPI_DUPLICATE_THRESHOLD) sont écrites dans
+   DuplicateCandidate pour revue ; le statut d'une paire déjà revue n'est pas modifié.
+
+Deux modes : check_patient() à chaque enregistrement (incrémental) et run_partition()
+pour un passage complet, partitionné par hachage des clés (commande
+detect_duplicate_patients --workers N).
+"""
+import hashlib
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import DuplicateCandidate, Patient, PatientBlockingKey
+
+MAX_BLOCK_SIZE = 200
+DEFAULT_THRESHOLD = 8.0
+FIELDS = ("id", "family_name", "given_name", "birth_date", "sex", "cmu", "cni", "phone_hash", "national_id_hash")
+
+# (champ, poids si accord, poids si désaccord) — identifiants comparés seulement si présents des deux côtés
+IDENTIFIER_WEIGHTS = (
+    ("cmu", 9.0, -2.0),
+    ("cni", 9.0, -3.0),
+    ("national_id_hash", 10.0, -3.0),
+    ("phone_hash", 4.0, -1.0),
+)
+BLOCKING_IDENTIFIERS = (
+    ("cmu", PatientBlockingKey.Kind.CMU),
+    ("cni", PatientBlockingKey.Kind.CNI),
+    ("phone_hash", PatientBlockingKey.Kind.PHONE),
+    ("national_id_hash", PatientBlockingKey.Kind.NATIONAL_ID),
+)
+
+
+def threshold():
+    return getattr(settings, "MPI_DUPLICATE_THRESHOLD", DEFAULT_THRESHOLD)
+
+
+# --------- Normalisation / phonétique ---------
+def normalize(text):
+    """'Kouamé  N'Guessan' -> 'KOUAME NGUESSAN' (sans accents, A-Z et espaces)."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().upper()
+    text = re.sub(r"[^A-Z ]", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# Graphies françaises / ouest-africaines ramenées à une forme commune (ordre significatif)
+_PHONETIC_RULES = [
+    (r"TCH", "C"), (r"DJ", "J"), (r"SCH|SH|CH", "S"), (r"PH", "F"), (r"QU|CK", "K"),
+    (r"C(?=[EIY])", "S"), (r"C", "K"), (r"GU(?=[EI])", "G"), (r"X", "KS"), (r"Z", "S"),
+    (r"EAU|AU", "O"), (r"OU|W", "U"), (r"Y", "I"), (r"AI|EI", "E"), (r"H", ""),
+    (r"(.)\1+", r"\1"),
+]
+
+
+def phonetic(name):
+    """Code phonétique d'un nom (8 caractères max) : KOUASSI / KWASI -> KUASI, N'GUESSAN -> NGESAN."""
+    code = normalize(name).replace(" ", "")
+    for pattern, repl in _PHONETIC_RULES:
+        code = re.sub(pattern, repl, code)
+    return code[:8]
+
+
+def _digest(kind, value):
+    return hashlib.sha1(f"{kind}:{value}".encode()).hexdigest()
+
+
+def blocking_keys(row):
+    """[(kind, key), ...] pour un patient (dict des FIELDS)."""
+    keys = []
+    family = phonetic(row["family_name"])
+    given = phonetic((normalize(row["given_name"]).split() or [""])[0])
+    if family and row["birth_date"]:
+        keys.append((PatientBlockingKey.Kind.NAME_YEAR, f"{family}|{row['birth_date'].year}"))
+    if family and given:
+        # ordre trié : nom et prénom inversés au guichet tombent dans le même bloc
+        keys.append((PatientBlockingKey.Kind.NAME_GIVEN, "|".join(sorted((family, given)))))
+    for field, kind in BLOCKING_IDENTIFIERS:
+        value = (row[field] or "").strip().upper()
+        if value:
+            keys.append((kind, _digest(kind, value)))
+    return keys
+
+
+# --------- Comparaison vectorisée ---------
+def _signature(text):
+    """Signature 128 bits (2 x uint64) des bigrammes de ' NOM ' (filtre de Bloom à 1 hachage)."""
+    sig = [0, 0]
+    padded = f" {text} "
+    for i in range(len(padded) - 1):
+        bit = zlib.crc32(padded[i:i + 2].encode()) % 128
+        sig[bit // 64] |= 1 << (bit % 64)
+    return sig
+
+
+def _popcount(sig):
+    return np.unpackbits(np.ascontiguousarray(sig).view(np.uint8), axis=-1).sum(axis=-1).astype(np.float64)
+
+
+def _dice(a, b):
+    inter = _popcount(a & b)
+    total = _popcount(a) + _popcount(b)
+    return np.divide(2 * inter, total, out=np.zeros_like(total), where=total > 0)
+
+
+def _id_code(kind, value):
+    value = (value or "").strip().upper()
+    return int(_digest(kind, value)[:15], 16) if value else 0
+
+
+class PatientFrame:
+    """Attributs comparables d'un ensemble de patients, en colonnes NumPy."""
+
+    def __init__(self, rows):
+        rows = list(rows)
+        n = len(rows)
+        self.index = {row["id"]: i for i, row in enumerate(rows)}
+        family = [normalize(r["family_name"]) for r in rows]
+        # premier prénom seulement : les prénoms secondaires sont saisis de façon irrégulière
+        given = [(normalize(r["given_name"]).split() or [""])[0] for r in rows]
+        self.family = np.array([_signature(x) for x in family], dtype=np.uint64).reshape(n, 2)
+        self.given = np.array([_signature(x) for x in given], dtype=np.uint64).reshape(n, 2)
+        self.has_family = np.array([bool(x) for x in family], dtype=bool)
+        self.has_given = np.array([bool(x) for x in given], dtype=bool)
+
+        births = [r["birth_date"] for r in rows]
+        self.has_birth = np.array([b is not None for b in births], dtype=bool)
+        self.year = np.array([b.year if b else 0 for b in births], dtype=np.int32)
+        self.month = np.array([b.month if b else 0 for b in births], dtype=np.int32)
+        self.day = np.array([b.day if b else 0 for b in births], dtype=np.int32)
+
+        self.sex = np.array([{"M": 1, "F": 2}.get(r["sex"], 0) for r in rows], dtype=np.int8)
+        self.identifiers = {
+            field: np.array([_id_code(field, r[field]) for r in rows], dtype=np.int64)
+            for field, _, _ in IDENTIFIER_WEIGHTS
+        }
+
+    def positions(self, ids):
+        return np.fromiter((self.index[i] for i in ids), dtype=np.int64, count=len(ids))
+
+
+def _name_weight(sim, present):
+    # Dice 1.0 -> +3.5, 0.9 -> +2.5, 0.75 -> +1, <= 0.5 -> -2/-3 ; absent d'un côté -> 0
+    return np.where(present, np.interp(sim, [0.0, 0.5, 0.75, 0.9, 1.0], [-3.0, -2.0, 1.0, 2.5, 3.5]), 0.0)
+
+
+def score_pairs(frame, ia, ib):
+    """
+    Score des paires (ia[k], ib[k]) (positions dans `frame`).
+    Renvoie (scores, {champ: poids}) — tableaux alignés sur les paires.
+    """
+    fam = frame.has_family[ia] & frame.has_family[ib]
+    giv = frame.has_given[ia] & frame.has_given[ib]
+    direct = (
+        _name_weight(_dice(frame.family[ia], frame.family[ib]), fam),
+        _name_weight(_dice(frame.given[ia], frame.given[ib]), giv),
+    )
+    # nom / prénom inversés à la saisie
+    cross = frame.has_family[ia] & frame.has_given[ib] & frame.has_given[ia] & frame.has_family[ib]
+    swapped = (
+        _name_weight(_dice(frame.family[ia], frame.given[ib]), cross),
+        _name_weight(_dice(frame.given[ia], frame.family[ib]), cross),
+    )
+    use_swap = (swapped[0] + swapped[1]) > (direct[0] + direct[1])
+    components = {
+        "family_name": np.where(use_swap, swapped[0], direct[0]),
+        "given_name": np.where(use_swap, swapped[1], direct[1]),
+    }
+
+    birth = frame.has_birth[ia] & frame.has_birth[ib]
+    same_year = frame.year[ia] == frame.year[ib]
+    same_month = same_year & (frame.month[ia] == frame.month[ib])
+    exact = same_month & (frame.day[ia] == frame.day[ib])
+    transposed = same_year & (frame.month[ia] == frame.day[ib]) & (frame.day[ia] == frame.month[ib])
+    near = np.abs(frame.year[ia] - frame.year[ib]) <= 1
+    # homonymes nés la même année : fréquents, la date complète doit départager
+    components["birth_date"] = np.where(
+        birth,
+        np.select([exact, transposed, same_month, same_year, near], [6.0, 3.0, 1.0, -2.0, -3.0], default=-6.0),
+        0.0,
+    )
+
+    sex_known = (frame.sex[ia] > 0) & (frame.sex[ib] > 0)
+    components["sex"] = np.where(sex_known, np.where(frame.sex[ia] == frame.sex[ib], 0.5, -4.0), 0.0)
+
+    for field, agree, disagree in IDENTIFIER_WEIGHTS:
+        a, b = frame.identifiers[field][ia], frame.identifiers[field][ib]
+        components[field] = np.where((a != 0) & (b != 0), np.where(a == b, agree, disagree), 0.0)
+
+    scores = np.sum(list(components.values()), axis=0)
+    return scores, components
+
+
+# --------- Persistance ---------
+def _load_rows(ids, chunk=5000):
+    ids = list(ids)
+    for start in range(0, len(ids), chunk):
+        yield from Patient.objects.filter(id__in=ids[start:start + chunk]).values(*FIELDS)
+
+
+def _save_candidates(frame, pairs, min_score):
+    """Score `pairs` [(id_a, id_b), ...] et enregistre celles >= min_score. Renvoie le nombre écrit."""
+    if not pairs:
+        return 0
+    ia = frame.positions([a for a, _ in pairs])
+    ib = frame.positions([b for _, b in pairs])
+    scores, components = score_pairs(frame, ia, ib)
+    keep = np.flatnonzero(scores >= min_score)
+    if not len(keep):
+        return 0
+    names = list(components)
+    objs = [
+        DuplicateCandidate(
+            patient_a_id=pairs[k][0],
+            patient_b_id=pairs[k][1],
+            score=round(float(scores[k]), 2),
+            components={name: round(float(components[name][k]), 2) for name in names},
+        )
+        for k in keep
+    ]
+    # Ordre des clés constant : deux workers qui upsertent des paires communes verrouillent
+    # les lignes dans le même ordre (pas d'interblocage)
+    objs.sort(key=lambda o: (str(o.patient_a_id), str(o.patient_b_id)))
+    DuplicateCandidate.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=["patient_a", "patient_b"],
+        update_fields=["score", "components", "updated_at"],
+    )
+    return len(objs)
+
+
+def _replace_keys(rows):
+    rows = list(rows)
+    PatientBlockingKey.objects.filter(patient_id__in=[r["id"] for r in rows]).delete()
+    PatientBlockingKey.objects.bulk_create(
+        [PatientBlockingKey(patient_id=r["id"], kind=kind, key=key) for r in rows for kind, key in blocking_keys(r)],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+
+
+# --------- Mode incrémental ---------
+CANDIDATES_FOR_PATIENT_SQL = f"""
+SELECT DISTINCT other.patient_id
+FROM {PatientBlockingKey._meta.db_table} mine
+JOIN {PatientBlockingKey._meta.db_table} other
+  ON other.kind = mine.kind AND other.key = mine.key AND other.patient_id <> mine.patient_id
+WHERE mine.patient_id = %s
+  AND (
+    SELECT count(*) FROM {PatientBlockingKey._meta.db_table} blk
+    WHERE blk.kind = mine.kind AND blk.key = mine.key
+  ) <= %s
+"""
+
+
+@transaction.atomic
+def check_patient(patient_id, min_score=None):
+    """
+    À l'enregistrement / la modification d'un patient : met à jour ses clés de blocage,
+    compare le patient à ceux qui partagent une clé et enregistre les doublons potentiels.
+    Renvoie le nombre de paires écrites.
+    """
+    min_score = threshold() if min_score is None else min_score
+    rows = list(Patient.objects.filter(id=patient_id).values(*FIELDS))
+    if not rows:
+        return 0
+    patient_id = rows[0]["id"]
+    _replace_keys(rows)
+
+    with connection.cursor() as cur:
+        cur.execute(CANDIDATES_FOR_PATIENT_SQL, [patient_id, MAX_BLOCK_SIZE])
+        others = [r[0] for r in cur.fetchall()]
+    if not others:
+        return 0
+
+    frame = PatientFrame(rows + list(_load_rows(others)))
+    pairs = [(patient_id, o) if patient_id < o else (o, patient_id) for o in others]
+    return _save_candidates(frame, pairs, min_score)
+
+
+# --------- Mode batch (population complète) ---------
+PARTITION_PATIENTS_SQL = f"""
+SELECT {", ".join(FIELDS)} FROM {Patient._meta.db_table}
+WHERE mod(abs(hashtext(id::text)), %s) = %s
+"""
+
+PARTITION_PAIRS_SQL = f"""
+WITH blocks AS (
+    SELECT kind, key FROM {PatientBlockingKey._meta.db_table}
+    WHERE mod(abs(hashtext(kind || ':' || key)), %s) = %s
+    GROUP BY kind, key
+    HAVING count(*) BETWEEN 2 AND %s
+)
+SELECT DISTINCT a.patient_id, b.patient_id
+FROM blocks k
+JOIN {PatientBlockingKey._meta.db_table} a ON a.kind = k.kind AND a.key = k.key
+JOIN {PatientBlockingKey._meta.db_table} b ON b.kind = k.kind AND b.key = k.key
+WHERE a.patient_id < b.patient_id
+"""
+
+
+def rebuild_keys_partition(partition, partitions, chunk=5000):
+    """Recalcule les clés des patients de la partition (hashtext(id) mod partitions). Renvoie le nb de patients."""
+    done = 0
+    with transaction.atomic(), connection.chunked_cursor() as cur:
+        cur.execute(PARTITION_PATIENTS_SQL, [partitions, partition])
+        while True:
+            batch = cur.fetchmany(chunk)
+            if not batch:
+                break
+            _replace_keys(dict(zip(FIELDS, r)) for r in batch)
+            done += len(batch)
+    return done
+
+
+def run_partition(partition, partitions, min_score=None, chunk=20000):
+    """
+    Compare toutes les paires des blocs de la partition (hashtext(kind:key) mod partitions).
+    Une paire présente dans plusieurs blocs/partitions est réécrite à l'identique (upsert).
+    Une transaction par lot de paires (le curseur serveur, hors transaction, est WITH HOLD) :
+    les workers parallèles ne gardent pas les verrous des paires communes jusqu'à la fin
+    de leur partition.
+    Renvoie (paires comparées, paires enregistrées).
+    """
+    min_score = threshold() if min_score is None else min_score
+    compared = written = 0
+    with connection.chunked_cursor() as cur:
+        cur.execute(PARTITION_PAIRS_SQL, [partitions, partition, MAX_BLOCK_SIZE])
+        while True:
+            pairs = cur.fetchmany(chunk)
+            if not pairs:
+                break
+            ids = {a for a, _ in pairs} | {b for _, b in pairs}
+            frame = PatientFrame(_load_rows(ids))
+            compared += len(pairs)
+            with transaction.atomic():
+                written += _save_candidates(frame, pairs, min_score)
+    return compared, written
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:15
+
+from django.db import migrations, models
+
+# Matérialise path/root_code pour les établissements existants (CTE récursive, une passe).
+BACKFILL_LINEAGE = """
+WITH RECURSIVE lineage AS (
+    SELECT id, '/' || replace(id::text, '-', '') || '/' AS path, code AS root_code
+    FROM hospital_facility
+    WHERE parent_id IS NULL
+  UNION ALL
+    SELECT f.id, l.path || replace(f.id::text, '-', '') || '/', l.root_code
+    FROM hospital_facility f
+    JOIN lineage l ON f.parent_id = l.id
+)
+UPDATE hospital_facility f
+SET path = l.path, root_code = l.root_code
+FROM lineage l
+WHERE f.id = l.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0004_alter_district_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facility',
+            name='path',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='root_code',
+            field=models.CharField(default='', editable=False, max_length=46),
+        ),
+        migrations.RunSQL(BACKFILL_LINEAGE, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['root_code'], name='hospital_fa_root_co_60833d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['path'], name='facility_path_prefix_idx', opclasses=['text_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:26
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+import hospital.search
+
+# unaccent() n'est que STABLE (dictionnaire résolu via search_path) : on l'enveloppe dans des
+# fonctions IMMUTABLE au dictionnaire qualifié, utilisables dans une expression d'index.
+SEARCH_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION sigh_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, lower($1)) $$;
+
+CREATE OR REPLACE FUNCTION patient_search_name(family text, given text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT sigh_unaccent(coalesce(family, '') || ' ' || coalesce(given, '')) $$;
+"""
+
+DROP_SEARCH_FUNCTIONS = """
+DROP FUNCTION IF EXISTS patient_search_name(text, text);
+DROP FUNCTION IF EXISTS sigh_unaccent(text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0005_facility_lineage'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunSQL(SEARCH_FUNCTIONS, reverse_sql=DROP_SEARCH_FUNCTIONS),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(hospital.search.PatientSearchName('family_name', 'given_name'), name='gin_trgm_ops'), name='patient_search_name_trgm'),
+        ),
+    ]
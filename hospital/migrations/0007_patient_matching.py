@@ -0,0 +1,67 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0006_patient_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('score', models.FloatField(db_index=True)),
+                ('components', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDING', 'À revoir'), ('CONFIRMED', 'Doublon confirmé'), ('REJECTED', 'Patients distincts'), ('MERGED', 'Fusionnés')], default='PENDING', max_length=16)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('patient_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates_a', to='hospital.patient')),
+                ('patient_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates_b', to='hospital.patient')),
+            ],
+            options={
+                'verbose_name': 'Doublon potentiel',
+                'verbose_name_plural': 'Doublons potentiels',
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientBlockingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('NAME_YEAR', 'Nom phonétique + année de naissance'), ('NAME_GIVEN', 'Nom + prénom phonétiques'), ('CMU', 'CMU (haché)'), ('CNI', 'CNI (hachée)'), ('PHONE', 'Téléphone (haché)'), ('NATIONAL_ID', 'Identifiant national (haché)')], max_length=16)),
+                ('key', models.CharField(max_length=64)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocking_keys', to='hospital.patient')),
+            ],
+            options={
+                'verbose_name': 'Clé de blocage patient',
+                'verbose_name_plural': 'Clés de blocage patient',
+                'indexes': [models.Index(fields=['kind', 'key'], name='hospital_pa_kind_ff7ca2_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='patientblockingkey',
+            constraint=models.UniqueConstraint(fields=('patient', 'kind', 'key'), name='uniq_patient_blocking_key'),
+        ),
+        migrations.AddIndex(
+            model_name='duplicatecandidate',
+            index=models.Index(fields=['status', '-score'], name='hospital_du_status_102dc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='duplicatecandidate',
+            index=models.Index(fields=['patient_b'], name='hospital_du_patient_7f37b3_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='duplicatecandidate',
+            constraint=models.UniqueConstraint(fields=('patient_a', 'patient_b'), name='uniq_duplicate_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='duplicatecandidate',
+            constraint=models.CheckConstraint(check=models.Q(('patient_a__lt', models.F('patient_b'))), name='duplicate_pair_ordered'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Arêtes familiales unifiées : table Kinship + filiation directe (father/mother).
+# Vue simple : chaque branche s'appuie sur un index existant pour "arêtes sortantes de X"
+# (kinship(src_id, relation), patient.father_id / mother_id, clé primaire patient).
+CREATE_EDGE_VIEW = """
+CREATE OR REPLACE VIEW hospital_patient_edge AS
+    SELECT src_id, dst_id, relation, valid_from, valid_to, 'KINSHIP' AS source
+    FROM hospital_kinship
+  UNION ALL
+    SELECT father_id, id, 'PARENT_OF', NULL::date, NULL::date, 'FATHER'
+    FROM hospital_patient WHERE father_id IS NOT NULL
+  UNION ALL
+    SELECT id, father_id, 'CHILD_OF', NULL::date, NULL::date, 'FATHER'
+    FROM hospital_patient WHERE father_id IS NOT NULL
+  UNION ALL
+    SELECT mother_id, id, 'PARENT_OF', NULL::date, NULL::date, 'MOTHER'
+    FROM hospital_patient WHERE mother_id IS NOT NULL
+  UNION ALL
+    SELECT id, mother_id, 'CHILD_OF', NULL::date, NULL::date, 'MOTHER'
+    FROM hospital_patient WHERE mother_id IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0007_patient_matching'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_EDGE_VIEW, reverse_sql="DROP VIEW IF EXISTS hospital_patient_edge;"),
+    ]
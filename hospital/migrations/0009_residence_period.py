@@ -0,0 +1,42 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:33
+
+import django.contrib.postgres.constraints
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+import hospital.models
+
+# Périodes principales qui se chevauchent (ancien save() : clôture à la date du jour) :
+# chaque période est ramenée au début de la suivante, pour que la contrainte puisse être posée.
+CLOSE_OVERLAPS = """
+WITH ordered AS (
+    SELECT id, lead(from_date) OVER (PARTITION BY patient_id ORDER BY from_date, created_at) AS next_from
+    FROM hospital_patientresidence
+    WHERE is_primary
+)
+UPDATE hospital_patientresidence r
+SET to_date = o.next_from
+FROM ordered o
+WHERE r.id = o.id
+  AND o.next_from IS NOT NULL
+  AND (r.to_date IS NULL OR r.to_date > o.next_from);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0008_patient_edge_view'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),  # égalité sur patient_id (uuid) dans un index GiST
+        migrations.RunSQL(CLOSE_OVERLAPS, reverse_sql=migrations.RunSQL.noop),
+        migrations.RemoveConstraint(
+            model_name='patientresidence',
+            name='uniq_current_primary_residence_per_patient',
+        ),
+        migrations.AddConstraint(
+            model_name='patientresidence',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('is_primary', True)), expressions=[('patient', '='), (hospital.models.DateRange('from_date', 'to_date', models.Value('[)')), '&&')], name='excl_overlapping_primary_residence'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0009_residence_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bed',
+            name='isolation',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='bed',
+            name='ward_sex',
+            field=models.CharField(blank=True, choices=[('M', 'Male'), ('F', 'Female')], max_length=1, null=True),
+        ),
+        migrations.AddField(
+            model_name='bedoccupancy',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bed',
+            index=models.Index(condition=models.Q(('active', True)), fields=['department', 'code'], name='bed_active_by_department'),
+        ),
+        migrations.AddIndex(
+            model_name='bedoccupancy',
+            index=models.Index(condition=models.Q(('status', 'RESERVED'), ('to_ts__isnull', True)), fields=['expires_at'], name='bedocc_open_reservation'),
+        ),
+    ]
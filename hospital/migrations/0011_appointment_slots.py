@@ -0,0 +1,120 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:44
+
+import django.contrib.postgres.constraints
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import hospital.models
+import uuid
+
+# RDV programmés qui en chevauchent un plus ancien du même praticien : marqués CONFLICT
+# (hors contrainte, à replanifier) pour que la contrainte d'exclusion puisse être posée.
+FLAG_OVERLAPS = """
+UPDATE hospital_appointment a
+SET status = 'CONFLICT'
+WHERE a.status = 'SCHEDULED'
+  AND a.practitioner_id IS NOT NULL
+  AND EXISTS (
+    SELECT 1 FROM hospital_appointment b
+    WHERE b.practitioner_id = a.practitioner_id
+      AND b.status = 'SCHEDULED'
+      AND b.id <> a.id
+      AND tstzrange(b.start_at, b.end_at, '[)') && tstzrange(a.start_at, a.end_at, '[)')
+      AND (b.created_at, b.id) < (a.created_at, a.id)
+  );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_bed_allocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PractitionerAbsence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('tenant_key', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('start_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('reason', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'verbose_name': 'Absence praticien',
+                'verbose_name_plural': 'Absences praticiens',
+            },
+        ),
+        migrations.CreateModel(
+            name='PractitionerSchedule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('tenant_key', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(1, 'Lundi'), (2, 'Mardi'), (3, 'Mercredi'), (4, 'Jeudi'), (5, 'Vendredi'), (6, 'Samedi'), (7, 'Dimanche')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=15)),
+                ('valid_from', models.DateField(default=django.utils.timezone.localdate)),
+                ('valid_to', models.DateField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Planning praticien',
+                'verbose_name_plural': 'Plannings praticiens',
+            },
+        ),
+        migrations.RunSQL(FLAG_OVERLAPS, reverse_sql=migrations.RunSQL.noop),
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='uniq_practitioner_start',
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('practitioner__isnull', False), ('status', 'SCHEDULED')), expressions=[('practitioner', '='), (hospital.models.TsTzRange('start_at', 'end_at', models.Value('[)')), '&&')], name='excl_practitioner_overlap'),
+        ),
+        migrations.AddField(
+            model_name='practitionerschedule',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='hospital.department'),
+        ),
+        migrations.AddField(
+            model_name='practitionerschedule',
+            name='facility',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='hospital.facility'),
+        ),
+        migrations.AddField(
+            model_name='practitionerschedule',
+            name='practitioner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='hospital.practitioner'),
+        ),
+        migrations.AddField(
+            model_name='practitionerabsence',
+            name='practitioner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absences', to='hospital.practitioner'),
+        ),
+        migrations.AddIndex(
+            model_name='practitionerschedule',
+            index=models.Index(condition=models.Q(('active', True)), fields=['practitioner', 'weekday'], name='schedule_active_by_weekday'),
+        ),
+        migrations.AddConstraint(
+            model_name='practitionerschedule',
+            constraint=models.CheckConstraint(check=models.Q(('end_time__gt', models.F('start_time'))), name='schedule_time_valid'),
+        ),
+        migrations.AddConstraint(
+            model_name='practitionerschedule',
+            constraint=models.CheckConstraint(check=models.Q(('slot_minutes__gte', 5), ('slot_minutes__lte', 240)), name='schedule_slot_minutes_range'),
+        ),
+        migrations.AddIndex(
+            model_name='practitionerabsence',
+            index=models.Index(fields=['practitioner', 'start_at'], name='hospital_pr_practit_9489df_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='practitionerabsence',
+            constraint=models.CheckConstraint(check=models.Q(('end_at__gt', models.F('start_at'))), name='absence_time_valid'),
+        ),
+    ]
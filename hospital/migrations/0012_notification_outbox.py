@@ -0,0 +1,46 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:46
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0011_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('tenant_key', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('kind', models.CharField(db_index=True, max_length=32)),
+                ('channel', models.CharField(default='SMS', max_length=16)),
+                ('provider', models.CharField(max_length=32)),
+                ('recipient', models.CharField(max_length=32, validators=[django.core.validators.RegexValidator(message='Numéro de téléphone invalide (format E.164 attendu, ex: +2250700000000).', regex='^\\+[1-9]\\d{6,14}$')])),
+                ('body', models.TextField()),
+                ('dedupe_key', models.CharField(max_length=128, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('SENDING', "En cours d'envoi"), ('SENT', 'Envoyé'), ('DEAD', 'Abandonné')], default='PENDING', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('provider_message_id', models.CharField(blank=True, max_length=128, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=255, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='hospital.appointment')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='hospital.facility')),
+            ],
+            options={
+                'verbose_name': "Notification (file d'envoi)",
+                'verbose_name_plural': "Notifications (file d'envoi)",
+                'indexes': [models.Index(fields=['tenant_key', 'created_at'], name='hospital_no_tenant__664308_idx'), models.Index(condition=models.Q(('status', 'PENDING')), fields=['provider', 'next_attempt_at'], name='outbox_pending_by_provider'), models.Index(condition=models.Q(('status', 'SENDING')), fields=['locked_at'], name='outbox_sending_lease')],
+            },
+        ),
+    ]
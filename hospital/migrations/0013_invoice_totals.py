@@ -0,0 +1,95 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:51
+
+from django.db import migrations, models
+
+# Rattrapage avant la pose des triggers : montants des lignes, puis totaux des factures.
+BACKFILL = """
+UPDATE hospital_invoiceline SET amount = qty * unit_price;
+UPDATE hospital_invoice i
+SET total = coalesce((SELECT sum(l.amount) FROM hospital_invoiceline l WHERE l.invoice_id = i.id), 0);
+"""
+
+# amount : calculé à chaque écriture de ligne (colonne « générée » par trigger).
+# total : ajusté par delta, une fois par instruction et par facture touchée
+# (tables de transition : pas de trigger par ligne sur les bulk_create).
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION hospital_invoiceline_amount() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.amount := NEW.qty * NEW.unit_price;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION hospital_invoice_total_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE hospital_invoice i SET total = i.total + d.delta
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM new_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE hospital_invoice i SET total = i.total - d.delta
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM old_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    ELSE
+        UPDATE hospital_invoice i SET total = i.total + d.delta
+        FROM (
+            SELECT invoice_id, sum(delta) AS delta
+            FROM (
+                SELECT invoice_id, amount AS delta FROM new_lines
+                UNION ALL
+                SELECT invoice_id, -amount FROM old_lines
+            ) x
+            GROUP BY invoice_id
+        ) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER invoiceline_amount
+    BEFORE INSERT OR UPDATE ON hospital_invoiceline
+    FOR EACH ROW EXECUTE FUNCTION hospital_invoiceline_amount();
+CREATE TRIGGER invoiceline_total_insert
+    AFTER INSERT ON hospital_invoiceline REFERENCING NEW TABLE AS new_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION hospital_invoice_total_apply();
+CREATE TRIGGER invoiceline_total_update
+    AFTER UPDATE ON hospital_invoiceline REFERENCING OLD TABLE AS old_lines NEW TABLE AS new_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION hospital_invoice_total_apply();
+CREATE TRIGGER invoiceline_total_delete
+    AFTER DELETE ON hospital_invoiceline REFERENCING OLD TABLE AS old_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION hospital_invoice_total_apply();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS invoiceline_total_delete ON hospital_invoiceline;
+DROP TRIGGER IF EXISTS invoiceline_total_update ON hospital_invoiceline;
+DROP TRIGGER IF EXISTS invoiceline_total_insert ON hospital_invoiceline;
+DROP TRIGGER IF EXISTS invoiceline_amount ON hospital_invoiceline;
+DROP FUNCTION IF EXISTS hospital_invoice_total_apply();
+DROP FUNCTION IF EXISTS hospital_invoiceline_amount();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0012_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceline',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=16),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
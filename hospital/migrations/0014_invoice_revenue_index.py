@@ -0,0 +1,81 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:54
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+# Le trigger des totaux (0013) avance aussi updated_at de la facture : une ligne ajoutée,
+# modifiée ou supprimée fait passer la facture au-delà du filigrane des agrégats finances.
+TOTAL_APPLY = """
+CREATE OR REPLACE FUNCTION hospital_invoice_total_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE hospital_invoice i SET total = i.total + d.delta, updated_at = now()
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM new_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE hospital_invoice i SET total = i.total - d.delta, updated_at = now()
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM old_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id;
+    ELSE
+        UPDATE hospital_invoice i SET total = i.total + d.delta, updated_at = now()
+        FROM (
+            SELECT invoice_id, sum(delta) AS delta
+            FROM (
+                SELECT invoice_id, amount AS delta FROM new_lines
+                UNION ALL
+                SELECT invoice_id, -amount FROM old_lines
+            ) x
+            GROUP BY invoice_id
+        ) d
+        WHERE i.id = d.invoice_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+PREVIOUS_TOTAL_APPLY = """
+CREATE OR REPLACE FUNCTION hospital_invoice_total_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE hospital_invoice i SET total = i.total + d.delta
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM new_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE hospital_invoice i SET total = i.total - d.delta
+        FROM (SELECT invoice_id, sum(amount) AS delta FROM old_lines GROUP BY invoice_id) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    ELSE
+        UPDATE hospital_invoice i SET total = i.total + d.delta
+        FROM (
+            SELECT invoice_id, sum(delta) AS delta
+            FROM (
+                SELECT invoice_id, amount AS delta FROM new_lines
+                UNION ALL
+                SELECT invoice_id, -amount FROM old_lines
+            ) x
+            GROUP BY invoice_id
+        ) d
+        WHERE i.id = d.invoice_id AND d.delta <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0013_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(models.F('tenant_key'), django.db.models.functions.comparison.Coalesce('issued_at', 'created_at'), name='invoice_tenant_revenue_ts'),
+        ),
+        migrations.RunSQL(TOTAL_APPLY, reverse_sql=PREVIOUS_TOTAL_APPLY),
+    ]
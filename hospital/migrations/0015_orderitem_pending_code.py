@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-17 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_invoice_revenue_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status', 'ORDERED')), fields=['tenant_key', 'code'], name='orderitem_pending_code'),
+        ),
+    ]
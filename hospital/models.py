@@ -5,18 +5,21 @@ import uuid
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, EmailValidator
-from django.db import models
+from django.db import models, transaction
 
 from django.db import models
-from django.db.models import F
-from django.db.models.functions import Lower
+from django.db.models import F, Func, Value
+from django.db.models.functions import Coalesce, Concat, Lower, Substr
 from django.utils import timezone
 from .base import UUIDModel, TimeStampedModel
 from django.contrib.gis.db import models as gmodels
 from django.utils.translation import gettext_lazy as _
-from django.contrib.postgres.indexes import GistIndex, GinIndex
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateRangeField, DateTimeRangeField, RangeOperators
+from django.contrib.postgres.indexes import GistIndex, GinIndex, OpClass
 from django.contrib.gis.db import models
 from .base import TenantScopedModel
+from .search import PatientSearchName
 
 
 class ScopeLevel(models.TextChoices):
@@ -190,12 +193,56 @@ class Facility(UUIDModel, TimeStampedModel):
     location = gmodels.PointField(srid=4326, null=True, blank=True)
     commune = gmodels.ForeignKey("Commune", on_delete=gmodels.PROTECT, null=True, blank=True)
 
+    # Ascendance matérialisée (maintenue par save()) :
+    #  - path      : "/<id racine>/.../<id courant>/" (ids hex) -> sous-arbre = path LIKE 'prefix%'
+    #  - root_code : code de la racine (= tenant_key des enregistrements rattachés)
+    path = gmodels.TextField(default="", editable=False)
+    root_code = gmodels.CharField(max_length=46, default="", editable=False)
+
     def root(self):
+        if not self.parent_id:
+            return self
+        return Facility.objects.get(code=self.root_code) if self.root_code else self._walk_root()
+
+    def _walk_root(self):
         n = self
         while n.parent_id:
             n = n.parent
         return n
 
+    def ancestors(self):
+        """Ascendants (racine incluse, self exclu) en une requête, de la racine vers le parent."""
+        ids = [i for i in self.path.strip("/").split("/") if i][:-1]
+        by_id = {f.id.hex: f for f in Facility.objects.filter(id__in=ids)}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def descendants(self, include_self=False):
+        """Sous-arbre complet en une requête indexée (path text_pattern_ops)."""
+        qs = Facility.objects.filter(path__startswith=self.path)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+    def _compute_lineage(self):
+        if self.parent_id:
+            parent = self.parent
+            if f"/{self.id.hex}/" in (parent.path or ""):
+                raise ValidationError(_("Cycle détecté dans la hiérarchie des établissements."))
+            return f"{parent.path}{self.id.hex}/", parent.root_code or parent.code
+        return f"/{self.id.hex}/", self.code
+
+    def save(self, *args, **kwargs):
+        old = None
+        if not self._state.adding:
+            old = Facility.objects.filter(pk=self.pk).values_list("path", "root_code").first()
+        self.path, self.root_code = self._compute_lineage()
+        super().save(*args, **kwargs)
+
+        # Re-parentage ou changement de code racine : propage au sous-arbre en un seul UPDATE
+        if old and old[0] and (old[0], old[1]) != (self.path, self.root_code):
+            Facility.objects.filter(path__startswith=old[0]).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr("path", len(old[0]) + 1)),
+                root_code=self.root_code,
+            )
+
     class Meta:
         verbose_name = _("Établissement de santé")
         verbose_name_plural = _("Établissements de santé")
@@ -206,6 +253,8 @@ class Facility(UUIDModel, TimeStampedModel):
             models.Index(fields=["parent"]),
             models.Index(fields=["commune"]),
             models.Index(fields=["name"]),
+            models.Index(fields=["root_code"]),
+            models.Index(fields=["path"], name="facility_path_prefix_idx", opclasses=["text_pattern_ops"]),
             GistIndex(fields=["location"]),
             # <— index spatial GIST
         ]
@@ -272,6 +321,9 @@ class Bed(UUIDModel, TimeStampedModel, TenantScopedModel):
     department = models.ForeignKey(Department, on_delete=models.PROTECT, related_name="beds")
     code = models.CharField(max_length=32)
     active = models.BooleanField(default=True)
+    # Contraintes d'attribution : salle réservée à un sexe (vide = mixte), chambre d'isolement
+    ward_sex = models.CharField(max_length=1, choices=[("M", "Male"), ("F", "Female")], null=True, blank=True)
+    isolation = models.BooleanField(default=False)
 
     class Meta:
         verbose_name = _("Lit")
@@ -280,6 +332,9 @@ class Bed(UUIDModel, TimeStampedModel, TenantScopedModel):
         indexes = [
             models.Index(fields=["tenant_key", "active"]),
             models.Index(fields=["department"]),
+            # Recherche d'un lit libre : lits actifs d'un service, dans l'ordre d'attribution
+            models.Index(fields=["department", "code"], condition=models.Q(active=True),
+                         name="bed_active_by_department"),
         ]
 
 
@@ -333,25 +388,28 @@ class Patient(UUIDModel, TimeStampedModel):
             models.Index(fields=["family_name", "given_name"]),
             models.Index(fields=["birth_date"]),
             models.Index(fields=["is_deceased", "death_date"]),
+            # Recherche nom/prénoms par trigrammes, sans accents (hospital.search)
+            GinIndex(
+                OpClass(PatientSearchName("family_name", "given_name"), name="gin_trgm_ops"),
+                name="patient_search_name_trgm",
+            ),
         ]
 
     def clean(self):
         if self.is_deceased and not self.death_date:
             raise ValidationError("death_date is required when is_deceased=True.")
 
-    # Siblings (frères/soeurs) inférés via parents si disponibles
+    # Siblings (frères/soeurs) : parent commun (father/mother) ou lien Kinship SIBLING_OF.
+    # Une requête (index father_id, mother_id, kinship(src, relation)), pas d'union de querysets.
     @property
     def siblings_via_parents(self):
-        sibs = Patient.objects.none()
+        declared = Kinship.objects.filter(src_id=self.id, relation=Kinship.Relation.SIBLING_OF).values("dst_id")
+        cond = models.Q(id__in=declared)
         if self.father_id:
-            sibs = sibs.union(
-                Patient.objects.filter(father_id=self.father_id).exclude(id=self.id)
-            )
+            cond |= models.Q(father_id=self.father_id)
         if self.mother_id:
-            sibs = sibs.union(
-                Patient.objects.filter(mother_id=self.mother_id).exclude(id=self.id)
-            )
-        return sibs.distinct()
+            cond |= models.Q(mother_id=self.mother_id)
+        return Patient.objects.filter(cond).exclude(id=self.id)
 
     def __str__(self):
         label = self.mpi
@@ -360,13 +418,25 @@ class Patient(UUIDModel, TimeStampedModel):
         return label
 
 
+class DateRange(Func):
+    """daterange(from_date, to_date, '[)') : période semi-ouverte, borne haute NULL = en cours."""
+    function = "daterange"
+    output_field = DateRangeField()
+
+
+class TsTzRange(Func):
+    """tstzrange(start, end, '[)') : créneau semi-ouvert (deux RDV bout à bout ne se chevauchent pas)."""
+    function = "tstzrange"
+    output_field = DateTimeRangeField()
+
+
 class PatientResidence(UUIDModel, TimeStampedModel):
     """
     Historique des résidences du patient :
     - commune : rattachement géographique
     - address_text : précision libre si besoin (éviter PII sensible)
-    - period: from_date -> to_date (to_date null = courant)
-    - is_primary: une seule résidence principale active à la fois
+    - period: [from_date, to_date) (to_date exclu ; null = courant)
+    - is_primary: pas deux résidences principales qui se chevauchent (contrainte d'exclusion GiST)
     """
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="residences")
     commune = models.ForeignKey(Commune, on_delete=models.PROTECT, related_name="residents")
@@ -386,13 +456,18 @@ class PatientResidence(UUIDModel, TimeStampedModel):
             models.Index(fields=["patient", "is_primary"]),
             models.Index(fields=["commune"]),
         ]
-        # Un seul enregistrement "primaire" actif par patient
         constraints = [
-            models.UniqueConstraint(
-                fields=["patient"],
-                condition=models.Q(is_primary=True, to_date__isnull=True),
-                name="uniq_current_primary_residence_per_patient",
-            )
+            # Périodes principales disjointes par patient ; l'index GiST (patient_id, daterange)
+            # sert aussi les recherches "résidence à la date D" (hospital.residence).
+            ExclusionConstraint(
+                name="excl_overlapping_primary_residence",
+                expressions=[
+                    ("patient", RangeOperators.EQUAL),
+                    (DateRange("from_date", "to_date", Value("[)")), RangeOperators.OVERLAPS),
+                ],
+                condition=models.Q(is_primary=True),
+                index_type="gist",
+            ),
         ]
 
     def clean(self):
@@ -400,20 +475,24 @@ class PatientResidence(UUIDModel, TimeStampedModel):
         if self.to_date and self.to_date < self.from_date:
             raise ValidationError("to_date must be >= from_date.")
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        creating = self._state.adding
+        current = self.is_primary and self.to_date is None
+
+        # Nouvelle résidence principale courante : clore d'abord la précédente à from_date
+        # (sinon la contrainte d'exclusion refuse l'insertion)
+        if self._state.adding and current:
+            PatientResidence.objects.filter(
+                patient_id=self.patient_id, is_primary=True, to_date__isnull=True,
+                from_date__lt=self.from_date,
+            ).update(to_date=self.from_date)
+
         super().save(*args, **kwargs)
 
         # Si cette résidence est active et primaire, mettre à jour le "cache" sur Patient
-        if self.is_primary and self.to_date is None:
+        if current:
             Patient.objects.filter(id=self.patient_id).update(residence_commune_id=self.commune_id)
 
-        # Si on crée une nouvelle résidence primaire active, on peut clore l’ancienne automatiquement (optionnel)
-        if creating and self.is_primary and self.to_date is None:
-            PatientResidence.objects.filter(
-                patient_id=self.patient_id, is_primary=True, to_date__isnull=True
-            ).exclude(id=self.id).update(to_date=timezone.now().date())
-
 
 # =========================
 #       LIENS FAMILIAUX
@@ -465,21 +544,22 @@ class Kinship(UUIDModel, TimeStampedModel):
         self._ensure_symmetry()
 
     # --- Helpers de symétrie ---
+    @classmethod
+    def inverse_of(cls, relation):
+        """Relation réciproque (None si le lien n'en a pas, ex: GUARDIAN_OF)."""
+        return {
+            cls.Relation.SIBLING_OF: cls.Relation.SIBLING_OF,
+            cls.Relation.SPOUSE_OF: cls.Relation.SPOUSE_OF,
+            cls.Relation.PARENT_OF: cls.Relation.CHILD_OF,
+            cls.Relation.CHILD_OF: cls.Relation.PARENT_OF,
+        }.get(relation)
+
     def _ensure_symmetry(self):
         """
         Crée/maintient le lien réciproque quand la relation est symétrique
         ou nécessite une contrepartie (SIBLING_OF, SPOUSE_OF, PARENT/CHILD).
         """
-        inverse = None
-        if self.relation == self.Relation.SIBLING_OF:
-            inverse = self.Relation.SIBLING_OF
-        elif self.relation == self.Relation.SPOUSE_OF:
-            inverse = self.Relation.SPOUSE_OF
-        elif self.relation == self.Relation.PARENT_OF:
-            inverse = self.Relation.CHILD_OF
-        elif self.relation == self.Relation.CHILD_OF:
-            inverse = self.Relation.PARENT_OF
-
+        inverse = self.inverse_of(self.relation)
         if not inverse:
             return
 
@@ -496,27 +576,87 @@ class Kinship(UUIDModel, TimeStampedModel):
             defaults={"valid_from": when}
         )
 
+    # Lien + réciproque en un seul INSERT ... ON CONFLICT DO NOTHING (hospital.kinship)
     @staticmethod
     def add_siblings(a: Patient, b: Patient, when=None):
-        Kinship.objects.get_or_create(
-            src=a, dst=b, relation=Kinship.Relation.SIBLING_OF,
-            defaults={"valid_from": when}
-        )
-        Kinship.objects.get_or_create(
-            src=b, dst=a, relation=Kinship.Relation.SIBLING_OF,
-            defaults={"valid_from": when}
-        )
+        from .kinship import link_edges
+        link_edges([(a.pk, b.pk, Kinship.Relation.SIBLING_OF, when, None)])
 
     @staticmethod
     def add_spouses(a: Patient, b: Patient, when=None):
-        Kinship.objects.get_or_create(
-            src=a, dst=b, relation=Kinship.Relation.SPOUSE_OF,
-            defaults={"valid_from": when}
-        )
-        Kinship.objects.get_or_create(
-            src=b, dst=a, relation=Kinship.Relation.SPOUSE_OF,
-            defaults={"valid_from": when}
-        )
+        from .kinship import link_edges
+        link_edges([(a.pk, b.pk, Kinship.Relation.SPOUSE_OF, when, None)])
+
+
+# =========================
+#   DÉDOUBLONNAGE (MPI)
+# =========================
+class PatientBlockingKey(models.Model):
+    """
+    Clés de blocage du rapprochement d'identités (hospital.matching) : seules les paires de
+    patients partageant au moins une clé sont comparées. Table dérivée, reconstruite à volonté.
+    """
+
+    class Kind(models.TextChoices):
+        NAME_YEAR = "NAME_YEAR", "Nom phonétique + année de naissance"
+        NAME_GIVEN = "NAME_GIVEN", "Nom + prénom phonétiques"
+        CMU = "CMU", "CMU (haché)"
+        CNI = "CNI", "CNI (hachée)"
+        PHONE = "PHONE", "Téléphone (haché)"
+        NATIONAL_ID = "NATIONAL_ID", "Identifiant national (haché)"
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="blocking_keys")
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    key = models.CharField(max_length=64)
+
+    class Meta:
+        verbose_name = _("Clé de blocage patient")
+        verbose_name_plural = _("Clés de blocage patient")
+        indexes = [
+            models.Index(fields=["kind", "key"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "kind", "key"], name="uniq_patient_blocking_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
+
+
+class DuplicateCandidate(UUIDModel, TimeStampedModel):
+    """
+    Paire de patients probablement identiques, à revoir par un gestionnaire d'identité.
+    Paire canonique : patient_a.id < patient_b.id (une seule ligne par paire).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "À revoir"
+        CONFIRMED = "CONFIRMED", "Doublon confirmé"
+        REJECTED = "REJECTED", "Patients distincts"
+        MERGED = "MERGED", "Fusionnés"
+
+    patient_a = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="duplicate_candidates_a")
+    patient_b = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="duplicate_candidates_b")
+    score = models.FloatField(db_index=True)
+    # Poids (log2 Fellegi-Sunter) par champ comparé : {"family_name": 2.7, "birth_date": 5.0, ...}
+    components = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Doublon potentiel")
+        verbose_name_plural = _("Doublons potentiels")
+        indexes = [
+            models.Index(fields=["status", "-score"]),
+            models.Index(fields=["patient_b"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["patient_a", "patient_b"], name="uniq_duplicate_pair"),
+            models.CheckConstraint(check=models.Q(patient_a__lt=F("patient_b")), name="duplicate_pair_ordered"),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_a_id} ~ {self.patient_b_id} ({self.score:.1f})"
 
 
 class VisitType(UUIDModel, TimeStampedModel):
@@ -584,10 +724,7 @@ class EncounterEvent(UUIDModel, TimeStampedModel, TenantScopedModel):
 
     note = models.CharField(max_length=255, null=True, blank=True)
 
-    def _derive_tenant_key(self):
-        # Récupère via encounter -> facility
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Événement de séjour")
@@ -614,12 +751,10 @@ class BedOccupancy(UUIDModel, TimeStampedModel, TenantScopedModel):
     patient = models.ForeignKey(Patient, on_delete=models.PROTECT)
     from_ts = models.DateTimeField(db_index=True)
     to_ts = models.DateTimeField(null=True, blank=True, db_index=True)
-    status = models.CharField(max_length=16, default="OCCUPIED")
+    status = models.CharField(max_length=16, default="OCCUPIED")  # OCCUPIED, RESERVED, BLOCKED, RELEASED...
+    expires_at = models.DateTimeField(null=True, blank=True)  # fin de validité d'une réservation
 
-    def _derive_tenant_key(self):
-        if self.bed_id and self.bed and self.bed.facility_id:
-            root = self.bed.facility.root() if hasattr(self.bed.facility, "root") else self.bed.facility
-            self.tenant_key = root.code
+    TENANT_KEY_SOURCE = "bed__facility__root_code"
 
     class Meta:
         verbose_name = _("Occupation de lit")
@@ -628,6 +763,9 @@ class BedOccupancy(UUIDModel, TimeStampedModel, TenantScopedModel):
             models.Index(fields=["tenant_key", "from_ts"]),
             models.Index(fields=["bed"]),
             models.Index(fields=["patient"]),
+            # Réservations ouvertes à expirer
+            models.Index(fields=["expires_at"], condition=models.Q(to_ts__isnull=True, status="RESERVED"),
+                         name="bedocc_open_reservation"),
         ]
         constraints = [
             models.CheckConstraint(
@@ -668,9 +806,7 @@ class ClinicalOrder(UUIDModel, TimeStampedModel, TenantScopedModel):
     ordered_by = models.ForeignKey('Practitioner', null=True, blank=True, on_delete=models.SET_NULL)
     reason = models.CharField(max_length=255, null=True, blank=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Commande clinique")
@@ -692,9 +828,7 @@ class OrderItem(UUIDModel, TimeStampedModel, TenantScopedModel):
     status = models.CharField(max_length=16, default="ORDERED")  # ORDERED / IN_PROGRESS / DONE / CANCELLED
     scheduled_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
-    def _derive_tenant_key(self):
-        if self.order_id and self.order and self.order.encounter_id:
-            self.tenant_key = self.order.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "order__encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Ligne de commande")
@@ -702,6 +836,9 @@ class OrderItem(UUIDModel, TimeStampedModel, TenantScopedModel):
         indexes = [
             models.Index(fields=["tenant_key", "status"]),
             models.Index(fields=["code"]),
+            # Liste de travail du laboratoire (laboratory.worklist) : lignes en attente d'un CHU par examen
+            models.Index(fields=["tenant_key", "code"], condition=models.Q(status="ORDERED"),
+                         name="orderitem_pending_code"),
         ]
 
 
@@ -713,9 +850,7 @@ class Procedure(UUIDModel, TimeStampedModel, TenantScopedModel):
     performed_at = models.DateTimeField(db_index=True)
     performer = models.ForeignKey('Practitioner', null=True, blank=True, on_delete=models.SET_NULL)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Acte / Procédure")
@@ -735,9 +870,7 @@ class DiagnosticReport(UUIDModel, TimeStampedModel, TenantScopedModel):
     status = models.CharField(max_length=24, default="FINAL")
     issued_at = models.DateTimeField(db_index=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Compte rendu diagnostique")
@@ -769,9 +902,7 @@ class Specimen(UUIDModel, TimeStampedModel, TenantScopedModel):
 
     items = models.ManyToManyField(OrderItem, related_name="specimens", blank=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Échantillon biologique")
@@ -790,9 +921,7 @@ class Observation(UUIDModel, TimeStampedModel, TenantScopedModel):
     result_flag = models.CharField(max_length=16, null=True, blank=True)
     observed_at = models.DateTimeField(db_index=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Observation / Résultat")
@@ -816,13 +945,13 @@ class Payer(UUIDModel, TimeStampedModel):
 class Invoice(UUIDModel, TimeStampedModel, TenantScopedModel):
     encounter = models.ForeignKey(Encounter, on_delete=models.PROTECT, related_name="invoices")
     payer = models.ForeignKey(Payer, null=True, blank=True, on_delete=models.SET_NULL)
-    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Somme des InvoiceLine.amount, tenue par triggers Postgres (migration 0013) :
+    # lecture seule côté application ; rattrapage : commande recompute_invoice_totals.
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
     status = models.CharField(max_length=16, default="DRAFT")
     issued_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Facture")
@@ -830,8 +959,19 @@ class Invoice(UUIDModel, TimeStampedModel, TenantScopedModel):
         indexes = [
             models.Index(fields=["tenant_key", "issued_at", "status"]),
             models.Index(fields=["encounter"]),
+            # Jour de rattachement des agrégats finances (émission, à défaut création)
+            models.Index(F("tenant_key"), Coalesce("issued_at", "created_at"), name="invoice_tenant_revenue_ts"),
         ]
 
+    def save(self, *args, **kwargs):
+        # total n'est jamais réécrit depuis une instance (valeur possiblement périmée) :
+        # seuls les triggers des lignes le modifient.
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                f.attname for f in self._meta.concrete_fields if not f.primary_key and f.name != "total"
+            ]
+        super().save(*args, **kwargs)
+
 
 class InvoiceLine(UUIDModel, TimeStampedModel):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="lines")
@@ -839,6 +979,10 @@ class InvoiceLine(UUIDModel, TimeStampedModel):
     label = models.CharField(max_length=255)
     qty = models.IntegerField(default=1)
     unit_price = models.DecimalField(max_digits=14, decimal_places=2)
+    # qty * unit_price, colonne calculée par trigger BEFORE (équivalent d'une colonne
+    # GENERATED ALWAYS AS ... STORED, que l'ORM de Django 4.2 ne sait pas exclure des INSERT) :
+    # les rapports somment en SQL, sans recalcul Python.
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0, editable=False)
 
     class Meta:
         verbose_name = _("Ligne de facture")
@@ -848,9 +992,10 @@ class InvoiceLine(UUIDModel, TimeStampedModel):
             models.CheckConstraint(check=models.Q(unit_price__gte=0), name="invoiceline_unit_price_ge_0"),
         ]
 
-    @property
-    def amount(self):
-        return self.qty * self.unit_price
+    def save(self, *args, **kwargs):
+        # La base fait foi (trigger) ; on aligne l'instance pour éviter un rechargement.
+        self.amount = self.qty * self.unit_price
+        super().save(*args, **kwargs)
 
 
 class Appointment(UUIDModel, TimeStampedModel, TenantScopedModel):
@@ -860,7 +1005,8 @@ class Appointment(UUIDModel, TimeStampedModel, TenantScopedModel):
     department = models.ForeignKey(Department, null=True, blank=True, on_delete=models.SET_NULL)
     start_at = models.DateTimeField(db_index=True)
     end_at = models.DateTimeField(db_index=True)
-    status = models.CharField(max_length=16, default="SCHEDULED")  # SCHEDULED, DONE, MISSED, CANCELLED
+    # SCHEDULED, DONE, MISSED, CANCELLED ; CONFLICT : chevauchement hérité d'avant la contrainte (à replanifier)
+    status = models.CharField(max_length=16, default="SCHEDULED")
     reason = models.CharField(max_length=255, null=True, blank=True)
 
     class Meta:
@@ -875,14 +1021,124 @@ class Appointment(UUIDModel, TimeStampedModel, TenantScopedModel):
                 check=models.Q(end_at__gt=models.F("start_at")),
                 name="appt_time_valid",
             ),
-            # Un RDV actif identique exact (praticien+start) interdit
-            models.UniqueConstraint(
-                fields=["practitioner", "start_at"],
-                name="uniq_practitioner_start",
+            # Pas de chevauchement entre RDV programmés d'un même praticien
+            # (remplace l'unicité praticien + début, qui ne voyait pas les chevauchements)
+            ExclusionConstraint(
+                name="excl_practitioner_overlap",
+                expressions=[
+                    ("practitioner", RangeOperators.EQUAL),
+                    (TsTzRange("start_at", "end_at", Value("[)")), RangeOperators.OVERLAPS),
+                ],
+                condition=models.Q(status="SCHEDULED", practitioner__isnull=False),
+                index_type="gist",
             ),
         ]
 
 
+class PractitionerSchedule(UUIDModel, TimeStampedModel, TenantScopedModel):
+    """
+    Modèle de planning hebdomadaire : plage de consultation d'un praticien un jour de semaine
+    (heure locale), découpée en créneaux de slot_minutes, valable entre valid_from et valid_to.
+    """
+
+    class Weekday(models.IntegerChoices):  # ISO 8601 (extract(isodow ...))
+        MONDAY = 1, _("Lundi")
+        TUESDAY = 2, _("Mardi")
+        WEDNESDAY = 3, _("Mercredi")
+        THURSDAY = 4, _("Jeudi")
+        FRIDAY = 5, _("Vendredi")
+        SATURDAY = 6, _("Samedi")
+        SUNDAY = 7, _("Dimanche")
+
+    practitioner = models.ForeignKey(Practitioner, on_delete=models.CASCADE, related_name="schedules")
+    facility = models.ForeignKey(Facility, on_delete=models.PROTECT)
+    department = models.ForeignKey(Department, null=True, blank=True, on_delete=models.SET_NULL)
+    weekday = models.PositiveSmallIntegerField(choices=Weekday.choices)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=15)
+    valid_from = models.DateField(default=timezone.localdate)
+    valid_to = models.DateField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = _("Planning praticien")
+        verbose_name_plural = _("Plannings praticiens")
+        indexes = [
+            models.Index(fields=["practitioner", "weekday"], condition=models.Q(active=True),
+                         name="schedule_active_by_weekday"),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(end_time__gt=models.F("start_time")), name="schedule_time_valid"),
+            models.CheckConstraint(check=models.Q(slot_minutes__gte=5, slot_minutes__lte=240),
+                                   name="schedule_slot_minutes_range"),
+        ]
+
+
+class PractitionerAbsence(UUIDModel, TimeStampedModel, TenantScopedModel):
+    """Indisponibilité ponctuelle (congé, garde, formation) retirée des plannings."""
+    practitioner = models.ForeignKey(Practitioner, on_delete=models.CASCADE, related_name="absences")
+    start_at = models.DateTimeField()
+    end_at = models.DateTimeField()
+    reason = models.CharField(max_length=255, null=True, blank=True)
+
+    TENANT_KEY_SOURCE = "practitioner__facility__root_code"
+
+    class Meta:
+        verbose_name = _("Absence praticien")
+        verbose_name_plural = _("Absences praticiens")
+        indexes = [
+            models.Index(fields=["practitioner", "start_at"]),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(end_at__gt=models.F("start_at")), name="absence_time_valid"),
+        ]
+
+
+class NotificationOutbox(UUIDModel, TimeStampedModel, TenantScopedModel):
+    """
+    File d'envoi des notifications (SMS). Les producteurs insèrent (dedupe_key unique :
+    un rappel par RDV et par jour, quel que soit le nombre de passages), le dispatcher
+    (hospital.notifications) réclame des lots par fournisseur en SKIP LOCKED.
+    PENDING -> SENDING -> SENT ; échec temporaire : PENDING à next_attempt_at (backoff) ;
+    échec définitif ou tentatives épuisées : DEAD.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", _("En attente")
+        SENDING = "SENDING", _("En cours d'envoi")
+        SENT = "SENT", _("Envoyé")
+        DEAD = "DEAD", _("Abandonné")
+
+    kind = models.CharField(max_length=32, db_index=True)  # APPT_REMINDER, ...
+    channel = models.CharField(max_length=16, default="SMS")
+    provider = models.CharField(max_length=32)
+    recipient = models.CharField(max_length=32, validators=[phone_e164])
+    body = models.TextField()
+    dedupe_key = models.CharField(max_length=128, unique=True)
+    facility = models.ForeignKey(Facility, on_delete=models.PROTECT, related_name="+")
+    appointment = models.ForeignKey(Appointment, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    provider_message_id = models.CharField(max_length=128, null=True, blank=True)
+    last_error = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Notification (file d'envoi)")
+        verbose_name_plural = _("Notifications (file d'envoi)")
+        indexes = [
+            models.Index(fields=["tenant_key", "created_at"]),
+            # Réclamation des lots : messages dus d'un fournisseur
+            models.Index(fields=["provider", "next_attempt_at"], condition=models.Q(status="PENDING"),
+                         name="outbox_pending_by_provider"),
+            # Reprise des lots abandonnés par un worker tombé
+            models.Index(fields=["locked_at"], condition=models.Q(status="SENDING"), name="outbox_sending_lease"),
+        ]
+
 # 6) Referral : choisir la clé de périmètre (source ou cible)
 class Referral(UUIDModel, TimeStampedModel, TenantScopedModel):
     from_facility = models.ForeignKey(Facility, on_delete=models.PROTECT, related_name="referrals_out")
@@ -891,11 +1147,8 @@ class Referral(UUIDModel, TimeStampedModel, TenantScopedModel):
     encounter_id = models.UUIDField(null=True, blank=True)
     status = models.CharField(max_length=16, default="OPEN")  # OPEN, ACCEPTED, REJECTED, CLOSED
 
-    def _derive_tenant_key(self):
-        # Politique : on "scope" sur la source (from_facility)
-        root = self.from_facility.root() if self.from_facility_id else None
-        if root:
-            self.tenant_key = root.code
+    # Politique : on "scope" sur la source (from_facility)
+    TENANT_KEY_SOURCE = "from_facility__root_code"
 
     class Meta:
         verbose_name = _("Référence / Transfert")
@@ -947,9 +1200,7 @@ class ImagingStudy(UUIDModel, TimeStampedModel, TenantScopedModel):
     performed_at = models.DateTimeField(db_index=True, null=True, blank=True)
     images_count = models.IntegerField(default=0)
 
-    def _derive_tenant_key(self):
-        if self.order_item_id and self.order_item and self.order_item.order_id:
-            self.tenant_key = self.order_item.order.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "order_item__order__encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Étude d’imagerie")
@@ -985,9 +1236,7 @@ class Prescription(UUIDModel, TimeStampedModel, TenantScopedModel):
     status = models.CharField(max_length=16, default="ACTIVE")  # ACTIVE/PAUSED/STOPPED/COMPLETED/CANCELLED
     note = models.CharField(max_length=255, null=True, blank=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Prescription")
@@ -1006,9 +1255,7 @@ class PrescriptionLine(UUIDModel, TimeStampedModel, TenantScopedModel):
     start_at = models.DateTimeField(null=True, blank=True)
     end_at = models.DateTimeField(null=True, blank=True)
 
-    def _derive_tenant_key(self):
-        if self.prescription_id:
-            self.tenant_key = self.prescription.tenant_key
+    TENANT_KEY_SOURCE = "prescription__tenant_key"
 
     class Meta:
         verbose_name = _("Ligne de prescription")
@@ -1025,9 +1272,7 @@ class MedicationDispense(UUIDModel, TimeStampedModel, TenantScopedModel):
     dispensed_at = models.DateTimeField(db_index=True)
     dispenser = models.ForeignKey('Practitioner', null=True, blank=True, on_delete=models.SET_NULL)
 
-    def _derive_tenant_key(self):
-        if self.prescription_line_id:
-            self.tenant_key = self.prescription_line.tenant_key
+    TENANT_KEY_SOURCE = "prescription_line__tenant_key"
 
     class Meta:
         verbose_name = _("Dispensation")
@@ -1045,9 +1290,7 @@ class MedicationAdministration(UUIDModel, TimeStampedModel, TenantScopedModel):
     nurse = models.ForeignKey('Practitioner', null=True, blank=True, on_delete=models.SET_NULL)
     note = models.CharField(max_length=255, null=True, blank=True)
 
-    def _derive_tenant_key(self):
-        if self.prescription_line_id:
-            self.tenant_key = self.prescription_line.tenant_key
+    TENANT_KEY_SOURCE = "prescription_line__tenant_key"
 
     class Meta:
         verbose_name = _("Administration médicamenteuse")
@@ -1062,9 +1305,7 @@ class DischargeSummary(UUIDModel, TimeStampedModel, TenantScopedModel):
     notes = models.TextField(null=True, blank=True)
     discharged_at = models.DateTimeField(db_index=True)
 
-    def _derive_tenant_key(self):
-        if self.encounter_id and self.encounter and self.encounter.facility_id:
-            self.tenant_key = self.encounter.facility.root().code
+    TENANT_KEY_SOURCE = "encounter__facility__root_code"
 
     class Meta:
         verbose_name = _("Résumé de sortie")
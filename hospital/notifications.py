@@ -0,0 +1,390 @@
+# hospital/notifications.py
+"""
+Notifications sortantes (SMS) : file d'envoi NotificationOutbox + dispatcher par fournisseur.
+
+  producteurs   INSERT ... SELECT ... ON CONFLICT (dedupe_key) DO NOTHING (ex. rappels de RDV)
+  dispatcher    réclame un lot (UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT n)
+                RETURNING ...), consomme des jetons du seau du fournisseur, envoie, enregistre
+                les résultats en masse ; échec temporaire -> nouvel essai avec backoff exponentiel.
+  passerelles   interface SMSGateway, configurée par NOTIFICATION_GATEWAYS :
+                FileGateway (NDJSON local) et InMemoryGateway (tests) en attendant un opérateur.
+
+Plusieurs workers Celery peuvent traiter le même fournisseur : les lots sont disjoints
+(SKIP LOCKED) et le seau à jetons est partagé dans Redis.
+Un worker tombé pendant un envoi laisse des lignes SENDING : reclaim_stale() les remet en
+file après NOTIFICATION_LEASE_SECONDS (l'id de la ligne sert de référence d'idempotence
+auprès du fournisseur).
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from prometheus_client import Counter as PromCounter, Histogram
+
+from .models import Appointment, Facility, NotificationOutbox, Patient, UserProfile
+
+logger = logging.getLogger(__name__)
+
+Status = NotificationOutbox.Status
+
+NOTIFICATIONS = PromCounter(
+    "sigh_notifications",
+    "Notifications traitées par le dispatcher (sent / retry / dead)",
+    ("provider", "result"),
+)
+GATEWAY_SECONDS = Histogram(
+    "sigh_notification_gateway_seconds",
+    "Durée d'un appel passerelle (un lot)",
+    ("provider",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")),
+)
+DELIVERY_LATENCY = Histogram(
+    "sigh_notification_delivery_latency_seconds",
+    "Délai entre la mise en file et l'acceptation par le fournisseur",
+    ("provider",),
+    buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600, 3 * 3600, 12 * 3600, float("inf")),
+)
+THROTTLED = PromCounter(
+    "sigh_notification_throttle_seconds",
+    "Temps passé à attendre des jetons (limite de débit du fournisseur)",
+    ("provider",),
+)
+
+
+# ------------- Passerelles -------------
+@dataclass
+class OutboundMessage:
+    id: str
+    recipient: str
+    body: str
+
+
+@dataclass
+class SendResult:
+    id: str
+    ok: bool
+    provider_message_id: str = None
+    error: str = None
+    retryable: bool = True
+
+
+class SMSGateway:
+    """
+    Interface fournisseur : send_batch(messages) -> un SendResult par message.
+    Une exception levée par send_batch vaut échec temporaire pour tout le lot.
+    """
+
+    def __init__(self, name, **options):
+        self.name = name
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+class InMemoryGateway(SMSGateway):
+    """Passerelle de test : messages conservés en mémoire (InMemoryGateway.sent)."""
+    sent = []
+    _lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self._lock:
+            self.sent.extend((self.name, m) for m in messages)
+        return [SendResult(m.id, True, provider_message_id=f"mem-{m.id}") for m in messages]
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent.clear()
+
+
+class FileGateway(SMSGateway):
+    """Passerelle locale : une ligne NDJSON par message dans `path` (dev, recette)."""
+    _lock = threading.Lock()
+
+    def __init__(self, name, path, **options):
+        super().__init__(name, **options)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def send_batch(self, messages):
+        now = timezone.now().isoformat()
+        lines = "".join(
+            json.dumps({"provider": self.name, "id": m.id, "to": m.recipient, "body": m.body, "at": now},
+                       ensure_ascii=False) + "\n"
+            for m in messages
+        )
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+        return [SendResult(m.id, True, provider_message_id=f"file-{m.id}") for m in messages]
+
+
+def _provider_conf(provider):
+    gateways = settings.NOTIFICATION_GATEWAYS
+    if provider not in gateways:
+        raise KeyError(f"Fournisseur de notifications inconnu : {provider}")
+    return gateways[provider]
+
+
+@lru_cache(maxsize=None)
+def get_gateway(provider):
+    conf = _provider_conf(provider)
+    return import_string(conf["BACKEND"])(provider, **conf.get("OPTIONS", {}))
+
+
+# ------------- Limitation de débit -------------
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(want, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return granted
+"""
+
+
+class TokenBucket:
+    """
+    Seau à jetons : `rate` messages/s en régime établi, rafales jusqu'à `burst`.
+    Avec un client Redis, l'état est partagé par tous les workers (script Lua atomique,
+    horloge du serveur Redis) ; sans client, état local au processus (tests, passerelle fichier).
+    """
+
+    def __init__(self, key, rate, burst, client=None):
+        self.key, self.rate, self.burst = key, float(rate), max(int(burst), 1)
+        self.client = client
+        self._script = client.register_script(TOKEN_BUCKET_LUA) if client is not None else None
+        self._tokens, self._ts = float(self.burst), time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, want):
+        """Jetons obtenus immédiatement (0..want), sans attendre."""
+        if self._script is not None:
+            return int(self._script(keys=[self.key], args=[self.rate, self.burst, want]))
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            granted = min(want, int(self._tokens))
+            self._tokens -= granted
+            return granted
+
+    def acquire(self, want):
+        """
+        Attend des jetons ; retourne (jetons obtenus <= want, secondes d'attente).
+        Seau vide : on attend le temps de remplir un morceau entier (min(want, burst)) plutôt
+        qu'un jeton, pour garder des appels passerelle groupés en régime établi.
+        """
+        waited, chunk = 0.0, min(want, self.burst)
+        while True:
+            granted = self.take(chunk)
+            if granted:
+                return granted, waited
+            pause = chunk / self.rate
+            time.sleep(pause)
+            waited += pause
+
+
+@lru_cache(maxsize=None)
+def get_bucket(provider):
+    conf = _provider_conf(provider)
+    client = get_redis_connection("default") if conf.get("SHARED_RATE_LIMIT", True) else None
+    return TokenBucket(f"sigh:notif:bucket:{provider}", conf.get("RATE", 10), conf.get("BURST", 20), client)
+
+
+# ------------- Producteurs -------------
+REMINDER_SQL = """
+INSERT INTO {outbox} (id, created_at, updated_at, tenant_key, kind, channel, provider, recipient, body,
+                      dedupe_key, facility_id, appointment_id, status, attempts, next_attempt_at)
+SELECT gen_random_uuid(), now(), now(), a.tenant_key, 'APPT_REMINDER', 'SMS', {provider}, u.phone,
+       format(%(template)s,
+              to_char(a.start_at AT TIME ZONE %(tz)s, 'DD/MM/YYYY'),
+              to_char(a.start_at AT TIME ZONE %(tz)s, 'HH24:MI'),
+              f.name),
+       'appt-reminder:' || a.id || ':' || to_char(a.start_at AT TIME ZONE %(tz)s, 'YYYY-MM-DD'),
+       a.facility_id, a.id, 'PENDING', 0, now()
+FROM {appointment} a
+JOIN {patient} p ON p.id = a.patient_id
+JOIN LATERAL (
+    SELECT up.phone FROM {userprofile} up
+    WHERE up.patient_mpi = p.mpi AND up.phone IS NOT NULL AND up.phone <> ''
+    ORDER BY up.updated_at DESC
+    LIMIT 1
+) u ON true
+JOIN {facility} f ON f.id = a.facility_id
+WHERE a.status = 'SCHEDULED' AND a.start_at >= %(start)s AND a.start_at < %(end)s
+ON CONFLICT (dedupe_key) DO NOTHING
+"""
+
+
+def _provider_case():
+    """CASE SQL : fournisseur selon le préfixe E.164 (NOTIFICATION_ROUTES, le plus long d'abord)."""
+    routes = sorted(settings.NOTIFICATION_ROUTES.items(), key=lambda kv: -len(kv[0]))
+    params = {"default_provider": settings.NOTIFICATION_DEFAULT_PROVIDER}
+    if not routes:
+        return "%(default_provider)s", params
+    whens = []
+    for i, (prefix, provider) in enumerate(routes):
+        params[f"route_prefix_{i}"], params[f"route_provider_{i}"] = prefix + "%", provider
+        whens.append(f"WHEN u.phone LIKE %(route_prefix_{i})s THEN %(route_provider_{i})s")
+    return f"CASE {' '.join(whens)} ELSE %(default_provider)s END", params
+
+
+def enqueue_appointment_reminders(day=None):
+    """
+    Met en file un rappel SMS par RDV programmé du jour `day` (défaut : demain, heure locale)
+    dont le patient a un compte avec téléphone (UserProfile.patient_mpi). Une instruction ;
+    relancer pour le même jour n'ajoute rien (dedupe_key). Retourne le nombre de messages ajoutés.
+    """
+    day = day or timezone.localdate() + datetime.timedelta(days=1)
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    provider, params = _provider_case()
+    params.update({
+        "start": start,
+        "end": start + datetime.timedelta(days=1),
+        "tz": settings.TIME_ZONE,
+        "template": settings.NOTIFICATION_REMINDER_TEMPLATE,
+    })
+    sql = REMINDER_SQL.format(
+        outbox=NotificationOutbox._meta.db_table,
+        appointment=Appointment._meta.db_table,
+        patient=Patient._meta.db_table,
+        userprofile=UserProfile._meta.db_table,
+        facility=Facility._meta.db_table,
+        provider=provider,
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.rowcount
+
+
+# ------------- Dispatcher -------------
+CLAIM_SQL = """
+UPDATE {outbox} o
+SET status = 'SENDING', locked_at = now(), attempts = o.attempts + 1, updated_at = now()
+WHERE o.id IN (
+    SELECT id FROM {outbox}
+    WHERE status = 'PENDING' AND provider = %s AND next_attempt_at <= now()
+    ORDER BY next_attempt_at
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING o.id, o.recipient, o.body, o.attempts, o.created_at
+"""
+
+
+def _claim(provider, limit):
+    with connection.cursor() as cur:
+        cur.execute(CLAIM_SQL.format(outbox=NotificationOutbox._meta.db_table), [provider, limit])
+        return cur.fetchall()
+
+
+def backoff(attempt):
+    """Délai avant la tentative suivante : exponentiel, plafonné, avec gigue (50-100 %)."""
+    base = settings.NOTIFICATION_RETRY_BASE_SECONDS
+    cap = settings.NOTIFICATION_RETRY_MAX_SECONDS
+    return min(cap, base * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+
+def _record(provider, claimed, results):
+    now = timezone.now()
+    by_id = {str(r.id): r for r in results}
+    max_attempts = settings.NOTIFICATION_MAX_ATTEMPTS
+    rows, counts = [], {"sent": 0, "retry": 0, "dead": 0}
+    for pk, _, _, attempts, created_at in claimed:
+        result = by_id.get(str(pk)) or SendResult(str(pk), False, error="Pas de réponse de la passerelle")
+        row = NotificationOutbox(pk=pk, locked_at=None, updated_at=now)
+        if result.ok:
+            row.status, row.sent_at, row.provider_message_id, row.last_error = Status.SENT, now, result.provider_message_id, None
+            DELIVERY_LATENCY.labels(provider).observe((now - created_at).total_seconds())
+            counts["sent"] += 1
+        elif result.retryable and attempts < max_attempts:
+            row.status, row.next_attempt_at = Status.PENDING, now + datetime.timedelta(seconds=backoff(attempts))
+            row.last_error = (result.error or "")[:255]
+            counts["retry"] += 1
+        else:
+            row.status, row.last_error = Status.DEAD, (result.error or "")[:255]
+            counts["dead"] += 1
+        rows.append(row)
+    for status in (Status.SENT, Status.PENDING, Status.DEAD):
+        group = [r for r in rows if r.status == status]
+        if not group:
+            continue
+        fields = {
+            Status.SENT: ["status", "sent_at", "provider_message_id", "last_error", "locked_at", "updated_at"],
+            Status.PENDING: ["status", "next_attempt_at", "last_error", "locked_at", "updated_at"],
+            Status.DEAD: ["status", "last_error", "locked_at", "updated_at"],
+        }[status]
+        NotificationOutbox.objects.bulk_update(group, fields)
+    for result_name, n in counts.items():
+        if n:
+            NOTIFICATIONS.labels(provider, result_name).inc(n)
+    return counts
+
+
+def dispatch(provider, max_seconds=None, batch_size=None):
+    """
+    Envoie les messages dus du fournisseur par lots, au débit autorisé, jusqu'à épuisement
+    de la file ou de max_seconds. Retourne les compteurs {sent, retry, dead, batches}.
+    """
+    conf = _provider_conf(provider)
+    batch_size = batch_size or conf.get("BATCH", 100)
+    gateway, bucket = get_gateway(provider), get_bucket(provider)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    totals = {"sent": 0, "retry": 0, "dead": 0, "batches": 0}
+    while deadline is None or time.monotonic() < deadline:
+        claimed = _claim(provider, batch_size)
+        if not claimed:
+            break
+        messages = [OutboundMessage(str(pk), recipient, body) for pk, recipient, body, _, _ in claimed]
+        results = []
+        while messages:
+            granted, waited = bucket.acquire(len(messages))
+            if waited:
+                THROTTLED.labels(provider).inc(waited)
+            chunk, messages = messages[:granted], messages[granted:]
+            t0 = time.perf_counter()
+            try:
+                results += gateway.send_batch(chunk)
+            except Exception as exc:  # noqa: BLE001 - échec temporaire de tout le morceau
+                logger.warning("Passerelle %s : échec d'envoi (%s)", provider, exc)
+                results += [SendResult(m.id, False, error=str(exc)) for m in chunk]
+            GATEWAY_SECONDS.labels(provider).observe(time.perf_counter() - t0)
+        for name, n in _record(provider, claimed, results).items():
+            totals[name] += n
+        totals["batches"] += 1
+    return totals
+
+
+def reclaim_stale():
+    """Remet en file les messages SENDING dont le bail a expiré (worker tombé)."""
+    lease = datetime.timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+    return NotificationOutbox.objects.filter(status=Status.SENDING, locked_at__lt=timezone.now() - lease).update(
+        status=Status.PENDING, locked_at=None, next_attempt_at=timezone.now(), updated_at=timezone.now()
+    )
+
+
+def due_providers():
+    """Fournisseurs ayant des messages dus (un lot de travail Celery par fournisseur)."""
+    return list(
+        NotificationOutbox.objects.filter(status=Status.PENDING, next_attempt_at__lte=timezone.now())
+        .values_list("provider", flat=True).distinct().order_by()
+    )
@@ -0,0 +1,39 @@
+# hospital/residence.py
+"""
+Résidence principale à une date donnée, en masse.
+
+Les périodes principales d'un patient sont disjointes (contrainte d'exclusion
+excl_overlapping_primary_residence), donc au plus une ligne par (patient, date) :
+une simple jointure ensembliste suffit, servie par l'index GiST (patient_id, daterange)
+de la contrainte — pas de sous-requête corrélée ni de LIMIT 1 par patient.
+"""
+from django.db import connection
+
+from .models import Commune, PatientResidence
+
+MAX_ITEMS = 10000
+
+COMMUNES_AS_OF_SQL = f"""
+SELECT q.idx, r.commune_id, c.name
+FROM unnest(%s::uuid[], %s::date[]) WITH ORDINALITY AS q (patient_id, at, idx)
+LEFT JOIN {PatientResidence._meta.db_table} r
+       ON r.patient_id = q.patient_id
+      AND r.is_primary
+      AND daterange(r.from_date, r.to_date, '[)') @> q.at
+LEFT JOIN {Commune._meta.db_table} c ON c.id = r.commune_id
+ORDER BY q.idx
+"""
+
+
+def communes_as_of(pairs):
+    """
+    pairs : [(patient_id, date), ...] -> [(commune_id | None, commune_name | None), ...]
+    dans le même ordre (une requête pour toute la liste).
+    """
+    if not pairs:
+        return []
+    patients = [str(p) for p, _ in pairs]
+    dates = [d for _, d in pairs]
+    with connection.cursor() as cur:
+        cur.execute(COMMUNES_AS_OF_SQL, [patients, dates])
+        return [(commune_id, name) for _, commune_id, name in cur.fetchall()]
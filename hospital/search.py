@@ -0,0 +1,68 @@
+# hospital/search.py
+"""
+Recherche patient par similarité trigramme (pg_trgm) insensible aux accents (unaccent).
+
+L'index GIN porte sur patient_search_name(family_name, given_name) : fonction SQL IMMUTABLE
+(créée par la migration 0006) = unaccent(lower(nom || ' ' || prénoms)). La requête emploie
+exactement la même expression, seule condition pour que Postgres utilise l'index.
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Func, Q, TextField, Value, When
+
+DEFAULT_MIN_SIMILARITY = 0.45
+
+
+class SighUnaccent(Func):
+    """sigh_unaccent(text) : lower + unaccent, IMMUTABLE (utilisable dans un index)."""
+    function = "sigh_unaccent"
+    output_field = TextField()
+
+
+class PatientSearchName(Func):
+    """patient_search_name(family_name, given_name) : clé de recherche normalisée."""
+    function = "patient_search_name"
+    output_field = TextField()
+
+
+def _set_threshold():
+    # Seuil de l'opérateur %> (word_similarity) ; local à la transaction de la requête
+    threshold = getattr(settings, "PATIENT_SEARCH_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY)
+    with connection.cursor() as cur:
+        cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(threshold)])
+
+
+def search_patients(queryset, q, birth_year=None, sex=None, commune=None):
+    """
+    Patients dont le nom ressemble à `q` (fautes, accents, ordre nom/prénoms indifférent),
+    classés par similarité décroissante ; un MPI exact passe en tête (rank = 1).
+    Filtres combinables : année de naissance, sexe, commune de résidence actuelle.
+    """
+    term = SighUnaccent(Value(q))
+    name = PatientSearchName("family_name", "given_name")
+    _set_threshold()
+
+    queryset = queryset.alias(search_name=name).filter(
+        Q(search_name__trigram_word_similar=term) | Q(mpi=q)
+    )
+    if birth_year:
+        # intervalle plutôt que __year : reste indexable (index birth_date)
+        queryset = queryset.filter(
+            birth_date__gte=datetime.date(birth_year, 1, 1),
+            birth_date__lt=datetime.date(birth_year + 1, 1, 1),
+        )
+    if sex:
+        queryset = queryset.filter(sex=sex)
+    if commune:
+        queryset = queryset.filter(residence_commune_id=commune)
+
+    return queryset.annotate(
+        rank=Case(
+            When(mpi=q, then=Value(1.0)),
+            default=TrigramWordSimilarity(term, name),
+            output_field=FloatField(),
+        ),
+    ).order_by("-rank", "family_name", "given_name", "id")
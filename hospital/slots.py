@@ -0,0 +1,121 @@
+# hospital/slots.py
+"""
+Créneaux libres des praticiens, calculés dans Postgres par opérations d'ensembles
+sur des tstzmultirange (PostgreSQL 14+) — une seule requête pour tous les praticiens :
+
+  disponibilité = ∪ occurrences des plannings sur [start, end)   (range_agg)
+  occupé        = ∪ RDV programmés ∪ absences                    (range_agg)
+  libre         = disponibilité - occupé                         (différence de multiranges)
+  créneaux      = grille de chaque occurrence du planning, au pas du planning depuis son
+                  heure de début (generate_series), dont toute la durée est libre (@>)
+
+Les créneaux restent sur la grille du praticien, quel que soit le pas : planning à 08h00
+au pas de 45 min -> 08h00, 08h45, 09h30... ; un RDV qui finit à 10h07 rend le créneau
+suivant de la grille (10h15 ici), jamais un créneau décalé.
+"""
+from django.conf import settings
+from django.db import connection
+
+from .models import Appointment, Practitioner, PractitionerAbsence, PractitionerSchedule
+
+MAX_SLOTS = 500
+
+FREE_SLOTS_SQL = """
+WITH practitioners AS (
+    SELECT p.id FROM {practitioner} p WHERE p.active {practitioner_filter}
+),
+days AS (
+    SELECT d::date AS day
+    FROM generate_series(date_trunc('day', %(start)s::timestamptz AT TIME ZONE %(tz)s),
+                         %(end)s::timestamptz AT TIME ZONE %(tz)s, interval '1 day') AS d
+),
+occurrences AS (
+    SELECT s.practitioner_id, s.slot_minutes,
+           (d.day + s.start_time) AT TIME ZONE %(tz)s AS occ_start,
+           (d.day + s.end_time) AT TIME ZONE %(tz)s AS occ_end
+    FROM {schedule} s
+    JOIN practitioners p ON p.id = s.practitioner_id
+    JOIN days d ON extract(isodow FROM d.day) = s.weekday
+               AND d.day >= s.valid_from AND (s.valid_to IS NULL OR d.day <= s.valid_to)
+    WHERE s.active {schedule_filter}
+),
+availability AS (
+    SELECT practitioner_id,
+           range_agg(tstzrange(occ_start, occ_end, '[)'))
+             * tstzmultirange(tstzrange(%(start)s, %(end)s, '[)')) AS ranges
+    FROM occurrences
+    GROUP BY practitioner_id
+),
+busy AS (
+    SELECT practitioner_id, range_agg(period) AS ranges
+    FROM (
+        SELECT a.practitioner_id, tstzrange(a.start_at, a.end_at, '[)') AS period
+        FROM {appointment} a
+        WHERE a.status = 'SCHEDULED' AND a.start_at < %(end)s AND a.end_at > %(start)s
+          AND a.practitioner_id IN (SELECT practitioner_id FROM availability)
+        UNION ALL
+        SELECT x.practitioner_id, tstzrange(x.start_at, x.end_at, '[)')
+        FROM {absence} x
+        WHERE x.start_at < %(end)s AND x.end_at > %(start)s
+          AND x.practitioner_id IN (SELECT practitioner_id FROM availability)
+    ) periods
+    GROUP BY practitioner_id
+),
+free AS (
+    SELECT a.practitioner_id, a.ranges - coalesce(b.ranges, '{{}}'::tstzmultirange) AS ranges
+    FROM availability a
+    LEFT JOIN busy b USING (practitioner_id)
+)
+SELECT DISTINCT o.practitioner_id, slot AS start_at,
+       slot + make_interval(mins => coalesce(%(duration)s, o.slot_minutes)) AS end_at
+FROM occurrences o
+JOIN free f USING (practitioner_id),
+     generate_series(
+         o.occ_start,
+         o.occ_end - make_interval(mins => coalesce(%(duration)s, o.slot_minutes)),
+         make_interval(mins => o.slot_minutes)
+     ) AS slot
+WHERE f.ranges @> tstzrange(slot, slot + make_interval(mins => coalesce(%(duration)s, o.slot_minutes)), '[)')
+ORDER BY start_at, o.practitioner_id
+LIMIT %(limit)s
+"""
+
+
+def free_slots(start, end, limit=20, duration=None, practitioners=None, specialty=None,
+               facility=None, department=None):
+    """
+    Premiers `limit` créneaux libres entre start et end (datetimes aware), tous praticiens
+    confondus, triés par heure : [{"practitioner": id, "start_at": dt, "end_at": dt}, ...].
+    duration (minutes) : durée voulue (défaut : pas du planning) ; les créneaux restent au pas.
+    Filtres : ids de praticiens, spécialité (insensible à la casse), établissement, service.
+    """
+    params = {"start": start, "end": end, "tz": settings.TIME_ZONE, "duration": duration,
+              "limit": min(limit, MAX_SLOTS)}
+    practitioner_filter, schedule_filter = [], []
+    if practitioners:
+        practitioner_filter.append("AND p.id = ANY(%(practitioners)s::uuid[])")
+        params["practitioners"] = [str(p) for p in practitioners]
+    if specialty:
+        practitioner_filter.append("AND lower(p.specialty) = lower(%(specialty)s)")
+        params["specialty"] = specialty
+    if facility:
+        schedule_filter.append("AND s.facility_id = %(facility)s")
+        params["facility"] = str(facility)
+    if department:
+        schedule_filter.append("AND s.department_id = %(department)s")
+        params["department"] = str(department)
+
+    sql = FREE_SLOTS_SQL.format(
+        practitioner=Practitioner._meta.db_table,
+        schedule=PractitionerSchedule._meta.db_table,
+        appointment=Appointment._meta.db_table,
+        absence=PractitionerAbsence._meta.db_table,
+        practitioner_filter=" ".join(practitioner_filter),
+        schedule_filter=" ".join(schedule_filter),
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return [
+            {"practitioner": practitioner_id, "start_at": start_at, "end_at": end_at}
+            for practitioner_id, start_at, end_at in cur.fetchall()
+        ]
@@ -0,0 +1,33 @@
+# hospital/tasks.py
+"""Tâches Celery de l'app hospital (planification : CELERY_BEAT_SCHEDULE)."""
+import datetime
+
+from celery import shared_task
+
+from . import adt, notifications
+
+
+@shared_task(ignore_result=True)
+def enqueue_appointment_reminders(day=None):
+    """Met en file les rappels de RDV du jour `day` (ISO, défaut : demain). Idempotent."""
+    return notifications.enqueue_appointment_reminders(datetime.date.fromisoformat(day) if day else None)
+
+
+@shared_task(ignore_result=True)
+def dispatch_notifications():
+    """Reprend les baux expirés puis lance un dispatcher par fournisseur ayant des messages dus."""
+    notifications.reclaim_stale()
+    for provider in notifications.due_providers():
+        dispatch_provider.delay(provider)
+
+
+@shared_task(ignore_result=True)
+def dispatch_provider(provider, max_seconds=55):
+    """Vide la file d'un fournisseur au débit autorisé, borné à max_seconds (< intervalle du beat)."""
+    return notifications.dispatch(provider, max_seconds=max_seconds)
+
+
+@shared_task(ignore_result=True)
+def expire_bed_reservations():
+    """Clôt les réservations de lits échues (recensement à jour sans attendre le prochain reserve())."""
+    return adt.expire_reservations()
@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Analyzer, AnalyzerTest
+
+
+class AnalyzerTestInline(admin.TabularInline):
+    model = AnalyzerTest
+    extra = 1
+
+
+@admin.register(Analyzer)
+class AnalyzerAdmin(admin.ModelAdmin):
+    list_display = ("code", "label", "facility", "active", "tenant_key")
+    list_filter = ("active",)
+    search_fields = ("code", "label", "tenant_key")
+    inlines = [AnalyzerTestInline]
@@ -0,0 +1,32 @@
+from rest_framework import serializers
+
+from api.serializers import DynamicModelSerializer, TenantAwareMixin
+from laboratory.models import Analyzer
+
+
+class AnalyzerSerializer(DynamicModelSerializer, TenantAwareMixin):
+    tests = serializers.SlugRelatedField(many=True, read_only=True, slug_field="code")
+
+    class Meta:
+        model = Analyzer
+        fields = "__all__"
+        read_only_fields = ("tenant_key",)
+
+
+class WorklistQuerySerializer(serializers.Serializer):
+    """Paramètres de /worklist/ : échantillons en attente d'un automate."""
+    analyzer = serializers.UUIDField()
+    limit = serializers.IntegerField(required=False, default=100, min_value=1, max_value=1000)
+
+
+class WorklistClaimSerializer(serializers.Serializer):
+    """Corps de POST /worklist/claim/."""
+    analyzer = serializers.UUIDField()
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=200)
+    bench = serializers.CharField(required=False, allow_blank=True, max_length=64, default="")
+
+
+class WorklistTransitionSerializer(serializers.Serializer):
+    """Corps de POST /worklist/complete/ et /worklist/release/ : lignes réclamées par l'automate."""
+    analyzer = serializers.UUIDField()
+    items = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=5000)
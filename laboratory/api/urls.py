@@ -1,10 +1,15 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from laboratory.views import AnalyzerViewSet, WorklistViewSet
+
 router = DefaultRouter()
 
+# Automates et liste de travail (laboratory.worklist)
+router.register(r"analyzers", AnalyzerViewSet, basename="analyzer")
+router.register(r"worklist", WorklistViewSet, basename="worklist")
 
 
 urlpatterns = [
     path("", include(router.urls)),  # <= expose bien des patterns
-]
\ No newline at end of file
+]
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.bench import run_concurrently
+from hospital.models import ClinicalOrder, Encounter, Facility, OrderItem, Patient, Specimen, VisitType
+from laboratory import worklist
+from laboratory.models import Analyzer, AnalyzerTest
+
+TESTS = ("718-7", "2345-7", "2160-0", "1742-6", "6690-2", "777-3")  # Hb, glucose, créat., ALAT, GB, plaquettes
+
+
+class QueueEmpty(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Postes de laboratoire simultanés : chacun réclame des échantillons (worklist.claim, "
+        "SKIP LOCKED) puis clôture leurs examens en lot, pour un nombre croissant de postes. "
+        "Vérifie l'absence de double réclamation et affiche le débit. Crée des patients / "
+        "commandes / échantillons temporaires dans l'établissement donné, puis les supprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("facility", help="id de l'établissement hôte du banc")
+        parser.add_argument("--specimens", type=int, default=5000)
+        parser.add_argument("--batch", type=int, default=10, help="échantillons réclamés par poste et par appel")
+        parser.add_argument("--workers", default="1,2,4,8,16", help="nombres de postes simultanés à comparer")
+
+    def handle(self, *args, **opts):
+        try:
+            facility_id = uuid.UUID(str(opts["facility"]))
+        except ValueError:
+            raise CommandError("Identifiant d'établissement invalide.")
+        if not Facility.objects.filter(pk=facility_id).exists():
+            raise CommandError("Établissement introuvable.")
+        levels = [int(w) for w in opts["workers"].split(",") if w.strip()]
+
+        run_id = uuid.uuid4().hex[:8]
+        visit_type, created = VisitType.objects.get_or_create(code="BENCH", defaults={"label": "Banc", "active": False})
+        analyzers = [Analyzer(facility_id=facility_id, code=f"BENCH-{run_id}-{k}", label="Banc liste de travail")
+                     for k in range(2)]
+        Analyzer.objects.bulk_ingest(analyzers)
+        AnalyzerTest.objects.bulk_create(
+            [AnalyzerTest(analyzer=analyzers[0], code=c) for c in TESTS[:3]]
+            + [AnalyzerTest(analyzer=analyzers[1], code=c) for c in TESTS[3:]]
+        )
+        encounters, items = self._fixtures(facility_id, visit_type, run_id, opts["specimens"])
+        try:
+            self.stdout.write(f"{opts['specimens']} échantillons, {len(items)} examens, 2 automates, "
+                              f"lots de {opts['batch']} échantillons")
+            base = None
+            for workers in levels:
+                OrderItem.objects.filter(pk__in=items).update(status="ORDERED")
+                claimed, lock = [], threading.Lock()
+
+                def bench(job):
+                    analyzer = analyzers[job % 2]
+                    groups = worklist.claim(analyzer, opts["batch"], bench=f"poste-{job % workers}")
+                    if not groups:
+                        raise QueueEmpty()
+                    ids = [i["id"] for g in groups for i in g["items"]]
+                    worklist.complete(analyzer, ids)
+                    with lock:
+                        claimed.extend(ids)
+                    return 0
+
+                jobs = range(2 * (opts["specimens"] // opts["batch"] + workers + 2))
+                t0 = time.perf_counter()
+                r = run_concurrently(bench, jobs, workers, exhausted=(QueueEmpty,))
+                rate = len(claimed) / (time.perf_counter() - t0)
+                base = base or rate / workers
+                duplicates = len(claimed) - len(set(claimed))
+                left = OrderItem.objects.filter(pk__in=items).exclude(status="DONE").count()
+                self.stdout.write(
+                    f"  {workers:>3} poste(s) : {len(claimed):>6} examens  {rate:9.1f}/s  "
+                    f"(x{rate / base:4.1f}, idéal x{workers})  p50={r['p50']:6.1f}ms  p95={r['p95']:6.1f}ms  "
+                    f"{r['errors']:>3} erreurs  doublons={duplicates}  restants={left}"
+                )
+                if duplicates or left or r["errors"]:
+                    raise CommandError("Liste de travail incohérente ou en erreur sous concurrence.")
+            self.stdout.write(self.style.SUCCESS("Aucune double réclamation, tous les examens clôturés."))
+        finally:
+            self._cleanup(encounters, analyzers, visit_type if created else None)
+
+    def _fixtures(self, facility_id, visit_type, run_id, n):
+        patients = [Patient(mpi=f"LAB-BENCH-{run_id}-{k:06d}") for k in range(n)]
+        Patient.objects.bulk_create(patients)
+        now = timezone.now()
+        encounters = [Encounter(patient=p, facility_id=facility_id, visit_type=visit_type, start_at=now)
+                      for p in patients]
+        Encounter.objects.bulk_ingest(encounters)
+        orders = [ClinicalOrder(encounter=e, category=ClinicalOrder.Category.LAB) for e in encounters]
+        ClinicalOrder.objects.bulk_ingest(orders)
+        # Deux examens par automate et par échantillon
+        lines = [OrderItem(order=o, code=code, label=code) for k, o in enumerate(orders)
+                 for code in (TESTS[k % 3], TESTS[(k + 1) % 3], TESTS[3 + k % 3], TESTS[3 + (k + 1) % 3])]
+        OrderItem.objects.bulk_ingest(lines)
+        specimens = [Specimen(encounter=e, collected_at=now) for e in encounters]
+        Specimen.objects.bulk_ingest(specimens)
+        Through = Specimen.items.through
+        Through.objects.bulk_create(
+            [Through(specimen_id=specimens[k // 4].pk, orderitem_id=line.pk) for k, line in enumerate(lines)],
+            batch_size=5000,
+        )
+        return encounters, [line.pk for line in lines]
+
+    def _cleanup(self, encounters, analyzers, visit_type=None):
+        patient_ids = [e.patient_id for e in encounters]
+        Specimen.objects.filter(encounter__in=encounters).delete()
+        ClinicalOrder.objects.filter(encounter__in=encounters).delete()
+        Encounter.objects.filter(pk__in=[e.pk for e in encounters]).delete()
+        Patient.objects.filter(pk__in=patient_ids).delete()
+        Analyzer.objects.filter(pk__in=[a.pk for a in analyzers]).delete()
+        if visit_type is not None:  # créé par ce banc
+            visit_type.delete()
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.24 on 2026-10-17 07:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('hospital', '0015_orderitem_pending_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Analyzer',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('tenant_key', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('code', models.CharField(max_length=32)),
+                ('label', models.CharField(max_length=255)),
+                ('active', models.BooleanField(default=True)),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analyzers', to='hospital.facility')),
+            ],
+            options={
+                'verbose_name': 'Automate / paillasse',
+                'verbose_name_plural': 'Automates / paillasses',
+                'unique_together': {('facility', 'code')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyzerTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=64)),
+                ('analyzer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tests', to='laboratory.analyzer')),
+            ],
+            options={
+                'verbose_name': "Examen d'un automate",
+                'verbose_name_plural': 'Examens des automates',
+                'indexes': [models.Index(fields=['code', 'analyzer'], name='analyzertest_code')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='analyzertest',
+            constraint=models.UniqueConstraint(fields=('analyzer', 'code'), name='uniq_analyzer_test'),
+        ),
+        migrations.CreateModel(
+            name='WorklistClaim',
+            fields=[
+                ('order_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='worklist_claim', serialize=False, to='hospital.orderitem')),
+                ('bench', models.CharField(blank=True, default='', max_length=64)),
+                ('claimed_at', models.DateTimeField()),
+                ('analyzer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claims', to='laboratory.analyzer')),
+                ('specimen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='hospital.specimen')),
+            ],
+            options={
+                'verbose_name': 'Réservation de liste de travail',
+                'verbose_name_plural': 'Réservations de liste de travail',
+                'indexes': [models.Index(fields=['analyzer', 'specimen'], name='worklistclaim_analyzer'), models.Index(fields=['claimed_at'], name='worklistclaim_claimed_at')],
+            },
+        ),
+    ]
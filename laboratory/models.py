@@ -1,3 +1,57 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+from hospital.base import TenantScopedModel, TimeStampedModel, UUIDModel
+from hospital.models import Facility, OrderItem, Specimen
+
+
+# ------------- Paillasse / automates -------------
+class Analyzer(UUIDModel, TimeStampedModel, TenantScopedModel):
+    """Automate ou paillasse d'un laboratoire ; traite les examens listés dans AnalyzerTest."""
+    facility = models.ForeignKey(Facility, on_delete=models.PROTECT, related_name="analyzers")
+    code = models.CharField(max_length=32)
+    label = models.CharField(max_length=255)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = _("Automate / paillasse")
+        verbose_name_plural = _("Automates / paillasses")
+        unique_together = ("facility", "code")
+
+    def __str__(self):
+        return f"{self.code} — {self.label}"
+
+
+class AnalyzerTest(models.Model):
+    """Routage : examen (OrderItem.code, LOINC) réalisé par un automate."""
+    analyzer = models.ForeignKey(Analyzer, on_delete=models.CASCADE, related_name="tests")
+    code = models.CharField(max_length=64)
+
+    class Meta:
+        verbose_name = _("Examen d'un automate")
+        verbose_name_plural = _("Examens des automates")
+        constraints = [models.UniqueConstraint(fields=["analyzer", "code"], name="uniq_analyzer_test")]
+        indexes = [models.Index(fields=["code", "analyzer"], name="analyzertest_code")]
+
+
+# ------------- Liste de travail (laboratory.worklist) -------------
+class WorklistClaim(models.Model):
+    """
+    Ligne de commande réclamée par un automate (OrderItem IN_PROGRESS) : qui, quand, pour
+    quel échantillon. Supprimée à la clôture (DONE) ou à la remise en file (ORDERED).
+    """
+    order_item = models.OneToOneField(OrderItem, primary_key=True, on_delete=models.CASCADE,
+                                      related_name="worklist_claim")
+    analyzer = models.ForeignKey(Analyzer, on_delete=models.CASCADE, related_name="claims")
+    specimen = models.ForeignKey(Specimen, on_delete=models.CASCADE, related_name="+")
+    bench = models.CharField(max_length=64, blank=True, default="")  # poste / technicien
+    claimed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _("Réservation de liste de travail")
+        verbose_name_plural = _("Réservations de liste de travail")
+        indexes = [
+            models.Index(fields=["analyzer", "specimen"], name="worklistclaim_analyzer"),
+            # Reprise des réservations abandonnées
+            models.Index(fields=["claimed_at"], name="worklistclaim_claimed_at"),
+        ]
@@ -0,0 +1,11 @@
+# laboratory/tasks.py
+"""Tâches Celery de l'app laboratory (planification : CELERY_BEAT_SCHEDULE)."""
+from celery import shared_task
+
+from . import worklist
+
+
+@shared_task(ignore_result=True)
+def reclaim_worklist():
+    """Remet en file les lignes dont la réservation par un automate a expiré."""
+    return worklist.reclaim_stale()
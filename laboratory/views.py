@@ -1,3 +1,77 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-# Create your views here.
+from api.permissions import IsStaff
+from api.views import DefaultsMixin
+from core.db_scope import PostgresScopeMixin, scope_for
+
+from . import worklist
+from .api.serializers import (
+    AnalyzerSerializer, WorklistClaimSerializer, WorklistQuerySerializer, WorklistTransitionSerializer,
+)
+from .models import Analyzer
+
+
+def _scoped(request, queryset):
+    tenant_key, _ = scope_for(request.auth)
+    return queryset.filter(tenant_key=tenant_key) if tenant_key else queryset
+
+
+# ------------- Automates -------------
+class AnalyzerViewSet(DefaultsMixin, viewsets.ModelViewSet):
+    queryset = Analyzer.objects.prefetch_related("tests").order_by("code")
+    serializer_class = AnalyzerSerializer
+    permission_classes = [IsStaff]
+    filterset_fields = ("facility", "active")
+    search_fields = ("code", "label")
+
+    def get_queryset(self):
+        return _scoped(self.request, super().get_queryset())
+
+
+# ------------- Liste de travail -------------
+class WorklistViewSet(PostgresScopeMixin, viewsets.ViewSet):
+    """
+    Liste de travail d'un automate (laboratory.worklist) :
+      GET  ?analyzer=        échantillons en attente, sans les réclamer
+      POST claim/            réclame des échantillons entiers (SKIP LOCKED) et leurs examens
+      POST complete/         clôture un lot de lignes réclamées (DONE)
+      POST release/          remet un lot de lignes réclamées en file (ORDERED)
+    """
+    permission_classes = [IsStaff]
+
+    def _analyzer(self, pk):
+        return get_object_or_404(_scoped(self.request, Analyzer.objects.filter(active=True)), pk=pk)
+
+    def list(self, request):
+        params = WorklistQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        analyzer = self._analyzer(params.validated_data["analyzer"])
+        rows = worklist.pending(analyzer, params.validated_data["limit"])
+        return Response([
+            {"specimen": pk, "collected_at": collected_at, "specimen_type": specimen_type, "tests": tests}
+            for pk, collected_at, specimen_type, tests in rows
+        ])
+
+    @action(detail=False, methods=["post"])
+    def claim(self, request):
+        body = WorklistClaimSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        p = body.validated_data
+        return Response(worklist.claim(self._analyzer(p["analyzer"]), p["limit"], p["bench"]))
+
+    @action(detail=False, methods=["post"])
+    def complete(self, request):
+        body = WorklistTransitionSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        items, orders = worklist.complete(self._analyzer(body.validated_data["analyzer"]), body.validated_data["items"])
+        return Response({"items": items, "orders_completed": orders})
+
+    @action(detail=False, methods=["post"])
+    def release(self, request):
+        body = WorklistTransitionSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        return Response({"items": worklist.release(self._analyzer(body.validated_data["analyzer"]),
+                                                   body.validated_data["items"])})
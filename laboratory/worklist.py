@@ -0,0 +1,174 @@
+# laboratory/worklist.py
+"""
+Liste de travail du laboratoire : lignes LAB (OrderItem) en attente, par échantillon et automate.
+
+  en attente  OrderItem ORDERED, rattaché à un échantillon (Specimen.items), dont le code
+              est routé vers l'automate (AnalyzerTest) ; index partiel orderitem_pending_code.
+  réclamer    une instruction : verrouille jusqu'à `limit` échantillons en attente pour
+              l'automate (FOR UPDATE SKIP LOCKED, plus ancien prélèvement d'abord), passe
+              leurs lignes routées en IN_PROGRESS, enregistre les WorklistClaim et passe les
+              commandes PLACED en IN_PROGRESS. Un échantillon va entier à un seul automate
+              par réclamation ; les réclamants concurrents prennent les suivants sans attendre.
+              Le statut est revérifié à la mise à jour (status = 'ORDERED') : pas de double
+              réclamation, même pour une ligne rattachée à deux échantillons.
+  clôturer /  par lot : lignes IN_PROGRESS réclamées par l'automate -> DONE (puis commandes
+  remettre    dont toutes les lignes sont terminées -> COMPLETED) ou -> ORDERED.
+  reprise     reclaim_stale() remet en file les réservations plus anciennes que
+              LAB_WORKLIST_LEASE_SECONDS (poste tombé, échantillon égaré).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from hospital.models import ClinicalOrder, OrderItem, Specimen
+
+from .models import AnalyzerTest, WorklistClaim
+
+
+def _tables():
+    return {
+        "item": OrderItem._meta.db_table,
+        "order": ClinicalOrder._meta.db_table,
+        "specimen": Specimen._meta.db_table,
+        "specimen_items": Specimen.items.through._meta.db_table,
+        "test": AnalyzerTest._meta.db_table,
+        "claim": WorklistClaim._meta.db_table,
+    }
+
+
+# Lignes en attente d'un automate (par l'index partiel des lignes ORDERED du CHU)
+PENDING_SQL = """
+SELECT si.specimen_id, oi.id
+FROM {item} oi
+JOIN {test} t ON t.code = oi.code AND t.analyzer_id = %(analyzer)s
+JOIN {specimen_items} si ON si.orderitem_id = oi.id
+WHERE oi.tenant_key = %(tenant)s AND oi.status = 'ORDERED'
+"""
+
+PEEK_SQL = f"""
+SELECT s.id, s.collected_at, s.specimen_type, count(*) AS tests
+FROM ({PENDING_SQL}) p
+JOIN {{specimen}} s ON s.id = p.specimen_id
+GROUP BY s.id, s.collected_at, s.specimen_type
+ORDER BY s.collected_at, s.id
+LIMIT %(limit)s
+"""
+
+CLAIM_SQL = f"""
+WITH specimens AS (
+    SELECT s.id FROM {{specimen}} s
+    WHERE s.id IN (SELECT specimen_id FROM ({PENDING_SQL}) p)
+    ORDER BY s.collected_at, s.id
+    LIMIT %(limit)s
+    FOR UPDATE OF s SKIP LOCKED
+), claimed AS (
+    UPDATE {{item}} oi
+    SET status = 'IN_PROGRESS', updated_at = now()
+    FROM specimens sp
+    JOIN {{specimen_items}} si ON si.specimen_id = sp.id
+    JOIN {{test}} t ON t.analyzer_id = %(analyzer)s
+    WHERE oi.id = si.orderitem_id AND t.code = oi.code AND oi.status = 'ORDERED'
+    RETURNING sp.id AS specimen_id, oi.id, oi.order_id, oi.code, oi.label
+), claims AS (
+    INSERT INTO {{claim}} (order_item_id, analyzer_id, specimen_id, bench, claimed_at)
+    SELECT id, %(analyzer)s, specimen_id, %(bench)s, now() FROM claimed
+    ON CONFLICT (order_item_id) DO UPDATE
+    SET analyzer_id = EXCLUDED.analyzer_id, specimen_id = EXCLUDED.specimen_id,
+        bench = EXCLUDED.bench, claimed_at = EXCLUDED.claimed_at
+), orders AS (
+    UPDATE {{order}} o SET status = 'IN_PROGRESS', updated_at = now()
+    WHERE o.id IN (SELECT order_id FROM claimed) AND o.status = 'PLACED'
+)
+SELECT specimen_id, id, code, label FROM claimed
+ORDER BY specimen_id, code
+"""
+
+# Clôture / remise en file des lignes réclamées par l'automate
+TRANSITION_SQL = """
+WITH moved AS (
+    UPDATE {item} oi
+    SET status = %(status)s, updated_at = now()
+    FROM {claim} c
+    WHERE c.order_item_id = oi.id AND c.analyzer_id = %(analyzer)s
+      AND oi.id = ANY(%(items)s::uuid[]) AND oi.status = 'IN_PROGRESS'
+    RETURNING oi.id, oi.order_id
+), released AS (
+    DELETE FROM {claim} c USING moved WHERE c.order_item_id = moved.id
+)
+SELECT id, order_id FROM moved
+"""
+
+# Commandes dont toutes les lignes sont terminées (DONE / CANCELLED)
+COMPLETE_ORDERS_SQL = """
+UPDATE {order} o SET status = 'COMPLETED', updated_at = now()
+WHERE o.id = ANY(%(orders)s::uuid[]) AND o.status IN ('PLACED', 'IN_PROGRESS')
+  AND NOT EXISTS (
+    SELECT 1 FROM {item} oi WHERE oi.order_id = o.id AND oi.status NOT IN ('DONE', 'CANCELLED')
+  )
+"""
+
+RECLAIM_SQL = """
+WITH stale AS (
+    DELETE FROM {claim} WHERE claimed_at < %(before)s RETURNING order_item_id
+)
+UPDATE {item} oi SET status = 'ORDERED', updated_at = now()
+FROM stale WHERE oi.id = stale.order_item_id AND oi.status = 'IN_PROGRESS'
+"""
+
+
+def pending(analyzer, limit=100):
+    """Échantillons en attente pour l'automate, sans les réclamer : [(specimen, collecté, type, examens)]."""
+    with connection.cursor() as cur:
+        cur.execute(PEEK_SQL.format(**_tables()),
+                    {"analyzer": str(analyzer.pk), "tenant": analyzer.tenant_key, "limit": limit})
+        return cur.fetchall()
+
+
+def claim(analyzer, limit=10, bench=""):
+    """
+    Réclame jusqu'à `limit` échantillons pour l'automate. Retourne
+    [{"specimen": id, "items": [{"id", "code", "label"}, ...]}] (vide : rien en attente).
+    """
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(CLAIM_SQL.format(**_tables()), {
+            "analyzer": str(analyzer.pk), "tenant": analyzer.tenant_key, "limit": limit, "bench": bench or "",
+        })
+        rows = cur.fetchall()
+    groups = {}
+    for specimen_id, pk, code, label in rows:
+        groups.setdefault(specimen_id, []).append({"id": pk, "code": code, "label": label})
+    return [{"specimen": specimen_id, "items": items} for specimen_id, items in groups.items()]
+
+
+def _transition(analyzer, item_ids, status):
+    with connection.cursor() as cur:
+        cur.execute(TRANSITION_SQL.format(**_tables()),
+                    {"analyzer": str(analyzer.pk), "items": [str(pk) for pk in item_ids], "status": status})
+        return cur.fetchall()
+
+
+@transaction.atomic
+def complete(analyzer, item_ids):
+    """Clôture (DONE) un lot de lignes réclamées par l'automate. Retourne (lignes, commandes terminées)."""
+    moved = _transition(analyzer, item_ids, "DONE")
+    if not moved:
+        return 0, 0
+    with connection.cursor() as cur:
+        cur.execute(COMPLETE_ORDERS_SQL.format(**_tables()), {"orders": list({str(o) for _, o in moved})})
+        return len(moved), cur.rowcount
+
+
+@transaction.atomic
+def release(analyzer, item_ids):
+    """Remet en file (ORDERED) un lot de lignes réclamées par l'automate. Retourne le nombre de lignes."""
+    return len(_transition(analyzer, item_ids, "ORDERED"))
+
+
+def reclaim_stale():
+    """Remet en file les lignes dont la réservation a dépassé LAB_WORKLIST_LEASE_SECONDS."""
+    before = timezone.now() - datetime.timedelta(seconds=settings.LAB_WORKLIST_LEASE_SECONDS)
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(RECLAIM_SQL.format(**_tables()), {"before": before})
+        return cur.rowcount
@@ -1,3 +1,57 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DistrictDrugStock, ReorderSuggestion, StockMapWatermark, StockSnapshotRun, StockSnapshotWatermark
+
+
+@admin.register(StockSnapshotRun)
+class StockSnapshotRunAdmin(admin.ModelAdmin):
+    list_display = ("at", "monthly", "rows", "taken_at")
+    list_filter = ("monthly",)
+    date_hierarchy = "at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshotWatermark)
+class StockSnapshotWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("name", "value", "refreshed_at", "last_runs", "last_invalidated")
+    readonly_fields = ("name", "value", "refreshed_at", "last_runs", "last_invalidated")
+
+
+@admin.register(ReorderSuggestion)
+class ReorderSuggestionAdmin(admin.ModelAdmin):
+    list_display = ("item", "facility", "on_hand", "forecast_daily", "days_of_cover", "reorder_point",
+                    "suggested_qty", "needs_reorder", "computed_at")
+    list_filter = ("needs_reorder",)
+    search_fields = ("tenant_key", "item__sku")
+    list_select_related = ("item", "facility")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DistrictDrugStock)
+class DistrictDrugStockAdmin(admin.ModelAdmin):
+    # District.__str__ n'est pas utilisable : identifiants seulement
+    list_display = ("drug_id", "district_id", "region_id", "quantity", "facilities", "facilities_in_stock",
+                    "nearest_expiry")
+    search_fields = ("drug__label", "drug__atc_code", "district__name")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockMapWatermark)
+class StockMapWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("name", "value", "refreshed_at", "last_partitions")
+    readonly_fields = ("name", "value", "refreshed_at", "last_partitions")
@@ -0,0 +1,13 @@
+from rest_framework import serializers
+
+from api.serializers import DynamicModelSerializer
+from pharmacy.models import ReorderSuggestion
+
+
+class ReorderSuggestionSerializer(DynamicModelSerializer):
+    sku = serializers.CharField(source="item.sku", read_only=True)
+    drug = serializers.CharField(source="item.drug.label", read_only=True)
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = "__all__"
@@ -1,10 +1,16 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from pharmacy.views import ReorderSuggestionViewSet, StockAsOfViewSet, StockMapViewSet
+
 router = DefaultRouter()
 
+# Stock (clôtures pharmacy.snapshots)
+router.register(r"stock/as-of", StockAsOfViewSet, basename="stock-as-of")
+router.register(r"reorder-suggestions", ReorderSuggestionViewSet, basename="reorder-suggestion")
+router.register(r"stock-map", StockMapViewSet, basename="stock-map")
 
 
 urlpatterns = [
     path("", include(router.urls)),  # <= expose bien des patterns
-]
\ No newline at end of file
+]
@@ -0,0 +1,134 @@
+# pharmacy/fefo.py
+"""
+Allocation des lots en FEFO (premier périmé, premier sorti) pour les sorties de stock.
+
+Une sortie = une transaction :
+  1. plan   : lots entamables de l'article (quantité > 0, non périmés), dans l'ordre FEFO,
+              cumul courant (window sum) : on ne retient que les lots nécessaires
+              (index partiel inventorylot_fefo) ;
+  2. verrou : SELECT ... FOR UPDATE sur ces seuls lots, dans l'ordre FEFO — tous les
+              dispensateurs verrouillent dans le même ordre, donc pas d'interblocage ;
+              les quantités relues sous verrou font foi (un lot vidé entre-temps disparaît
+              du résultat et l'on complète avec les lots suivants) ;
+  3. écriture : un UPDATE pour tous les lots entamés, InventoryMovement OUT en bulk_create.
+
+Le FEFO strict impose d'attendre le premier lot (plutôt que SKIP LOCKED, qui ferait
+sortir un lot plus tardif) ; la transaction reste courte : trois instructions.
+Les tenant_key sont recopiés des lots verrouillés (pas de remontée vers Facility).
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from hospital.models import MedicationDispense, PrescriptionLine
+
+from .models import InventoryLot, InventoryMovement
+
+# Plusieurs tours seulement si d'autres sorties vident les lots planifiés pendant l'attente.
+MAX_ROUNDS = 5
+
+PLAN_SQL = """
+SELECT id FROM (
+    SELECT id, expiration, created_at,
+           sum(quantity) OVER (ORDER BY expiration ASC NULLS LAST, created_at, id) - quantity AS before
+    FROM {lot}
+    WHERE item_id = %(item)s AND quantity > 0
+      AND (expiration IS NULL OR expiration >= %(today)s)
+      AND NOT (id = ANY(%(exclude)s::uuid[]))
+) c
+WHERE before < %(needed)s
+ORDER BY expiration ASC NULLS LAST, created_at, id
+"""
+
+DECREMENT_SQL = """
+UPDATE {lot} l
+SET quantity = l.quantity - t.qty, updated_at = now()
+FROM unnest(%s::uuid[], %s::int[]) AS t(id, qty)
+WHERE l.id = t.id
+"""
+
+
+class StockError(Exception):
+    """Sortie de stock refusée."""
+
+
+class InsufficientStock(StockError):
+    def __init__(self, item_id, requested, available):
+        self.item_id, self.requested, self.available = item_id, requested, available
+        super().__init__(f"Stock insuffisant : {requested} demandé(s), {available} disponible(s) en lots non périmés.")
+
+
+def _plan(item_id, needed, today, exclude):
+    with connection.cursor() as cur:
+        cur.execute(PLAN_SQL.format(lot=InventoryLot._meta.db_table), {
+            "item": str(item_id), "needed": needed, "today": today, "exclude": [str(x) for x in exclude],
+        })
+        return [row[0] for row in cur.fetchall()]
+
+
+def _lock(lot_ids):
+    return list(
+        InventoryLot.objects.select_for_update()
+        .filter(pk__in=lot_ids, quantity__gt=0)
+        .order_by(F("expiration").asc(nulls_last=True), "created_at", "pk")
+        .values_list("pk", "quantity", "tenant_key")
+    )
+
+
+@transaction.atomic
+def allocate(item_id, quantity, at=None, reason=None, dispense_id=None):
+    """
+    Sort `quantity` unités de l'article en FEFO, réparties sur autant de lots que nécessaire.
+    Retourne les InventoryMovement OUT créés (un par lot entamé, ordre FEFO).
+    Lève InsufficientStock (rien n'est écrit) si les lots non périmés ne suffisent pas.
+    """
+    if quantity <= 0:
+        raise StockError("La quantité à sortir doit être positive.")
+    at = at or timezone.now()
+    today = timezone.localdate(at)
+    remaining, taken, seen = quantity, [], []
+    for _ in range(MAX_ROUNDS):
+        planned = _plan(item_id, remaining, today, seen)
+        if not planned:
+            break
+        seen += planned
+        for pk, available, tenant_key in _lock(planned):
+            take = min(available, remaining)
+            taken.append((pk, take, tenant_key))
+            remaining -= take
+            if not remaining:
+                break
+        if not remaining:
+            break
+    if remaining:
+        raise InsufficientStock(item_id, quantity, quantity - remaining)
+
+    with connection.cursor() as cur:
+        cur.execute(DECREMENT_SQL.format(lot=InventoryLot._meta.db_table),
+                    [[str(pk) for pk, _, _ in taken], [qty for _, qty, _ in taken]])
+    movements = [
+        InventoryMovement(item_id=item_id, lot_id=pk, dispense_id=dispense_id, movement_type="OUT",
+                          qty=qty, at=at, reason=reason, tenant_key=tenant_key)
+        for pk, qty, tenant_key in taken
+    ]
+    InventoryMovement.objects.bulk_create(movements)
+    return movements
+
+
+@transaction.atomic
+def dispense(prescription_line_id, item_id, quantity, dispenser_id=None, at=None):
+    """
+    Dispensation d'une ligne de prescription : MedicationDispense + sorties FEFO liées
+    (InventoryMovement.dispense). Quantité en unités entières de l'article.
+    """
+    if quantity != int(quantity):
+        raise StockError("La dispensation se fait en unités entières de l'article.")
+    tenant_key = PrescriptionLine.objects.filter(pk=prescription_line_id).values_list("tenant_key", flat=True).first()
+    if tenant_key is None:
+        raise StockError("Ligne de prescription inconnue.")
+    at = at or timezone.now()
+    record = MedicationDispense(prescription_line_id=prescription_line_id, quantity=quantity, dispensed_at=at,
+                                dispenser_id=dispenser_id, tenant_key=tenant_key)
+    MedicationDispense.objects.bulk_create([record])
+    allocate(item_id, int(quantity), at=at, reason="DISPENSE", dispense_id=record.pk)
+    return record
@@ -0,0 +1,157 @@
+# pharmacy/forecast.py
+"""
+Prévision de consommation et suggestions de réapprovisionnement (ReorderSuggestion).
+
+Un passage par CHU (tenant_key), tous établissements et articles du CHU à la fois :
+  1. historique : sorties (OUT) des HISTORY_DAYS derniers jours agrégées en SQL par
+     (article, jour local), lues par l'index (tenant_key, at, movement_type), puis
+     déposées dans une matrice NumPy articles x jours (jours sans sortie = 0) ;
+  2. calcul en colonnes : moyennes mobiles 7 / 28 / 91 jours, saisonnalité annuelle
+     (sorties des 28 jours à venir, il y a un an, rapportées aux 28 jours qui les
+     précédaient ; bornée, neutre sans historique suffisant), écart-type journalier ;
+  3. stock disponible (lots non vides, non périmés) et couverture en jours ;
+     point de commande = demande pendant le délai + stock de sécurité (z.σ.√délai),
+     au moins InventoryItem.min_threshold ; quantité suggérée = ce qui manque pour
+     couvrir délai + période de revue ;
+  4. écriture : upsert des suggestions du CHU, suppression de celles des articles disparus.
+
+Les CHU sont indépendants : commande forecast_stock --workers N (pool de processus),
+ou une tâche Celery par CHU.
+"""
+import datetime
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import InventoryItem, InventoryLot, InventoryMovement, ReorderSuggestion
+
+HISTORY_DAYS = 400  # un an + la fenêtre saisonnière
+SEASON_WINDOW = 28
+SEASON_BOUNDS = (0.5, 2.0)
+SEASON_MIN_UNITS = 20  # sorties minimales l'an passé pour estimer une saisonnalité
+# Pondération des moyennes mobiles (7, 28, 91 jours) dans la demande de base
+WEIGHTS = (0.3, 0.5, 0.2)
+
+HISTORY_SQL = """
+SELECT item_id, ((at AT TIME ZONE %(tz)s)::date - %(start)s::date) AS day, sum(qty)
+FROM {movement}
+WHERE tenant_key = %(tenant)s AND at >= %(since)s AND at < %(until)s AND movement_type = 'OUT'
+GROUP BY 1, 2
+"""
+
+ON_HAND_SQL = """
+SELECT item_id, sum(quantity)
+FROM {lot}
+WHERE tenant_key = %(tenant)s AND quantity > 0 AND (expiration IS NULL OR expiration >= %(today)s)
+GROUP BY item_id
+"""
+
+
+def tenants():
+    return list(InventoryItem.objects.order_by().values_list("tenant_key", flat=True).distinct())
+
+
+def _moving_average(demand, days):
+    return demand[:, -days:].mean(axis=1)
+
+
+def _seasonality(demand):
+    """Rapport (28 jours à venir / 28 jours précédents) l'an passé, borné ; 1 si trop peu d'historique."""
+    end = demand.shape[1] - 365
+    ahead = demand[:, end:end + SEASON_WINDOW].sum(axis=1)
+    before = demand[:, end - SEASON_WINDOW:end].sum(axis=1)
+    known = (ahead + before) >= SEASON_MIN_UNITS
+    ratio = np.divide(ahead, before, out=np.ones_like(ahead), where=before > 0)
+    return np.where(known, np.clip(ratio, *SEASON_BOUNDS), 1.0)
+
+
+def plan(demand, on_hand, min_threshold, lead_time, review, z):
+    """
+    Indicateurs par article (lignes de `demand`, sorties journalières sur HISTORY_DAYS jours).
+    Renvoie un dict de colonnes NumPy.
+    """
+    ma7, ma28, ma91 = (_moving_average(demand, d) for d in (7, 28, 91))
+    seasonality = _seasonality(demand)
+    forecast = (WEIGHTS[0] * ma7 + WEIGHTS[1] * ma28 + WEIGHTS[2] * ma91) * seasonality
+    std = demand[:, -91:].std(axis=1)
+    safety = z * std * math.sqrt(lead_time)
+    reorder_point = np.maximum(np.ceil(forecast * lead_time + safety), min_threshold)
+    target = np.ceil(forecast * (lead_time + review) + safety)
+    needs = on_hand <= reorder_point
+    return {
+        "demand_7d": ma7,
+        "demand_28d": ma28,
+        "demand_91d": ma91,
+        "seasonality": seasonality,
+        "forecast_daily": forecast,
+        "demand_std": std,
+        "days_of_cover": np.divide(on_hand, forecast, out=np.full_like(forecast, np.nan), where=forecast > 0),
+        "reorder_point": reorder_point,
+        "suggested_qty": np.where(needs, np.maximum(target, reorder_point) - on_hand, 0).clip(min=0),
+        "needs_reorder": needs & ((forecast > 0) | (min_threshold > 0)),
+    }
+
+
+def _load(tenant_key, today):
+    items = list(
+        InventoryItem.objects.filter(tenant_key=tenant_key).order_by("pk")
+        .values_list("pk", "facility_id", "min_threshold")
+    )
+    position = {pk: k for k, (pk, _, _) in enumerate(items)}
+    start = today - datetime.timedelta(days=HISTORY_DAYS)
+    demand = np.zeros((len(items), HISTORY_DAYS))
+    on_hand = np.zeros(len(items))
+    with connection.cursor() as cur:
+        cur.execute(HISTORY_SQL.format(movement=InventoryMovement._meta.db_table), {
+            "tz": settings.TIME_ZONE, "tenant": tenant_key, "start": start,
+            "since": timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)),
+            "until": timezone.make_aware(datetime.datetime.combine(today, datetime.time.min)),
+        })
+        rows = cur.fetchall()
+        if rows:
+            rows_idx = np.fromiter((position[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+            day_idx = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+            demand[rows_idx, day_idx] = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        cur.execute(ON_HAND_SQL.format(lot=InventoryLot._meta.db_table), {"tenant": tenant_key, "today": today})
+        for pk, qty in cur.fetchall():
+            on_hand[position[pk]] = qty
+    return items, demand, on_hand
+
+
+def run_tenant(tenant_key, now=None):
+    """Recalcule les suggestions des articles d'un CHU. Renvoie (articles, articles à commander)."""
+    now = now or timezone.now()
+    items, demand, on_hand = _load(tenant_key, timezone.localdate(now))
+    columns = plan(
+        demand, on_hand, np.array([m for _, _, m in items], dtype=np.float64),
+        lead_time=settings.STOCK_FORECAST_LEAD_TIME_DAYS,
+        review=settings.STOCK_FORECAST_REVIEW_DAYS,
+        z=settings.STOCK_FORECAST_SERVICE_Z,
+    )
+    floats = ("demand_7d", "demand_28d", "demand_91d", "seasonality", "forecast_daily", "demand_std")
+    cover = columns["days_of_cover"]
+    objs = [
+        ReorderSuggestion(
+            item_id=pk, facility_id=facility_id, tenant_key=tenant_key, computed_at=now,
+            on_hand=int(on_hand[k]),
+            **{name: round(float(columns[name][k]), 3) for name in floats},
+            days_of_cover=None if np.isnan(cover[k]) else round(float(cover[k]), 1),
+            reorder_point=int(columns["reorder_point"][k]),
+            suggested_qty=int(columns["suggested_qty"][k]),
+            needs_reorder=bool(columns["needs_reorder"][k]),
+        )
+        for k, (pk, facility_id, _) in enumerate(items)
+    ]
+    with transaction.atomic():
+        ReorderSuggestion.objects.bulk_create(
+            objs,
+            batch_size=5000,
+            update_conflicts=True,
+            unique_fields=["item"],
+            update_fields=[f.name for f in ReorderSuggestion._meta.concrete_fields if f.name != "item"],
+        )
+        ReorderSuggestion.objects.filter(tenant_key=tenant_key, computed_at__lt=now).delete()
+    return len(objs), int(columns["needs_reorder"].sum())
@@ -0,0 +1,133 @@
+import datetime
+import random
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from core.bench import run_concurrently
+from hospital.models import Facility
+from pharmacy import fefo
+from pharmacy.models import Drug, InventoryItem, InventoryLot, InventoryMovement
+
+
+def _naive_allocate(item_id, quantity):
+    """
+    Avant : lots relus sans verrou puis décrémentés un à un (lecture-modification-écriture
+    en Python) : deux dispensations simultanées sortent le même stock.
+    """
+    today = timezone.localdate()
+    lots = (
+        InventoryLot.objects.filter(item_id=item_id, quantity__gt=0)
+        .filter(Q(expiration__isnull=True) | Q(expiration__gte=today))
+        .order_by(F("expiration").asc(nulls_last=True), "created_at", "pk")
+    )
+    remaining, movements = quantity, []
+    for lot in lots:
+        take = min(lot.quantity, remaining)
+        lot.quantity -= take
+        lot.save(update_fields=["quantity", "updated_at"])
+        movements.append(InventoryMovement(item_id=item_id, lot_id=lot.pk, movement_type="OUT", qty=take,
+                                           at=timezone.now(), tenant_key=lot.tenant_key))
+        remaining -= take
+        if not remaining:
+            break
+    if remaining:
+        raise fefo.InsufficientStock(item_id, quantity, quantity - remaining)
+    InventoryMovement.objects.bulk_create(movements)
+    return 0
+
+
+def _service_allocate(item_id, quantity):
+    fefo.allocate(item_id, quantity, reason="BENCH")
+    return 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispensations simultanées sur quelques articles très demandés : lots relus sans verrou "
+        "(avant) contre pharmacy.fefo.allocate (verrou des seuls lots choisis, ordre FEFO). "
+        "Vérifie stock = stock initial - sorties, ordre FEFO respecté et lots périmés intacts ; "
+        "affiche le débit. Crée des articles / lots temporaires dans l'établissement donné, puis les supprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("facility", help="id de l'établissement hôte du banc")
+        parser.add_argument("--dispenses", type=int, default=2000)
+        parser.add_argument("--items", type=int, default=3, help="articles (peu nombreux : forte contention)")
+        parser.add_argument("--lots", type=int, default=12, help="lots par article (dont 2 périmés)")
+        parser.add_argument("--lot-size", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=32)
+
+    def handle(self, *args, **opts):
+        try:
+            facility_id = uuid.UUID(str(opts["facility"]))
+        except ValueError:
+            raise CommandError("Identifiant d'établissement invalide.")
+        if not Facility.objects.filter(pk=facility_id).exists():
+            raise CommandError("Établissement introuvable.")
+
+        run_id = uuid.uuid4().hex[:8]
+        drug = Drug.objects.create(atc_code=f"BENCH-{run_id}", label=f"Banc FEFO {run_id}")
+        items = [InventoryItem(facility_id=facility_id, drug=drug, sku=f"FEFO-{run_id}-{i}") for i in range(opts["items"])]
+        InventoryItem.objects.bulk_ingest(items)
+        try:
+            rng = random.Random(run_id)
+            requests = [(rng.choice(items).pk, rng.randint(1, 30)) for _ in range(opts["dispenses"])]
+            self.stdout.write(f"{len(requests)} dispensations, {len(items)} articles x {opts['lots']} lots, "
+                              f"{opts['concurrency']} connexions")
+            for label, fn in (("avant : lecture sans verrou", _naive_allocate),
+                              ("après : fefo.allocate", _service_allocate)):
+                initial = self._stock(items, opts["lots"], opts["lot_size"])
+                r = run_concurrently(lambda req: fn(*req), requests, opts["concurrency"],
+                                     exhausted=(fefo.InsufficientStock,))
+                drift, violations = self._check(items, initial)
+                self.stdout.write(
+                    f"  {label:<28} {r['ok']:>5} servies  {r['exhausted']:>4} ruptures  {r['errors']:>3} erreurs  "
+                    f"{r['rate']:8.1f}/s  p50={r['p50']:6.1f}ms  p95={r['p95']:6.1f}ms  max={r['max']:6.1f}ms  "
+                    f"écart stock={drift:>5}  hors FEFO={violations}"
+                )
+                if fn is _service_allocate and (drift or violations or r["errors"]):
+                    raise CommandError("Allocation FEFO incohérente ou en erreur sous concurrence.")
+            self.stdout.write(self.style.SUCCESS("Stock cohérent et ordre FEFO respecté avec fefo.allocate."))
+        finally:
+            InventoryMovement.objects.filter(item__in=items).delete()
+            InventoryLot.objects.filter(item__in=items).delete()
+            InventoryItem.objects.filter(pk__in=[i.pk for i in items]).delete()
+            drug.delete()
+
+    def _stock(self, items, lots, lot_size):
+        """(Ré)initialise les lots : 2 périmés, 1 sans date, le reste échelonné. Retourne {lot: qté}."""
+        InventoryMovement.objects.filter(item__in=items).delete()
+        InventoryLot.objects.filter(item__in=items).delete()
+        today = timezone.localdate()
+        expirations = [today - datetime.timedelta(days=30), today - datetime.timedelta(days=1), None]
+        expirations += [today + datetime.timedelta(days=20 * k) for k in range(lots - len(expirations))]
+        InventoryLot.objects.bulk_ingest(
+            InventoryLot(item=item, lot_code=f"L{k:03d}", expiration=exp, quantity=lot_size)
+            for item in items for k, exp in enumerate(expirations)
+        )
+        return dict(InventoryLot.objects.filter(item__in=items).values_list("pk", "quantity"))
+
+    def _check(self, items, initial):
+        """(écart stock / sorties, lots entamés alors qu'un lot antérieur n'était pas vide ou périmés)."""
+        today = timezone.localdate()
+        out = InventoryMovement.objects.filter(item__in=items, movement_type="OUT").aggregate(n=Sum("qty"))["n"] or 0
+        lots = list(
+            InventoryLot.objects.filter(item__in=items)
+            .order_by("item_id", F("expiration").asc(nulls_last=True), "created_at", "pk")
+            .values_list("item_id", "pk", "expiration", "quantity")
+        )
+        drift = (sum(initial.values()) - sum(q for *_, q in lots)) - out
+        violations, item, open_seen = 0, None, False
+        for item_id, pk, expiration, quantity in lots:
+            if item_id != item:
+                item, open_seen = item_id, False
+            if expiration is not None and expiration < today:
+                violations += quantity != initial[pk]
+                continue
+            if open_seen and quantity != initial[pk]:
+                violations += 1
+            open_seen = open_seen or quantity > 0
+        return drift, violations
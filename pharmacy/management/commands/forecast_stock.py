@@ -0,0 +1,40 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pharmacy import forecast
+
+
+def _run(tenant_key):
+    try:
+        return forecast.run_tenant(tenant_key)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prévision de consommation et suggestions de réapprovisionnement de tous les articles, "
+        "un CHU par processus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--tenant", action="append", help="CHU à traiter (défaut : tous)")
+
+    def handle(self, *args, **opts):
+        tenants = opts["tenant"] or forecast.tenants()
+        t0 = time.perf_counter()
+        # Les processus fils ouvrent leurs propres connexions
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=max(1, opts["workers"]), mp_context=get_context("fork")) as pool:
+            results = list(pool.map(_run, tenants))
+        items = sum(n for n, _ in results)
+        reorder = sum(r for _, r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{items} article(s) de {len(tenants)} CHU, {reorder} à commander, "
+            f"en {time.perf_counter() - t0:.1f}s"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.stockmap import refresh_stock_map
+
+
+class Command(BaseCommand):
+    help = (
+        "Rafraîchit la carte nationale des stocks (établissement, district, région) depuis les lots "
+        "et mouvements modifiés après le filigrane ; --full recalcule tout (lots supprimés, reprise)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="vider et recalculer toute la carte")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        r = refresh_stock_map(full=opts["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['partitions']} partition(s) (établissement, médicament), {r['districts']} district(s), "
+            f"{r['regions']} région(s) réécrits en {time.perf_counter() - t0:.2f}s ; "
+            f"filigrane : {r['watermark']:%Y-%m-%d %H:%M:%S%z}."
+        ))
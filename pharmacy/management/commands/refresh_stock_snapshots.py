@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Prend les clôtures de stock (StockSnapshot) manquantes jusqu'à minuit aujourd'hui et "
+        "recalcule celles faussées par des mouvements antidatés ; --full recalcule tout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="vider et recalculer toutes les clôtures")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        r = refresh_snapshots(full=opts["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['runs']} clôture(s) prise(s) ({r['rows']} solde(s)), {r['invalidated']} invalidée(s) "
+            f"en {time.perf_counter() - t0:.2f}s ; filigrane : {r['watermark']:%Y-%m-%d %H:%M:%S%z}."
+        ))
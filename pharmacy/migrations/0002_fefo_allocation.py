@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_invoice_revenue_index'),
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorymovement',
+            name='dispense',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='hospital.medicationdispense'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorylot',
+            index=models.Index(models.F('item'), models.OrderBy(models.F('expiration'), nulls_last=True), models.F('created_at'), models.F('id'), condition=models.Q(('quantity__gt', 0)), name='inventorylot_fefo'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorylot',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='inventorylot_quantity_ge_0'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.24 on 2026-10-17 06:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0002_fefo_allocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshotRun',
+            fields=[
+                ('at', models.DateTimeField(primary_key=True, serialize=False)),
+                ('monthly', models.BooleanField(default=False)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('taken_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Clôture de stock',
+                'verbose_name_plural': 'Clôtures de stock',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshotWatermark',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_runs', models.PositiveIntegerField(default=0)),
+                ('last_invalidated', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Filigrane des clôtures de stock',
+                'verbose_name_plural': 'Filigranes des clôtures de stock',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('at', models.DateTimeField()),
+                ('balance', models.BigIntegerField()),
+                ('item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.inventoryitem')),
+                ('lot', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.inventorylot')),
+            ],
+            options={
+                'verbose_name': 'Solde de stock à une clôture',
+                'verbose_name_plural': 'Soldes de stock aux clôtures',
+                'indexes': [models.Index(fields=['at', 'item'], name='stocksnapshot_at_item'), models.Index(fields=['tenant_key', 'at'], name='stocksnapshot_tenant_at')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['item', 'at'], include=('lot', 'movement_type', 'qty'), name='inventorymovement_item_at'),
+        ),
+    ]
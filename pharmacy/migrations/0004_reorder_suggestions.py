@@ -0,0 +1,40 @@
+# Generated by Django 4.2.24 on 2026-10-17 06:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_invoice_revenue_index'),
+        ('pharmacy', '0003_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reorder_suggestion', serialize=False, to='pharmacy.inventoryitem')),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField()),
+                ('on_hand', models.IntegerField(default=0)),
+                ('demand_7d', models.FloatField(default=0)),
+                ('demand_28d', models.FloatField(default=0)),
+                ('demand_91d', models.FloatField(default=0)),
+                ('seasonality', models.FloatField(default=1)),
+                ('forecast_daily', models.FloatField(default=0)),
+                ('demand_std', models.FloatField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('reorder_point', models.IntegerField(default=0)),
+                ('suggested_qty', models.IntegerField(default=0)),
+                ('needs_reorder', models.BooleanField(default=False)),
+                ('facility', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.facility')),
+            ],
+            options={
+                'verbose_name': 'Suggestion de réapprovisionnement',
+                'verbose_name_plural': 'Suggestions de réapprovisionnement',
+                'indexes': [models.Index(fields=['facility', 'needs_reorder', 'days_of_cover'], name='reorder_facility_cover'), models.Index(fields=['tenant_key', 'computed_at'], name='reorder_tenant_computed')],
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2.24 on 2026-10-17 07:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_invoice_revenue_index'),
+        ('pharmacy', '0004_reorder_suggestions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMapWatermark',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_partitions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Filigrane de la carte des stocks',
+                'verbose_name_plural': 'Filigranes de la carte des stocks',
+            },
+        ),
+        migrations.CreateModel(
+            name='FacilityDrugStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_key', models.CharField(max_length=64)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('lots', models.PositiveIntegerField(default=0)),
+                ('nearest_expiry', models.DateField(blank=True, null=True)),
+                ('district', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.district')),
+                ('drug', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.drug')),
+                ('facility', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.facility')),
+                ('region', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.region')),
+            ],
+            options={
+                'verbose_name': "Stock d'un médicament par établissement",
+                'verbose_name_plural': 'Stocks des médicaments par établissement',
+                'indexes': [models.Index(fields=['drug', 'district'], name='facilitydrugstock_district'), models.Index(fields=['drug', 'region'], name='facilitydrugstock_region'), models.Index(fields=['nearest_expiry'], name='facilitydrugstock_expiry')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='facilitydrugstock',
+            constraint=models.UniqueConstraint(fields=('facility', 'drug'), name='uniq_facility_drug_stock'),
+        ),
+        migrations.CreateModel(
+            name='DistrictDrugStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('facilities', models.PositiveIntegerField(default=0)),
+                ('facilities_in_stock', models.PositiveIntegerField(default=0)),
+                ('nearest_expiry', models.DateField(blank=True, null=True)),
+                ('district', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.district')),
+                ('drug', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.drug')),
+                ('region', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.region')),
+            ],
+            options={
+                'verbose_name': "Stock d'un médicament par district",
+                'verbose_name_plural': 'Stocks des médicaments par district',
+                'indexes': [models.Index(condition=models.Q(('facilities_in_stock', 0)), fields=['drug'], name='districtdrugstock_stockout')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='districtdrugstock',
+            constraint=models.UniqueConstraint(fields=('drug', 'district'), name='uniq_district_drug_stock'),
+        ),
+        migrations.CreateModel(
+            name='RegionDrugStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('facilities', models.PositiveIntegerField(default=0)),
+                ('facilities_in_stock', models.PositiveIntegerField(default=0)),
+                ('districts', models.PositiveIntegerField(default=0)),
+                ('districts_in_stock', models.PositiveIntegerField(default=0)),
+                ('nearest_expiry', models.DateField(blank=True, null=True)),
+                ('drug', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.drug')),
+                ('region', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hospital.region')),
+            ],
+            options={
+                'verbose_name': "Stock d'un médicament par région",
+                'verbose_name_plural': 'Stocks des médicaments par région',
+                'indexes': [models.Index(condition=models.Q(('facilities_in_stock', 0)), fields=['drug'], name='regiondrugstock_stockout')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='regiondrugstock',
+            constraint=models.UniqueConstraint(fields=('drug', 'region'), name='uniq_region_drug_stock'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 # pharmacy/models.py
 from django.db import models
+from django.db.models import F, Q
+from django.utils.translation import gettext_lazy as _
 from hospital.base import TenantScopedModel, UUIDModel, TimeStampedModel
-from hospital.models import Facility
+from hospital.models import District, Facility, MedicationDispense, Region
 
 
 class Drug(UUIDModel, TimeStampedModel):
@@ -30,17 +32,214 @@ class InventoryLot(UUIDModel, TimeStampedModel, TenantScopedModel):
     expiration = models.DateField(null=True, blank=True)
     quantity = models.IntegerField(default=0)
 
+    TENANT_KEY_SOURCE = "item__tenant_key"
+
     class Meta:
         unique_together = ("item", "lot_code")
+        constraints = [
+            # Filet de sécurité de l'allocation FEFO (pharmacy.fefo) : jamais de stock négatif
+            models.CheckConstraint(check=Q(quantity__gte=0), name="inventorylot_quantity_ge_0"),
+        ]
+        indexes = [
+            # Lots entamables d'un article dans l'ordre FEFO (péremption, sans date en dernier).
+            # « Non périmé » dépend de la date du jour : filtré par intervalle sur expiration.
+            models.Index(F("item"), F("expiration").asc(nulls_last=True), F("created_at"), F("id"),
+                         condition=Q(quantity__gt=0), name="inventorylot_fefo"),
+        ]
 
 
 class InventoryMovement(UUIDModel, TimeStampedModel, TenantScopedModel):
     item = models.ForeignKey(InventoryItem, on_delete=models.PROTECT)
     lot = models.ForeignKey(InventoryLot, null=True, blank=True, on_delete=models.SET_NULL)
+    # Sortie liée à une dispensation (une ligne OUT par lot entamé)
+    dispense = models.ForeignKey(MedicationDispense, null=True, blank=True, on_delete=models.PROTECT,
+                                 related_name="stock_movements")
     movement_type = models.CharField(max_length=16)  # IN, OUT, ADJUST
     qty = models.IntegerField()
     at = models.DateTimeField(db_index=True)
     reason = models.CharField(max_length=128, null=True, blank=True)
 
+    TENANT_KEY_SOURCE = "item__tenant_key"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["tenant_key", "at", "movement_type"]),
+            # Mouvements d'un article depuis le dernier instantané (pharmacy.snapshots), sans lire la table
+            models.Index(fields=["item", "at"], include=["lot", "movement_type", "qty"],
+                         name="inventorymovement_item_at"),
+        ]
+
+
+# ------------- Instantanés de stock (pharmacy.snapshots) -------------
+class StockSnapshotRun(models.Model):
+    """
+    Clôture de stock à l'instant `at` (minuit local) : les soldes de tous les articles,
+    mouvements antérieurs à `at`, sont dans StockSnapshot. Une clôture du 1er du mois est
+    mensuelle et conservée indéfiniment ; les clôtures journalières sont purgées après
+    STOCK_SNAPSHOT_DAILY_RETENTION_DAYS.
+    """
+    at = models.DateTimeField(primary_key=True)
+    monthly = models.BooleanField(default=False)
+    rows = models.PositiveIntegerField(default=0)
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _("Clôture de stock")
+        verbose_name_plural = _("Clôtures de stock")
+
+
+class StockSnapshot(models.Model):
+    """
+    Solde d'un (article, lot) à une clôture. Table dérivée du registre InventoryMovement :
+    ne jamais la modifier à la main (commande refresh_stock_snapshots). Les soldes nuls
+    ne sont pas stockés ; lot vide : mouvements sans lot.
+    """
+    tenant_key = models.CharField(max_length=64)
+    # Pas de contrainte de clé étrangère : table dérivée, recalculée depuis les mouvements.
+    item = models.ForeignKey(InventoryItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    lot = models.ForeignKey(InventoryLot, null=True, blank=True, on_delete=models.DO_NOTHING,
+                            db_constraint=False, related_name="+")
+    at = models.DateTimeField()
+    balance = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = _("Solde de stock à une clôture")
+        verbose_name_plural = _("Soldes de stock aux clôtures")
+        indexes = [
+            # Solde d'un article / d'un catalogue à une clôture
+            models.Index(fields=["at", "item"], name="stocksnapshot_at_item"),
+            # Rapports d'un CHU
+            models.Index(fields=["tenant_key", "at"], name="stocksnapshot_tenant_at"),
+        ]
+
+
+class StockSnapshotWatermark(models.Model):
+    """Filigrane des clôtures : mouvements créés (created_at) après `value` restant à contrôler."""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    last_runs = models.PositiveIntegerField(default=0)
+    last_invalidated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Filigrane des clôtures de stock")
+        verbose_name_plural = _("Filigranes des clôtures de stock")
+
+
+# ------------- Prévision de consommation (pharmacy.forecast) -------------
+class ReorderSuggestion(models.Model):
+    """
+    Suggestion de réapprovisionnement d'un article, recalculée par CHU (commande forecast_stock) :
+    demande journalière prévue, couverture et quantité à commander. Table dérivée.
+    """
+    item = models.OneToOneField(InventoryItem, primary_key=True, on_delete=models.CASCADE,
+                                related_name="reorder_suggestion")
+    facility = models.ForeignKey(Facility, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    tenant_key = models.CharField(max_length=64)
+    computed_at = models.DateTimeField()
+    on_hand = models.IntegerField(default=0)
+    # Sorties moyennes par jour sur 7 / 28 / 91 jours
+    demand_7d = models.FloatField(default=0)
+    demand_28d = models.FloatField(default=0)
+    demand_91d = models.FloatField(default=0)
+    seasonality = models.FloatField(default=1)
+    forecast_daily = models.FloatField(default=0)
+    demand_std = models.FloatField(default=0)
+    # Vide : pas de consommation prévue
+    days_of_cover = models.FloatField(null=True, blank=True)
+    reorder_point = models.IntegerField(default=0)
+    suggested_qty = models.IntegerField(default=0)
+    needs_reorder = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = _("Suggestion de réapprovisionnement")
+        verbose_name_plural = _("Suggestions de réapprovisionnement")
+        indexes = [
+            # Écran pharmacie : articles à commander d'un établissement, couverture la plus courte d'abord
+            models.Index(fields=["facility", "needs_reorder", "days_of_cover"], name="reorder_facility_cover"),
+            models.Index(fields=["tenant_key", "computed_at"], name="reorder_tenant_computed"),
+        ]
+
+
+# ------------- Carte nationale des stocks (pharmacy.stockmap) -------------
+class FacilityDrugStock(models.Model):
+    """
+    Stock utilisable (lots non vides, non périmés) d'un médicament dans un établissement,
+    tous articles confondus ; ligne à 0 si l'établissement référence le médicament sans en
+    avoir. District / région recopiés de Facility.commune. Table dérivée (refresh_stock_map).
+    """
+    facility = models.ForeignKey(Facility, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    drug = models.ForeignKey(Drug, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    tenant_key = models.CharField(max_length=64)
+    district = models.ForeignKey(District, null=True, blank=True, on_delete=models.DO_NOTHING,
+                                 db_constraint=False, related_name="+")
+    region = models.ForeignKey(Region, null=True, blank=True, on_delete=models.DO_NOTHING,
+                               db_constraint=False, related_name="+")
+    quantity = models.BigIntegerField(default=0)
+    lots = models.PositiveIntegerField(default=0)
+    # Péremption du premier lot utilisable : la ligne est recalculée une fois cette date passée
+    nearest_expiry = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Stock d'un médicament par établissement")
+        verbose_name_plural = _("Stocks des médicaments par établissement")
+        constraints = [models.UniqueConstraint(fields=["facility", "drug"], name="uniq_facility_drug_stock")]
+        indexes = [
+            models.Index(fields=["drug", "district"], name="facilitydrugstock_district"),
+            models.Index(fields=["drug", "region"], name="facilitydrugstock_region"),
+            models.Index(fields=["nearest_expiry"], name="facilitydrugstock_expiry"),
+        ]
+
+
+class DistrictDrugStock(models.Model):
+    """Stock utilisable d'un médicament dans un district sanitaire (somme de FacilityDrugStock)."""
+    drug = models.ForeignKey(Drug, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    district = models.ForeignKey(District, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    region = models.ForeignKey(Region, null=True, blank=True, on_delete=models.DO_NOTHING,
+                               db_constraint=False, related_name="+")
+    quantity = models.BigIntegerField(default=0)
+    # Établissements référençant le médicament / en ayant en stock
+    facilities = models.PositiveIntegerField(default=0)
+    facilities_in_stock = models.PositiveIntegerField(default=0)
+    nearest_expiry = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Stock d'un médicament par district")
+        verbose_name_plural = _("Stocks des médicaments par district")
+        constraints = [models.UniqueConstraint(fields=["drug", "district"], name="uniq_district_drug_stock")]
+        indexes = [
+            # Ruptures : districts sans aucun établissement en stock
+            models.Index(fields=["drug"], condition=Q(facilities_in_stock=0), name="districtdrugstock_stockout"),
+        ]
+
+
+class RegionDrugStock(models.Model):
+    """Stock utilisable d'un médicament dans une région sanitaire (somme de FacilityDrugStock)."""
+    drug = models.ForeignKey(Drug, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    region = models.ForeignKey(Region, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    quantity = models.BigIntegerField(default=0)
+    facilities = models.PositiveIntegerField(default=0)
+    facilities_in_stock = models.PositiveIntegerField(default=0)
+    districts = models.PositiveIntegerField(default=0)
+    districts_in_stock = models.PositiveIntegerField(default=0)
+    nearest_expiry = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Stock d'un médicament par région")
+        verbose_name_plural = _("Stocks des médicaments par région")
+        constraints = [models.UniqueConstraint(fields=["drug", "region"], name="uniq_region_drug_stock")]
+        indexes = [
+            models.Index(fields=["drug"], condition=Q(facilities_in_stock=0), name="regiondrugstock_stockout"),
+        ]
+
+
+class StockMapWatermark(models.Model):
+    """Filigrane de la carte des stocks : lots / mouvements modifiés après `value` restant à intégrer."""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    last_partitions = models.PositiveIntegerField(default=0)
+
     class Meta:
-        indexes = [models.Index(fields=["tenant_key", "at", "movement_type"])]
+        verbose_name = _("Filigrane de la carte des stocks")
+        verbose_name_plural = _("Filigranes de la carte des stocks")
@@ -0,0 +1,183 @@
+# pharmacy/snapshots.py
+"""
+Stock à une date : clôtures périodiques du registre InventoryMovement (StockSnapshot).
+
+Clôture à l'instant B (minuit local) = solde par (article, lot) des mouvements antérieurs à B,
+calculé depuis la clôture précédente P : soldes en P + mouvements de [P, B), une instruction
+pour tout le catalogue national. Clôtures journalières (conservées
+STOCK_SNAPSHOT_DAILY_RETENTION_DAYS), celle du 1er du mois est mensuelle et conservée.
+
+Stock au temps T = clôture la plus récente B <= T + mouvements de [B, T] : au plus un jour de
+mouvements relus (un mois au-delà de la rétention), quel que soit l'âge du registre.
+
+Mouvements antidatés : un mouvement créé après une clôture avec `at` antérieur la rend fausse.
+Chaque rafraîchissement relit les mouvements créés depuis le filigrane (moins une marge,
+STOCK_SNAPSHOT_LAG_SECONDS, pour les transactions longues) ; les clôtures postérieures au plus
+ancien `at` trouvé sont supprimées puis recalculées. Mouvements supprimés ou modifiés : full=True.
+
+Sens des mouvements : OUT décrémente (qty positive), IN et ADJUST s'ajoutent (ADJUST signé).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import InventoryItem, InventoryMovement, StockSnapshot, StockSnapshotRun, StockSnapshotWatermark
+
+WATERMARK = "stock_snapshots"
+
+BEGINNING = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+DELTA_SQL = "CASE WHEN m.movement_type = 'OUT' THEN -m.qty ELSE m.qty END"
+
+SNAPSHOT_SQL = f"""
+INSERT INTO {{snapshot}} (tenant_key, item_id, lot_id, at, balance)
+SELECT tenant_key, item_id, lot_id, %(at)s, sum(q)
+FROM (
+    SELECT s.tenant_key, s.item_id, s.lot_id, s.balance AS q
+    FROM {{snapshot}} s WHERE s.at = %(prev)s
+    UNION ALL
+    SELECT m.tenant_key, m.item_id, m.lot_id, {DELTA_SQL}
+    FROM {{movement}} m WHERE m.at >= %(prev)s AND m.at < %(at)s
+) b
+GROUP BY tenant_key, item_id, lot_id
+HAVING sum(q) <> 0
+"""
+
+# Plus ancien mouvement antidaté (créé depuis le filigrane, `at` avant la dernière clôture)
+BACKDATED_SQL = """
+SELECT min(at) FROM {movement}
+WHERE created_at > %(since)s AND at < %(last)s
+"""
+
+BALANCE_SQL = f"""
+WITH base AS (
+    SELECT coalesce(max(at), '-infinity'::timestamptz) AS at FROM {{run}} WHERE at <= %(at)s
+)
+SELECT tenant_key, item_id, {{lot}}, sum(q) AS balance
+FROM (
+    SELECT s.tenant_key, s.item_id, s.lot_id, s.balance AS q
+    FROM {{snapshot}} s, base WHERE s.at = base.at {{filter_s}}
+    UNION ALL
+    SELECT m.tenant_key, m.item_id, m.lot_id, {DELTA_SQL}
+    FROM {{movement}} m, base WHERE m.at >= base.at AND m.at <= %(at)s {{filter_m}}
+) b
+GROUP BY tenant_key, item_id{{group_lot}}
+HAVING sum(q) <> 0
+ORDER BY tenant_key, item_id{{group_lot}}
+"""
+
+
+def _tables():
+    return {
+        "snapshot": StockSnapshot._meta.db_table,
+        "run": StockSnapshotRun._meta.db_table,
+        "movement": InventoryMovement._meta.db_table,
+        "item": InventoryItem._meta.db_table,
+    }
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _boundaries(first_day, last_day, keep_daily_from):
+    """Clôtures à prendre de first_day à last_day inclus : 1ers du mois + jours dans la rétention."""
+    day = first_day
+    while day <= last_day:
+        if day.day == 1 or day >= keep_daily_from:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+def refresh_snapshots(full=False, now=None):
+    """
+    Invalide les clôtures faussées par des mouvements antidatés, prend les clôtures manquantes
+    jusqu'à minuit aujourd'hui, purge les journalières hors rétention (full=True : tout recalculer).
+    Une transaction ; deux rafraîchissements simultanés se sérialisent sur la ligne du filigrane.
+    Retourne {"invalidated", "runs", "rows", "watermark"}.
+    """
+    tables = _tables()
+    today = timezone.localdate(now)
+    keep_daily_from = today - datetime.timedelta(days=settings.STOCK_SNAPSHOT_DAILY_RETENTION_DAYS)
+    with transaction.atomic():
+        mark, _ = StockSnapshotWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        with connection.cursor() as cur:
+            cur.execute("SELECT transaction_timestamp()")
+            started = cur.fetchone()[0]
+            invalidated = 0
+            if full or mark.value is None:
+                cur.execute(f"TRUNCATE {tables['snapshot']}, {tables['run']}")
+            else:
+                last = StockSnapshotRun.objects.order_by("-at").values_list("at", flat=True).first()
+                if last is not None:
+                    lag = datetime.timedelta(seconds=settings.STOCK_SNAPSHOT_LAG_SECONDS)
+                    cur.execute(BACKDATED_SQL.format(**tables), {"since": mark.value - lag, "last": last})
+                    stale_from = cur.fetchone()[0]
+                    if stale_from is not None:
+                        StockSnapshot.objects.filter(at__gt=stale_from).delete()
+                        invalidated, _ = StockSnapshotRun.objects.filter(at__gt=stale_from).delete()
+
+            prev = StockSnapshotRun.objects.order_by("-at").values_list("at", flat=True).first()
+            if prev is not None:
+                first_day = timezone.localdate(prev) + datetime.timedelta(days=1)
+            else:
+                first = InventoryMovement.objects.order_by("at").values_list("at", flat=True).first()
+                first_day = timezone.localdate(first) + datetime.timedelta(days=1) if first else today
+
+            runs, rows = [], 0
+            for day in _boundaries(first_day, today, keep_daily_from):
+                at = _midnight(day)
+                cur.execute(SNAPSHOT_SQL.format(**tables), {"at": at, "prev": prev or BEGINNING})
+                runs.append(StockSnapshotRun(at=at, monthly=day.day == 1, rows=cur.rowcount, taken_at=started))
+                rows += cur.rowcount
+                prev = at
+            StockSnapshotRun.objects.bulk_create(runs)
+
+            purged = StockSnapshotRun.objects.filter(monthly=False, at__lt=_midnight(keep_daily_from))
+            StockSnapshot.objects.filter(at__in=purged.values("at")).delete()
+            purged.delete()
+            if runs:
+                cur.execute(f"ANALYZE {tables['snapshot']}")
+        mark.value = started
+        mark.refreshed_at = timezone.now()
+        mark.last_runs, mark.last_invalidated = len(runs), invalidated
+        mark.save()
+    return {"invalidated": invalidated, "runs": len(runs), "rows": rows, "watermark": started}
+
+
+def stock_as_of(at, items=None, facility=None, tenant_key=None, by_lot=True):
+    """
+    Soldes non nuls au temps `at` (mouvements jusqu'à `at` inclus), en une requête :
+    [(tenant_key, item_id, lot_id, balance)] — lot_id absent (None) si by_lot=False.
+    Filtres cumulables : items (liste d'ids), facility (tout le catalogue de l'établissement),
+    tenant_key. Sans filtre : tout le pays (rapport mensuel : `at` = 1er du mois à minuit).
+    """
+    tables = _tables()
+    params = {"at": at}
+    filters = []
+    if items is not None:
+        filters.append("item_id = ANY(%(items)s::uuid[])")
+        params["items"] = [str(pk) for pk in items]
+    if facility is not None:
+        filters.append(f"item_id IN (SELECT id FROM {tables['item']} WHERE facility_id = %(facility)s)")
+        params["facility"] = str(facility)
+    if tenant_key:
+        filters.append("tenant_key = %(tenant)s")
+        params["tenant"] = tenant_key
+    sql = BALANCE_SQL.format(
+        **tables,
+        lot="lot_id" if by_lot else "NULL::uuid AS lot_id",
+        group_lot=", lot_id" if by_lot else "",
+        filter_s="".join(f" AND s.{f}" for f in filters),
+        filter_m="".join(f" AND m.{f}" for f in filters),
+    )
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def watermark():
+    """Fraîcheur des clôtures : mouvements créés jusqu'à cette date contrôlés (None : jamais calculé)."""
+    return StockSnapshotWatermark.objects.filter(name=WATERMARK).values_list("value", flat=True).first()
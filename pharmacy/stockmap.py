@@ -0,0 +1,168 @@
+# pharmacy/stockmap.py
+"""
+Carte nationale des stocks : stock utilisable par médicament et établissement, district,
+région (FacilityDrugStock, DistrictDrugStock, RegionDrugStock), rafraîchi par filigrane.
+
+Partition = (établissement, médicament). Sont réécrites à chaque passage :
+  - les partitions des articles dont un mouvement a été créé, un lot ou l'article modifié
+    (InventoryLot.updated_at, avancé aussi par pharmacy.fefo) depuis le filigrane ;
+  - celles des établissements modifiés (changement de commune) ;
+  - celles dont le premier lot utilisable est périmé depuis (nearest_expiry < aujourd'hui).
+Une partition est recalculée depuis les lots (source de vérité), pas en cumulant les
+quantités des mouvements : la relire est idempotent, d'où une marge relue à chaque passage
+(STOCK_MAP_LAG_SECONDS) pour les transactions longues. Les couples (médicament, district)
+et (médicament, région) des partitions réécrites, avant et après, sont ensuite recalculés
+depuis la couche établissement. Lots supprimés : recalcul complet (full=True).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from hospital.models import Commune, District, Facility
+
+from .models import (
+    DistrictDrugStock, FacilityDrugStock, InventoryItem, InventoryLot, InventoryMovement, RegionDrugStock,
+    StockMapWatermark,
+)
+
+WATERMARK = "stock_map"
+
+PARTITIONS_SQL = """
+CREATE TEMP TABLE _stockmap_partitions ON COMMIT DROP AS
+SELECT facility_id, drug_id FROM {item} WHERE updated_at > %(since)s
+UNION
+SELECT i.facility_id, i.drug_id FROM {movement} m JOIN {item} i ON i.id = m.item_id WHERE m.created_at > %(since)s
+UNION
+SELECT i.facility_id, i.drug_id FROM {lot} l JOIN {item} i ON i.id = l.item_id WHERE l.updated_at > %(since)s
+UNION
+SELECT i.facility_id, i.drug_id FROM {facility} f JOIN {item} i ON i.facility_id = f.id WHERE f.updated_at > %(since)s
+UNION
+SELECT facility_id, drug_id FROM {facility_stock} WHERE nearest_expiry < %(today)s
+"""
+
+FULL_PARTITIONS_SQL = """
+CREATE TEMP TABLE _stockmap_partitions ON COMMIT DROP AS
+SELECT DISTINCT facility_id, drug_id FROM {item}
+"""
+
+# Zones touchées : rattachement actuel des lignes réécrites (complété après réinsertion)
+AREAS_SQL = """
+CREATE TEMP TABLE _stockmap_areas ON COMMIT DROP AS
+SELECT DISTINCT s.drug_id, s.district_id, s.region_id
+FROM {facility_stock} s JOIN _stockmap_partitions p USING (facility_id, drug_id)
+"""
+
+DELETE_FACILITY_SQL = """
+DELETE FROM {facility_stock} s
+USING _stockmap_partitions p
+WHERE s.facility_id = p.facility_id AND s.drug_id = p.drug_id
+"""
+
+INSERT_FACILITY_SQL = """
+INSERT INTO {facility_stock} (facility_id, drug_id, tenant_key, district_id, region_id, quantity, lots, nearest_expiry)
+SELECT p.facility_id, p.drug_id, f.root_code, c.district_id, d.region_id,
+       coalesce(sum(l.quantity), 0), count(l.id), min(l.expiration)
+FROM _stockmap_partitions p
+JOIN {facility} f ON f.id = p.facility_id
+LEFT JOIN {commune} c ON c.id = f.commune_id
+LEFT JOIN {district} d ON d.id = c.district_id
+JOIN {item} i ON i.facility_id = p.facility_id AND i.drug_id = p.drug_id
+LEFT JOIN {lot} l ON l.item_id = i.id AND l.quantity > 0 AND (l.expiration IS NULL OR l.expiration >= %(today)s)
+GROUP BY p.facility_id, p.drug_id, f.root_code, c.district_id, d.region_id
+"""
+
+NEW_AREAS_SQL = """
+INSERT INTO _stockmap_areas
+SELECT DISTINCT s.drug_id, s.district_id, s.region_id
+FROM {facility_stock} s JOIN _stockmap_partitions p USING (facility_id, drug_id)
+"""
+
+DELETE_DISTRICT_SQL = """
+DELETE FROM {district_stock} s
+USING _stockmap_areas a
+WHERE s.drug_id = a.drug_id AND s.district_id = a.district_id
+"""
+
+INSERT_DISTRICT_SQL = """
+INSERT INTO {district_stock} (drug_id, district_id, region_id, quantity, facilities, facilities_in_stock, nearest_expiry)
+SELECT s.drug_id, s.district_id, max(s.region_id), sum(s.quantity), count(*),
+       count(*) FILTER (WHERE s.quantity > 0), min(s.nearest_expiry)
+FROM {facility_stock} s
+WHERE (s.drug_id, s.district_id) IN (SELECT drug_id, district_id FROM _stockmap_areas)
+GROUP BY s.drug_id, s.district_id
+"""
+
+DELETE_REGION_SQL = """
+DELETE FROM {region_stock} s
+USING _stockmap_areas a
+WHERE s.drug_id = a.drug_id AND s.region_id = a.region_id
+"""
+
+INSERT_REGION_SQL = """
+INSERT INTO {region_stock}
+    (drug_id, region_id, quantity, facilities, facilities_in_stock, districts, districts_in_stock, nearest_expiry)
+SELECT s.drug_id, s.region_id, sum(s.quantity), count(*), count(*) FILTER (WHERE s.quantity > 0),
+       count(DISTINCT s.district_id), count(DISTINCT s.district_id) FILTER (WHERE s.quantity > 0),
+       min(s.nearest_expiry)
+FROM {facility_stock} s
+WHERE (s.drug_id, s.region_id) IN (SELECT drug_id, region_id FROM _stockmap_areas)
+GROUP BY s.drug_id, s.region_id
+"""
+
+
+def refresh_stock_map(full=False, now=None):
+    """
+    Réécrit les partitions (établissement, médicament) modifiées depuis le filigrane, puis
+    leurs districts et régions (full=True : tout recalculer). Une transaction ; deux
+    rafraîchissements simultanés se sérialisent sur la ligne du filigrane.
+    Retourne {"partitions", "districts", "regions", "watermark"}.
+    """
+    tables = {
+        "item": InventoryItem._meta.db_table,
+        "lot": InventoryLot._meta.db_table,
+        "movement": InventoryMovement._meta.db_table,
+        "facility": Facility._meta.db_table,
+        "commune": Commune._meta.db_table,
+        "district": District._meta.db_table,
+        "facility_stock": FacilityDrugStock._meta.db_table,
+        "district_stock": DistrictDrugStock._meta.db_table,
+        "region_stock": RegionDrugStock._meta.db_table,
+    }
+    with transaction.atomic():
+        mark, _ = StockMapWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        with connection.cursor() as cur:
+            cur.execute("SELECT transaction_timestamp()")
+            started = cur.fetchone()[0]
+            lag = datetime.timedelta(seconds=settings.STOCK_MAP_LAG_SECONDS)
+            params = {"today": timezone.localdate(now)}
+            districts = regions = 0
+            if full or mark.value is None:
+                cur.execute(f"TRUNCATE {tables['facility_stock']}, {tables['district_stock']}, {tables['region_stock']}")
+                cur.execute(FULL_PARTITIONS_SQL.format(**tables))
+            else:
+                cur.execute(PARTITIONS_SQL.format(**tables), {**params, "since": mark.value - lag})
+            partitions = cur.rowcount
+            if partitions:
+                cur.execute("ANALYZE _stockmap_partitions")
+                cur.execute(AREAS_SQL.format(**tables))
+                cur.execute(DELETE_FACILITY_SQL.format(**tables))
+                cur.execute(INSERT_FACILITY_SQL.format(**tables), params)
+                cur.execute(NEW_AREAS_SQL.format(**tables))
+                cur.execute(DELETE_DISTRICT_SQL.format(**tables))
+                cur.execute(INSERT_DISTRICT_SQL.format(**tables))
+                districts = cur.rowcount
+                cur.execute(DELETE_REGION_SQL.format(**tables))
+                cur.execute(INSERT_REGION_SQL.format(**tables))
+                regions = cur.rowcount
+        mark.value = started
+        mark.refreshed_at = timezone.now()
+        mark.last_partitions = partitions
+        mark.save()
+    return {"partitions": partitions, "districts": districts, "regions": regions, "watermark": started}
+
+
+def watermark():
+    """Fraîcheur de la carte : lots et mouvements modifiés jusqu'à cette date intégrés (None : jamais calculée)."""
+    return StockMapWatermark.objects.filter(name=WATERMARK).values_list("value", flat=True).first()
@@ -0,0 +1,30 @@
+# pharmacy/tasks.py
+"""Tâches Celery de l'app pharmacy (planification : CELERY_BEAT_SCHEDULE)."""
+from celery import shared_task
+
+from . import forecast, snapshots, stockmap
+
+
+@shared_task(ignore_result=True)
+def refresh_stock_snapshots(full=False):
+    """Prend les clôtures de stock manquantes et recalcule celles faussées par des mouvements antidatés."""
+    return snapshots.refresh_snapshots(full=full)
+
+
+@shared_task(ignore_result=True)
+def plan_reorder_suggestions():
+    """Une tâche forecast_tenant par CHU : les workers Celery se répartissent les CHU."""
+    for tenant_key in forecast.tenants():
+        forecast_tenant.delay(tenant_key)
+
+
+@shared_task(ignore_result=True)
+def forecast_tenant(tenant_key):
+    """Recalcule les suggestions de réapprovisionnement des articles d'un CHU."""
+    return forecast.run_tenant(tenant_key)
+
+
+@shared_task(ignore_result=True)
+def refresh_stock_map(full=False):
+    """Intègre les lots et mouvements modifiés depuis le filigrane dans la carte des stocks."""
+    return stockmap.refresh_stock_map(full=full)
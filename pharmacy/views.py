@@ -1,3 +1,144 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.contrib.gis.db.models.aggregates import Collect
+from django.contrib.gis.db.models.functions import AsGeoJSON, Centroid
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import viewsets
+from rest_framework.response import Response
+
+from api.permissions import IsStaff
+from api.serializers import StockAsOfQuerySerializer, StockMapQuerySerializer
+from api.views import DefaultsMixin
+from core.db_scope import PostgresScopeMixin, scope_for
+from hospital.models import District
+
+from . import snapshots, stockmap
+from .api.serializers import ReorderSuggestionSerializer
+from .models import DistrictDrugStock, Drug, FacilityDrugStock, RegionDrugStock, ReorderSuggestion
+
+
+# ------------- Stock à une date -------------
+class StockAsOfViewSet(PostgresScopeMixin, viewsets.ViewSet):
+    """
+    Soldes par (article[, lot]) à un instant, depuis la clôture la plus proche (pharmacy.snapshots)
+    et les mouvements postérieurs : une requête, pour quelques articles ou tout le catalogue
+    d'un établissement. "watermark" indique jusqu'où les mouvements antidatés sont pris en compte.
+    """
+    permission_classes = [IsStaff]
+
+    def list(self, request):
+        params = StockAsOfQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        p = params.validated_data
+
+        at = p.get("at") or timezone.now()
+        tenant_key, _ = scope_for(request.auth)
+        rows = snapshots.stock_as_of(at, items=p.get("item"), facility=p.get("facility"),
+                                     tenant_key=tenant_key or None, by_lot=p["by_lot"])
+        return Response({
+            "at": at,
+            "watermark": snapshots.watermark(),
+            "rows": [
+                {"tenant_key": t, "item": item, **({"lot": lot} if p["by_lot"] else {}), "balance": balance}
+                for t, item, lot, balance in rows
+            ],
+        })
+
+
+# ------------- Réapprovisionnement -------------
+class ReorderSuggestionViewSet(DefaultsMixin, viewsets.ReadOnlyModelViewSet):
+    """Suggestions calculées par pharmacy.forecast ; par défaut, couverture la plus courte d'abord."""
+    queryset = ReorderSuggestion.objects.select_related("item__drug")
+    serializer_class = ReorderSuggestionSerializer
+    permission_classes = [IsStaff]
+    filterset_fields = ("facility", "needs_reorder")
+    search_fields = ("item__sku", "item__drug__label", "item__drug__atc_code")
+    ordering = ("days_of_cover", "-suggested_qty")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        tenant_key, _ = scope_for(self.request.auth)
+        return queryset.filter(tenant_key=tenant_key) if tenant_key else queryset
+
+
+# ------------- Carte nationale des stocks -------------
+def _geometry(polygon, point):
+    """Géométrie GeoJSON d'une zone : contour saisi (District.geojson) sinon point (AsGeoJSON)."""
+    if isinstance(polygon, dict) and polygon.get("type") == "Feature":
+        polygon = polygon.get("geometry")
+    if isinstance(polygon, dict) and polygon.get("type"):
+        return polygon
+    return json.loads(point) if point else None
+
+
+class StockMapViewSet(PostgresScopeMixin, viewsets.ViewSet):
+    """
+    Stock utilisable d'un médicament par région, district ou établissement (d'un district /
+    d'une région), lu dans les agrégats pharmacy.stockmap ; réponse GeoJSON FeatureCollection.
+    stockout=true : seulement les zones sans aucun établissement en stock (tout le pays si
+    aucun médicament n'est précisé). Visibilité nationale : pas de restriction au CHU.
+    """
+    permission_classes = [IsStaff]
+    rls_scoped = False
+    AREA_FIELDS = ("quantity", "facilities", "facilities_in_stock", "nearest_expiry")
+
+    def list(self, request):
+        params = StockMapQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        p = params.validated_data
+
+        rows = {"region": self._regions, "district": self._districts, "facility": self._facilities}[p["level"]](p)
+        if p.get("drug"):
+            rows = rows.filter(drug_id=p["drug"])
+        elif p.get("atc"):
+            rows = rows.filter(drug_id__in=Drug.objects.filter(atc_code=p["atc"]).values("pk"))
+        if p.get("region"):
+            rows = rows.filter(region_id=p["region"])
+        if p.get("district"):
+            rows = rows.filter(district_id=p["district"])
+        rows = list(rows.order_by("drug__label", "-quantity")[:p["limit"]])
+        if p["level"] == "region":
+            centroids = dict(
+                District.objects.filter(region_id__in={r["region_id"] for r in rows}, geom__isnull=False)
+                .values("region_id").annotate(point=AsGeoJSON(Centroid(Collect("geom"))))
+                .values_list("region_id", "point")
+            )
+            for r in rows:
+                r["point"] = centroids.get(r["region_id"])
+
+        features = []
+        for r in rows:
+            geometry = _geometry(r.pop("polygon", None), r.pop("point", None))
+            features.append({"type": "Feature", "geometry": geometry, "properties": r})
+        return Response({
+            "type": "FeatureCollection",
+            "level": p["level"],
+            "watermark": stockmap.watermark(),
+            "features": features,
+        })
+
+    def _regions(self, p):
+        rows = RegionDrugStock.objects.all()
+        if p["stockout"]:
+            rows = rows.filter(facilities_in_stock=0)
+        return rows.values("drug_id", "drug__label", "drug__atc_code", "region_id", "region__name",
+                           *self.AREA_FIELDS, "districts", "districts_in_stock")
+
+    def _districts(self, p):
+        rows = DistrictDrugStock.objects.all()
+        if p["stockout"]:
+            rows = rows.filter(facilities_in_stock=0)
+        return rows.annotate(polygon=F("district__geojson"), point=AsGeoJSON("district__geom")).values(
+            "drug_id", "drug__label", "drug__atc_code", "district_id", "district__name", "region_id",
+            "region__name", *self.AREA_FIELDS, "polygon", "point",
+        )
+
+    def _facilities(self, p):
+        rows = FacilityDrugStock.objects.all()
+        if p["stockout"]:
+            rows = rows.filter(quantity=0)
+        return rows.annotate(point=AsGeoJSON("facility__location")).values(
+            "drug_id", "drug__label", "drug__atc_code", "facility_id", "facility__name", "district_id",
+            "region_id", "quantity", "lots", "nearest_expiry", "point",
+        )
@@ -0,0 +1,25 @@
+# sigh/celery.py
+"""
+Application Celery du projet (worker : celery -A sigh worker ; planificateur : celery -A sigh beat).
+Configuration lue dans les settings Django (préfixe CELERY_), tâches découvertes dans <app>/tasks.py.
+"""
+import os
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sigh.settings")
+
+app = Celery("sigh")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def _start_metrics_server(**kwargs):
+    """Expose les métriques Prometheus du worker si CELERY_METRICS_PORT est défini (un port par processus)."""
+    port = os.environ.get("CELERY_METRICS_PORT")
+    if port:
+        from prometheus_client import start_http_server
+
+        start_http_server(int(port) + (os.getpid() % 100))
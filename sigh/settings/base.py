@@ -26,8 +26,9 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
 
-    # GeoDjango
+    # GeoDjango / Postgres (pg_trgm, unaccent)
     "django.contrib.gis",
+    "django.contrib.postgres",
     "import_export",
 
     # Tiers
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 # -----------------------
 MIDDLEWARE = [
     "django_prometheus.middleware.PrometheusBeforeMiddleware",
+    # Nombre / durée / répétitions des requêtes SQL par vue (N+1), budget de requêtes
+    "core.middleware.query_metrics.QueryMetricsMiddleware",
 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -59,9 +62,8 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 
-    # Middleware qui positionne les variables de session Postgres pour la RLS
-    # (tu dois créer core/middleware/db_scope.py comme on l’a vu plus haut)
-    "core.middleware.db_scope.PostgresScopeMiddleware",
+    # NB : les variables de session Postgres pour la RLS (app.tenant_key / app.patient_mpi)
+    # sont positionnées après l'authentification DRF par core.db_scope.PostgresScopeMixin.
 
     "django_prometheus.middleware.PrometheusAfterMiddleware",
 ]
@@ -152,9 +154,22 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.EstimatedCountPagination",
     "PAGE_SIZE": int(ENV("DJANGO_PAGE_SIZE", "50")),
 }
+# Au-delà de ce nombre de lignes (estimé par le planificateur), les totaux de pagination
+# (API et changelists admin) sont des estimations ; en dessous, COUNT(*) exact.
+COUNT_ESTIMATE_THRESHOLD = int(ENV("DJANGO_COUNT_ESTIMATE_THRESHOLD", "10000"))
+# Budget de requêtes SQL par requête HTTP : attribut `query_budget` des vues (déclaré).
+# QUERY_BUDGET_DEFAULT (facultatif) s'applique aux autres vues, compté seulement.
+# Dépassement : compteur Prometheus ; en dev/test (QUERY_BUDGET_RAISE) : exception, pour un
+# budget déclaré uniquement.
+QUERY_BUDGET_DEFAULT = int(ENV("DJANGO_QUERY_BUDGET_DEFAULT")) if ENV("DJANGO_QUERY_BUDGET_DEFAULT") else None
+QUERY_BUDGET_RAISE = ENV("DJANGO_QUERY_BUDGET_RAISE", "False").lower() == "true"
+# Recherche patient : seuil de word_similarity (pg_trgm) pour qu'un nom soit retenu
+PATIENT_SEARCH_MIN_SIMILARITY = float(ENV("DJANGO_PATIENT_SEARCH_MIN_SIMILARITY", "0.45"))
+# Doublons MPI : score minimal (somme des poids log2) pour proposer une paire à la revue
+MPI_DUPLICATE_THRESHOLD = float(ENV("DJANGO_MPI_DUPLICATE_THRESHOLD", "8.0"))
 # SIMPLE_JWT = {
 #     "ALGORITHM": "RS256",
 #     # On vérifie via JWKS — ne pas renseigner SIGNING/VERIFYING_KEY
@@ -205,6 +220,102 @@ SESSION_ENGINE = ENV("DJANGO_SESSION_ENGINE", "django.contrib.sessions.backends.
 CELERY_BROKER_URL = ENV("CELERY_BROKER_URL", REDIS_URL)
 CELERY_RESULT_BACKEND = ENV("CELERY_RESULT_BACKEND", REDIS_URL)
 CELERY_TASK_ALWAYS_EAGER = ENV("CELERY_TASK_EAGER", "False").lower() == "true"
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    "appointment-reminders": {
+        "task": "hospital.tasks.enqueue_appointment_reminders",
+        "schedule": float(ENV("NOTIFICATION_ENQUEUE_INTERVAL", "900")),
+    },
+    "dispatch-notifications": {
+        "task": "hospital.tasks.dispatch_notifications",
+        "schedule": float(ENV("NOTIFICATION_DISPATCH_INTERVAL", "30")),
+    },
+    "bed-reservations-expiry": {
+        "task": "hospital.tasks.expire_bed_reservations",
+        "schedule": float(ENV("BED_RESERVATION_EXPIRY_INTERVAL", "60")),
+    },
+    "finance-rollups": {
+        "task": "finances.tasks.refresh_revenue_rollups",
+        "schedule": float(ENV("FINANCE_ROLLUP_INTERVAL", "300")),
+    },
+    "stock-snapshots": {
+        "task": "pharmacy.tasks.refresh_stock_snapshots",
+        "schedule": float(ENV("STOCK_SNAPSHOT_INTERVAL", "3600")),
+    },
+    "stock-forecast": {
+        "task": "pharmacy.tasks.plan_reorder_suggestions",
+        "schedule": float(ENV("STOCK_FORECAST_INTERVAL", "86400")),
+    },
+    "stock-map": {
+        "task": "pharmacy.tasks.refresh_stock_map",
+        "schedule": float(ENV("STOCK_MAP_INTERVAL", "300")),
+    },
+    "lab-worklist-reclaim": {
+        "task": "laboratory.tasks.reclaim_worklist",
+        "schedule": float(ENV("LAB_WORKLIST_RECLAIM_INTERVAL", "600")),
+    },
+}
+
+# -----------------------
+#  Notifications (SMS) — voir hospital/notifications.py
+# -----------------------
+# Passerelle par fournisseur : BACKEND, OPTIONS, RATE (msg/s), BURST, BATCH (lot réclamé)
+NOTIFICATION_GATEWAYS = {
+    "default": {
+        "BACKEND": ENV("NOTIFICATION_BACKEND", "hospital.notifications.FileGateway"),
+        "OPTIONS": {"path": ENV("NOTIFICATION_FILE", str(BASE_DIR / "var" / "sms.ndjson"))},
+        "RATE": float(ENV("NOTIFICATION_RATE", "10")),
+        "BURST": int(ENV("NOTIFICATION_BURST", "20")),
+        "BATCH": int(ENV("NOTIFICATION_BATCH", "100")),
+    },
+}
+# Routage par préfixe E.164 -> fournisseur (ex. {"+22507": "orange", "+22505": "mtn"})
+NOTIFICATION_ROUTES = {}
+NOTIFICATION_DEFAULT_PROVIDER = "default"
+NOTIFICATION_REMINDER_TEMPLATE = ENV(
+    "NOTIFICATION_REMINDER_TEMPLATE", "Rappel : rendez-vous le %s à %s, %s. Merci de prévenir en cas d'empêchement."
+)
+NOTIFICATION_MAX_ATTEMPTS = int(ENV("NOTIFICATION_MAX_ATTEMPTS", "6"))
+NOTIFICATION_RETRY_BASE_SECONDS = 30
+NOTIFICATION_RETRY_MAX_SECONDS = 3600
+NOTIFICATION_LEASE_SECONDS = int(ENV("NOTIFICATION_LEASE_SECONDS", "300"))
+
+# -----------------------
+#  Agrégats finances — voir finances/rollups.py
+# -----------------------
+# Marge relue à chaque rafraîchissement : transactions de facturation plus longues ignorées
+# jusqu'au recalcul complet (refresh_finance_rollups --full).
+FINANCE_ROLLUP_LAG_SECONDS = int(ENV("FINANCE_ROLLUP_LAG_SECONDS", "600"))
+
+# -----------------------
+#  Clôtures de stock — voir pharmacy/snapshots.py
+# -----------------------
+# Clôtures journalières conservées (les mensuelles le sont toujours)
+STOCK_SNAPSHOT_DAILY_RETENTION_DAYS = int(ENV("STOCK_SNAPSHOT_DAILY_RETENTION_DAYS", "92"))
+# Marge relue à chaque rafraîchissement pour repérer les mouvements antidatés
+STOCK_SNAPSHOT_LAG_SECONDS = int(ENV("STOCK_SNAPSHOT_LAG_SECONDS", "600"))
+
+# -----------------------
+#  Prévision de consommation — voir pharmacy/forecast.py
+# -----------------------
+# Délai de livraison et période de revue (jours), z du niveau de service (1.65 ~ 95 %)
+STOCK_FORECAST_LEAD_TIME_DAYS = int(ENV("STOCK_FORECAST_LEAD_TIME_DAYS", "14"))
+STOCK_FORECAST_REVIEW_DAYS = int(ENV("STOCK_FORECAST_REVIEW_DAYS", "30"))
+STOCK_FORECAST_SERVICE_Z = float(ENV("STOCK_FORECAST_SERVICE_Z", "1.65"))
+
+# -----------------------
+#  Carte nationale des stocks — voir pharmacy/stockmap.py
+# -----------------------
+# Marge relue à chaque rafraîchissement (transactions de stock longues)
+STOCK_MAP_LAG_SECONDS = int(ENV("STOCK_MAP_LAG_SECONDS", "600"))
+
+# -----------------------
+#  Liste de travail du laboratoire — voir laboratory/worklist.py
+# -----------------------
+# Réservation d'un échantillon par un automate : remise en file au-delà (poste tombé)
+LAB_WORKLIST_LEASE_SECONDS = int(ENV("LAB_WORKLIST_LEASE_SECONDS", str(4 * 3600)))
 
 # -----------------------
 #  Email
@@ -7,6 +7,9 @@ ALLOWED_HOSTS = ["*"]
 # CORS dev : plus permissif
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Un endpoint qui dépasse son budget de requêtes SQL lève QueryBudgetExceeded
+QUERY_BUDGET_RAISE = True
+
 # Email en console
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
@@ -18,6 +18,7 @@ urlpatterns = [
                   path('home/dash', HomeView.as_view(), name="homeview"),
 
                   path('admin/', admin.site.urls),
+                  path('', include('django_prometheus.urls')),  # /metrics
               ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)